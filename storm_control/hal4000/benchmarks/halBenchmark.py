@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+End to end benchmark of HAL.
+
+This starts HAL with the emulated hardware and uses the TCP interface
+to record a series of films with different ROIs, exposure times and
+numbers of cameras. For each film it measures:
+
+  1. The sustained frame rate.
+  2. The number of dropped frames (frames that were requested but
+     not saved, and frames dropped by the image writers).
+  3. The maximum image writer backlog.
+  4. The latency of HAL's (GUI) event loop.
+  5. The memory high water mark of the HAL process.
+
+The results are saved as a JSON file so that they can be compared
+between versions.
+
+HAL is started in a separate process for each number of cameras.
+
+Example:
+
+  python halBenchmark.py report.json --cameras 1 2 --roi 256 512 --exposure 0.01 0.002
+"""
+
+import glob
+import json
+import numpy
+import os
+import subprocess
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.testing.testActions as testActions
+import storm_control.hal4000.testing.testActionsTCP as testActionsTCP
+import storm_control.hal4000.testing.testing as testing
+
+
+def maxRSS():
+    """
+    Return the memory high water mark of this process in MB.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"):
+        return max_rss/(1024.0 * 1024.0)
+    return max_rss/1024.0
+
+
+class LatencyMonitor(QtCore.QObject):
+    """
+    Measures how late a timer with a short interval fires. This is
+    a measure of how responsive HAL's event loop is.
+    """
+    def __init__(self, interval = 1, **kwds):
+        super().__init__(**kwds)
+        self.elapsed_timer = QtCore.QElapsedTimer()
+        self.interval = interval
+        self.last_time = None
+        self.latencies = []
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.setInterval(self.interval)
+        self.timer.timeout.connect(self.handleTimeout)
+
+    def handleTimeout(self):
+        now = self.elapsed_timer.nsecsElapsed()
+        if self.last_time is not None:
+            self.latencies.append(1.0e-6 * (now - self.last_time) - self.interval)
+        self.last_time = now
+
+    def start(self):
+        self.latencies = []
+        self.last_time = None
+        self.elapsed_timer.start()
+        self.timer.start()
+
+    def stop(self):
+        """
+        Returns the latencies in milliseconds.
+        """
+        self.timer.stop()
+        if (len(self.latencies) == 0):
+            return numpy.zeros(1)
+        return numpy.array(self.latencies)
+
+
+class BenchmarkMovie(testActionsTCP.TakeMovie):
+    """
+    Record a film and analyze the results.
+    """
+    def __init__(self, benchmark = None, case = None, **kwds):
+        super().__init__(**kwds)
+        self.benchmark = benchmark
+        self.case = case
+
+    def checkMessage(self, tcp_message):
+        result = dict(self.case)
+        if tcp_message.hasError():
+            result["error"] = tcp_message.getErrorMessage()
+            self.benchmark.addResult(result)
+            return
+
+        basename = os.path.join(self.directory, self.name)
+        xml = params.parameters(basename + ".xml", recurse = True)
+        result["frames"] = xml.get("acquisition.number_frames")
+        result["writer_dropped"] = xml.get("acquisition.writer_dropped", 0)
+        result["writer_max_behind"] = xml.get("acquisition.writer_max_behind", 0)
+
+        # Check how many frames were actually saved by each camera. Cameras
+        # that are not the time base can record a few more frames.
+        bytes_per_frame = 2 * self.case["roi"] * self.case["roi"]
+        result["dropped"] = 0
+        for i in range(self.case["cameras"]):
+            camera = xml.get("camera" + str(i+1))
+            filename = basename
+            if (len(camera.get("extension")) > 0):
+                filename += "_" + camera.get("extension")
+            frames_saved = 0
+            if os.path.exists(filename + ".dax"):
+                frames_saved = int(os.path.getsize(filename + ".dax")/bytes_per_frame)
+            result["dropped"] += max(0, self.length - frames_saved)
+
+        # Remove the film.
+        for filename in glob.glob(basename + "*"):
+            os.remove(filename)
+
+        self.benchmark.addResult(result)
+
+
+class HalBenchmark(testing.TestingTCP):
+    """
+    The HAL module that runs the benchmark. This is configured with
+    the name of a JSON file containing a list of the films to take,
+    and the name of the JSON file to save the results in.
+    """
+    def __init__(self, module_params = None, **kwds):
+        super().__init__(module_params = module_params, **kwds)
+
+        configuration = module_params.get("configuration")
+        directory = configuration.get("directory")
+        self.film_time = QtCore.QElapsedTimer()
+        self.film_seconds = 0.0
+        self.latency_monitor = LatencyMonitor(parent = self)
+        self.latencies = None
+        self.p_filenames = []
+        self.report_file = configuration.get("report_file")
+        self.results = []
+
+        with open(configuration.get("cases_file")) as fp:
+            cases = json.load(fp)
+
+        for i, case in enumerate(cases):
+
+            # Create a parameters file with the camera settings for this film.
+            p_name = "benchmark_{0:d}".format(i)
+            parameters = params.StormXMLObject()
+            for j in range(case["cameras"]):
+                camera = parameters.addSubSection("camera" + str(j+1))
+                camera.add(params.ParameterInt(name = "x_start", value = 1))
+                camera.add(params.ParameterInt(name = "x_end", value = case["roi"]))
+                camera.add(params.ParameterInt(name = "y_start", value = 1))
+                camera.add(params.ParameterInt(name = "y_end", value = case["roi"]))
+                camera.add(params.ParameterFloat(name = "exposure_time", value = case["exposure_time"]))
+            p_filename = os.path.join(directory, p_name + ".xml")
+            parameters.saveToFile(p_filename)
+            self.p_filenames.append(p_filename)
+
+            self.test_actions.append(testActions.LoadParameters(filename = p_filename))
+            self.test_actions.append(BenchmarkMovie(benchmark = self,
+                                                    case = case,
+                                                    directory = directory,
+                                                    length = case["frames"],
+                                                    name = "benchmark_movie",
+                                                    parameters = p_name))
+
+    def addResult(self, result):
+        if not "error" in result:
+            result["seconds"] = self.film_seconds
+            result["fps"] = result["frames"]/self.film_seconds
+            result["latency_mean_ms"] = float(numpy.mean(self.latencies))
+            result["latency_99_ms"] = float(numpy.percentile(self.latencies, 99))
+            result["latency_max_ms"] = float(numpy.max(self.latencies))
+        result["max_rss_mb"] = maxRSS()
+        self.results.append(result)
+
+    def handleActionDone(self):
+        if (len(self.test_actions) == 0):
+            with open(self.report_file, "w") as fp:
+                json.dump(self.results, fp, indent = 1)
+            for filename in self.p_filenames:
+                os.remove(filename)
+        super().handleActionDone()
+
+    def processMessage(self, message):
+
+        if message.isType("start film"):
+            self.film_time.start()
+            self.latency_monitor.start()
+
+        elif message.isType("stop film"):
+            self.film_seconds = 1.0e-3 * self.film_time.elapsed()
+            self.latencies = self.latency_monitor.stop()
+
+        super().processMessage(message)
+
+
+def halConfig(config_file, cameras, camera_class, directory, cases_file, report_file):
+    """
+    Create the HAL configuration for the benchmark.
+    """
+    config = params.config(config_file)
+    modules = config.get("modules")
+
+    # Configure the camera(s).
+    camera1 = modules.get("camera1")
+    if (camera_class == "synthetic"):
+        camera1.set("camera.module_name", "storm_control.hal4000.camera.syntheticCameraControl")
+        camera1.set("camera.class_name", "SyntheticCameraControl")
+        camera1.get("camera.parameters").add(params.ParameterInt(name = "frame_cache", value = 20))
+
+    for i in range(1, cameras):
+        name = "camera" + str(i+1)
+        camera = camera1.copy()
+        camera.set("camera.parameters.extension", name)
+        modules.addSubSection(name, svalue = camera)
+
+    # Add the benchmark module.
+    c_bench = config.addSubSection("modules.testing")
+    c_bench.add("class_name", "HalBenchmark")
+    c_bench.add("module_name", "storm_control.hal4000.benchmarks.halBenchmark")
+    c_conf = c_bench.addSubSection("configuration")
+    c_conf.add("cases_file", cases_file)
+    c_conf.add("directory", directory)
+    c_conf.add("report_file", report_file)
+
+    return config
+
+
+def runHal(config_file = None, cameras = 1, camera_class = "synthetic", cases = None, directory = None):
+    """
+    Start HAL and record the films in cases, returns a list with
+    the results for each film.
+    """
+    from PyQt5 import QtWidgets
+    import storm_control.hal4000.hal4000 as hal4000
+
+    cases_file = os.path.join(directory, "benchmark_cases.json")
+    report_file = os.path.join(directory, "benchmark_report.json")
+    with open(cases_file, "w") as fp:
+        json.dump(cases, fp)
+
+    config = halConfig(config_file, cameras, camera_class, directory, cases_file, report_file)
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+    hal = hal4000.HalCore(config = config,
+                          testing_mode = True,
+                          show_gui = False)
+    app.exec_()
+
+    with open(report_file) as fp:
+        results = json.load(fp)
+    os.remove(cases_file)
+    os.remove(report_file)
+    return results
+
+
+if (__name__ == "__main__"):
+
+    import argparse
+
+    default_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "test", "hal", "none_tcp_config.xml")
+
+    parser = argparse.ArgumentParser(description = 'HAL throughput benchmark')
+    parser.add_argument('report', type = str, help = "The name of the JSON file to save the results in.")
+    parser.add_argument('--cameras', dest = 'cameras', type = int, nargs = '+', required = False, default = [1, 2],
+                        help = "The number(s) of cameras to test.")
+    parser.add_argument('--camera_class', dest = 'camera_class', type = str, required = False, default = "synthetic",
+                        choices = ["none", "synthetic"],
+                        help = "The emulated camera to use.")
+    parser.add_argument('--config', dest = 'config', type = str, required = False, default = default_config,
+                        help = "The HAL configuration file (with emulated hardware).")
+    parser.add_argument('--directory', dest = 'directory', type = str, required = False, default = None,
+                        help = "The directory to save the test films in.")
+    parser.add_argument('--exposure', dest = 'exposure', type = float, nargs = '+', required = False, default = [0.01, 0.002],
+                        help = "The camera exposure time(s) in seconds.")
+    parser.add_argument('--frames', dest = 'frames', type = int, required = False, default = 500,
+                        help = "The number of frames in each film.")
+    parser.add_argument('--roi', dest = 'roi', type = int, nargs = '+', required = False, default = [256, 512],
+                        help = "The ROI size(s) in pixels (size x size).")
+
+    # This is used internally to run HAL in a sub-process.
+    parser.add_argument('--hal', dest = 'hal', type = str, required = False, default = None,
+                        help = argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.hal is not None:
+        with open(args.hal) as fp:
+            kwds = json.load(fp)
+        results = runHal(**kwds)
+        with open(args.report, "w") as fp:
+            json.dump(results, fp)
+
+    else:
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = args.directory
+            if directory is None:
+                directory = tmp_dir
+
+            for cameras in args.cameras:
+                cases = []
+                for roi in args.roi:
+                    for exposure_time in args.exposure:
+                        cases.append({"cameras" : cameras,
+                                      "exposure_time" : exposure_time,
+                                      "frames" : args.frames,
+                                      "roi" : roi})
+
+                hal_file = os.path.join(tmp_dir, "hal.json")
+                with open(hal_file, "w") as fp:
+                    json.dump({"cameras" : cameras,
+                               "camera_class" : args.camera_class,
+                               "cases" : cases,
+                               "config_file" : os.path.abspath(args.config),
+                               "directory" : os.path.abspath(directory)}, fp)
+                hal_report = os.path.join(tmp_dir, "hal_report.json")
+                subprocess.check_call([sys.executable, os.path.abspath(__file__), hal_report, "--hal", hal_file])
+                with open(hal_report) as fp:
+                    results.extend(json.load(fp))
+
+        with open(args.report, "w") as fp:
+            json.dump(results, fp, indent = 1)
+
+        print()
+        print("{0:>4s} {1:>5s} {2:>8s} {3:>8s} {4:>8s} {5:>7s} {6:>7s} {7:>10s} {8:>11s} {9:>8s}".format("cams", "roi", "exp (s)", "fps", "frames", "dropped", "behind", "lat99 (ms)", "latmax (ms)", "rss (MB)"))
+        for r in results:
+            if "error" in r:
+                print("{0:4d} {1:5d} {2:8.4f} error: {3:s}".format(r["cameras"], r["roi"], r["exposure_time"], r["error"]))
+                continue
+            print("{0:4d} {1:5d} {2:8.4f} {3:8.1f} {4:8d} {5:7d} {6:7d} {7:10.2f} {8:11.2f} {9:8.1f}".format(r["cameras"],
+                                                                                                      r["roi"],
+                                                                                                      r["exposure_time"],
+                                                                                                      r["fps"],
+                                                                                                      r["frames"],
+                                                                                                      r["dropped"] + r["writer_dropped"],
+                                                                                                      r["writer_max_behind"],
+                                                                                                      r["latency_99_ms"],
+                                                                                                      r["latency_max_ms"],
+                                                                                                      r["max_rss_mb"]))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
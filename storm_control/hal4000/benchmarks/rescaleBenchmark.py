@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for converting camera frames to 8 bit images for
+display, see halLib/c_image_manipulation_c.py.
+
+This compares the numpy version, the original C version and the look
+up table version (with different numbers of threads), and reports the
+average time per frame in milliseconds.
+
+Example:
+
+  python rescaleBenchmark.py --size 2048 --repeats 50 --threads 1 4 8
+"""
+
+import numpy
+import time
+
+import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
+
+
+def timeIt(fn, repeats):
+    """
+    Return the average time for fn() in milliseconds.
+    """
+    fn()
+    start_time = time.perf_counter()
+    for i in range(repeats):
+        fn()
+    return 1.0e3 * (time.perf_counter() - start_time)/repeats
+
+
+def runBenchmark(size = 2048, repeats = 20, threads = None, transpose = False):
+    """
+    Return a list of [method name, time per frame (ms)].
+    """
+    if threads is None:
+        threads = [1, c_image.n_threads]
+
+    rng = numpy.random.default_rng(1)
+    image = rng.integers(100, 4000, size = (size, size)).astype(numpy.uint16)
+    colors = numpy.arange(256, dtype = numpy.uint32) * 0x010101 + 0xff000000
+    args = [image, False, False, transpose, [100, 1000], 4000]
+
+    results = [["numpy", timeIt(lambda : c_image.rescaleImage(*args, use_numpy = True), repeats)]]
+    if c_image.image_manip is not None:
+        results.append(["C", timeIt(lambda : c_image.rescaleImage(*args, use_lut = False), repeats)])
+
+    results.append(["LUT (numpy)", timeIt(lambda : c_image.rescaleImageLUT(*args, use_numpy = True), repeats)])
+    if c_image.has_lut:
+        default_threads = c_image.n_threads
+        try:
+            for n in threads:
+                c_image.n_threads = n
+                results.append(["LUT x" + str(n),
+                                timeIt(lambda : c_image.rescaleImageLUT(*args), repeats)])
+                results.append(["LUT x" + str(n) + " + histogram + colors",
+                                timeIt(lambda : c_image.rescaleImageLUT(*args, colors = colors, histogram_bins = 1024), repeats)])
+        finally:
+            c_image.n_threads = default_threads
+
+    return results
+
+
+if (__name__ == "__main__"):
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Image rescaling benchmark')
+    parser.add_argument('--size', dest = 'size', type = int, required = False, default = 2048,
+                        help = "The image size in pixels (size x size).")
+    parser.add_argument('--repeats', dest = 'repeats', type = int, required = False, default = 20,
+                        help = "The number of times to rescale the image.")
+    parser.add_argument('--threads', dest = 'threads', type = int, nargs = '+', required = False, default = None,
+                        help = "The numbers of threads to test.")
+    parser.add_argument('--transpose', dest = 'transpose', action = 'store_true',
+                        help = "Also transpose the image.")
+
+    args = parser.parse_args()
+
+    print("{0:<36s} {1:>10s}".format("method", "time (ms)"))
+    for [name, ms] in runBenchmark(size = args.size,
+                                   repeats = args.repeats,
+                                   threads = args.threads,
+                                   transpose = args.transpose):
+        print("{0:<36s} {1:10.3f}".format(name, ms))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
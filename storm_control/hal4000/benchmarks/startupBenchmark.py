@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Benchmark of HAL's startup time.
+
+This starts HAL with the emulated hardware and measures how long it
+takes to load the modules and how long it takes from sending the
+'configure1' message to processing the 'start' message. This is done
+for different values of HalCore's message time budget. A budget of 0
+sends one message per iteration of Qt's event loop, which is what
+HAL used to do.
+
+HAL is started in a separate process for each measurement. The
+average load times of the modules, broken down into import, construct
+and init, are also printed.
+
+Example:
+
+  python startupBenchmark.py --budget 0 5 --repeats 5
+
+Use --serial_import to compare with importing the modules one at a time.
+"""
+
+import json
+import numpy
+import os
+import subprocess
+import sys
+import tempfile
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.testing.testing as testing
+
+
+class StartupBenchmark(testing.Testing):
+    """
+    The HAL module that records the startup times once HAL has
+    started and then closes HAL.
+    """
+    def __init__(self, module_params = None, **kwds):
+        super().__init__(module_params = module_params, **kwds)
+        self.report_file = module_params.get("configuration").get("report_file")
+
+    def handleStarted(self):
+        with open(self.report_file, "w") as fp:
+            json.dump(self.all_modules["core"].getStartupTimes(), fp)
+        self.handleActionDone()
+
+    def processMessage(self, message):
+
+        if message.isType("configure1"):
+            self.all_modules = message.getData()["all_modules"]
+
+        #
+        # The 'start' message is only finalized after this module has
+        # processed it, so wait for it with a sync message.
+        #
+        elif message.isType("start"):
+            self.sendMessage(halMessage.HalMessage(m_type = "noop",
+                                                   sync = True,
+                                                   finalizer = self.handleStarted))
+
+
+def runHal(config_file = None, message_time_budget = None, parallel_import = True, report_file = None):
+    """
+    Start HAL, returns the startup times.
+    """
+    from PyQt5 import QtWidgets
+    import storm_control.hal4000.hal4000 as hal4000
+
+    config = params.config(config_file)
+    if config.has("message_time_budget"):
+        config.set("message_time_budget", message_time_budget)
+    else:
+        config.add(params.ParameterInt(name = "message_time_budget", value = message_time_budget))
+    if config.has("parallel_import"):
+        config.set("parallel_import", parallel_import)
+    else:
+        config.add(params.ParameterSetBoolean(name = "parallel_import", value = parallel_import))
+
+    c_bench = config.addSubSection("modules.testing")
+    c_bench.add("class_name", "StartupBenchmark")
+    c_bench.add("module_name", "storm_control.hal4000.benchmarks.startupBenchmark")
+    c_conf = c_bench.addSubSection("configuration")
+    c_conf.add("report_file", report_file)
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+    hal = hal4000.HalCore(config = config,
+                          testing_mode = True,
+                          show_gui = False)
+    app.exec_()
+
+    with open(report_file) as fp:
+        times = json.load(fp)
+    os.remove(report_file)
+    return times
+
+
+if (__name__ == "__main__"):
+
+    import argparse
+
+    default_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "test", "hal", "none_tcp_config.xml")
+
+    parser = argparse.ArgumentParser(description = 'HAL startup benchmark')
+    parser.add_argument('--budget', dest = 'budget', type = int, nargs = '+', required = False, default = [0, 5],
+                        help = "The message time budget(s) in milliseconds.")
+    parser.add_argument('--config', dest = 'config', type = str, required = False, default = default_config,
+                        help = "The HAL configuration file (with emulated hardware).")
+    parser.add_argument('--repeats', dest = 'repeats', type = int, required = False, default = 5,
+                        help = "The number of times to start HAL for each budget.")
+    parser.add_argument('--serial_import', dest = 'serial_import', action = 'store_true',
+                        help = "Import the modules one at a time.")
+
+    # This is used internally to run HAL in a sub-process.
+    parser.add_argument('--hal', dest = 'hal', type = str, required = False, default = None,
+                        help = argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.hal is not None:
+        with open(args.hal) as fp:
+            kwds = json.load(fp)
+        times = runHal(**kwds)
+        with open(kwds["report_file"], "w") as fp:
+            json.dump(times, fp)
+
+    else:
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hal_file = os.path.join(tmp_dir, "hal.json")
+            report_file = os.path.join(tmp_dir, "hal_report.json")
+            for budget in args.budget:
+                results[budget] = []
+                for i in range(args.repeats):
+                    with open(hal_file, "w") as fp:
+                        json.dump({"config_file" : os.path.abspath(args.config),
+                                   "message_time_budget" : budget,
+                                   "parallel_import" : not args.serial_import,
+                                   "report_file" : report_file}, fp)
+                    subprocess.check_call([sys.executable, os.path.abspath(__file__), "--hal", hal_file],
+                                          stdout = subprocess.DEVNULL)
+                    with open(report_file) as fp:
+                        results[budget].append(json.load(fp))
+
+        print()
+        print("{0:>11s} {1:>10s} {2:>15s} {3:>15s}".format("budget (ms)", "load (ms)", "configure (ms)", "min conf. (ms)"))
+        for budget in args.budget:
+            load = numpy.array([x["load"] for x in results[budget]])
+            configure = numpy.array([x["configure"] for x in results[budget]])
+            print("{0:11d} {1:10.1f} {2:15.1f} {3:15.1f}".format(budget,
+                                                               numpy.mean(load),
+                                                               numpy.mean(configure),
+                                                               numpy.min(configure)))
+
+        print()
+        print("{0:<24s} {1:>11s} {2:>14s} {3:>9s}".format("module", "import (ms)", "construct (ms)", "init (ms)"))
+        m_results = [x["modules"] for budget in args.budget for x in results[budget]]
+        m_means = {}
+        for module_name in m_results[0]:
+            m_means[module_name] = {}
+            for key in ["import", "construct", "init"]:
+                m_means[module_name][key] = numpy.mean([x[module_name][key] for x in m_results])
+        for module_name in sorted(m_means, key = lambda x : -sum(m_means[x].values())):
+            print("{0:<24s} {1:11.1f} {2:14.1f} {3:9.1f}".format(module_name,
+                                                                 m_means[module_name]["import"],
+                                                                 m_means[module_name]["construct"],
+                                                                 m_means[module_name]["init"]))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
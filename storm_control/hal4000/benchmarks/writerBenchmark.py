@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark for the image writers.
+
+This records a fixed length film from a NoneCameraControl camera and
+reports the write throughput (MB/s) and the per-frame latency, which
+is the time from when the writer gets the frame until it returns from
+writeFrame().
+
+Example:
+
+  python writerBenchmark.py /data/tmp --frames 2000 --batch 1 8 32
+"""
+
+import numpy
+import os
+import time
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+
+class TimedDaxFile(imagewriters.DaxFile):
+    """
+    A DaxFile that records how long it takes to save each frame.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.latencies = []
+        self.t_first = None
+        self.t_saved = {}
+
+    def saveFrame(self, frame):
+        t_now = time.perf_counter()
+        if self.t_first is None:
+            self.t_first = t_now
+        self.t_saved[frame.frame_number] = t_now
+        super().saveFrame(frame)
+
+    def writeFrame(self, frame):
+        super().writeFrame(frame)
+        self.latencies.append(time.perf_counter() - self.t_saved[frame.frame_number])
+
+
+def runBenchmark(directory, frames = 1000, size = 512, exposure_time = 0.01, **kwds):
+    """
+    Record a film and return a dictionary with the results. kwds
+    are passed to the writer, see imagewriters.DaxFile.
+    """
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1",
+                                                 config = config)
+
+    p = camera.getParameters().copy()
+    p.setv("exposure_time", exposure_time)
+    p.setv("x_end", size)
+    p.setv("y_end", size)
+    camera.newParameters(p)
+    cam_fn = camera.getCameraFunctionality()
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(directory, "writer_benchmark"),
+                                              filetype = ".dax",
+                                              film_length = frames)
+    writer = TimedDaxFile(camera_functionality = cam_fn,
+                          film_settings = film_settings,
+                          **kwds)
+
+    camera.startFilm(film_settings, True)
+    camera.startCamera()
+    while not writer.isStopped():
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.001)
+    camera.stopFilm()
+
+    writer.closeWriter()
+    t_done = time.perf_counter()
+
+    n_bytes = os.path.getsize(writer.filename)
+    os.remove(writer.filename)
+    os.remove(writer.basename + ".inf")
+    camera.cleanUp()
+
+    latencies = 1.0e3 * numpy.array(writer.latencies)
+    return {"frames" : writer.number_frames,
+            "max_behind" : writer.getMaxBehind(),
+            "MB" : n_bytes/(1024.0 * 1024.0),
+            "MB/s" : n_bytes/(1024.0 * 1024.0 * (t_done - writer.t_first)),
+            "latency_mean" : numpy.mean(latencies),
+            "latency_99" : numpy.percentile(latencies, 99),
+            "latency_max" : numpy.max(latencies)}
+
+
+if (__name__ == "__main__"):
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description = 'Image writer benchmark')
+    parser.add_argument('directory', type = str, help = "The directory to save the test films in.")
+    parser.add_argument('--frames', dest = 'frames', type = int, required = False, default = 1000,
+                        help = "The number of frames to record.")
+    parser.add_argument('--size', dest = 'size', type = int, required = False, default = 512,
+                        help = "The frame size in pixels (size x size).")
+    parser.add_argument('--exposure', dest = 'exposure_time', type = float, required = False, default = 0.01,
+                        help = "The camera exposure time in seconds.")
+    parser.add_argument('--batch', dest = 'batch', type = int, nargs = '+', required = False, default = [1, 8, 32],
+                        help = "The write batch sizes to test.")
+    parser.add_argument('--queue', dest = 'queue_depth', type = int, required = False, default = 100,
+                        help = "The writer queue depth, 0 to save on the GUI thread.")
+    parser.add_argument('--direct', dest = 'direct_io', action = 'store_true',
+                        help = "Use direct I/O.")
+    parser.add_argument('--no-preallocate', dest = 'preallocate', action = 'store_false',
+                        help = "Don't pre-allocate the film.")
+
+    args = parser.parse_args()
+
+    app = QtCore.QCoreApplication(sys.argv)
+
+    print("{0:>6s} {1:>8s} {2:>8s} {3:>8s} {4:>10s} {5:>10s} {6:>10s} {7:>7s}".format("batch", "frames", "MB", "MB/s", "mean (ms)", "99% (ms)", "max (ms)", "behind"))
+    for batch in args.batch:
+        r = runBenchmark(args.directory,
+                         direct_io = args.direct_io,
+                         exposure_time = args.exposure_time,
+                         frames = args.frames,
+                         preallocate = args.preallocate,
+                         queue_depth = args.queue_depth,
+                         size = args.size,
+                         write_batch = batch)
+        print("{0:6d} {1:8d} {2:8.1f} {3:8.1f} {4:10.3f} {5:10.3f} {6:10.3f} {7:7d}".format(batch,
+                                                                                          r["frames"],
+                                                                                          r["MB"],
+                                                                                          r["MB/s"],
+                                                                                          r["latency_mean"],
+                                                                                          r["latency_99"],
+                                                                                          r["latency_max"],
+                                                                                          r["max_behind"]))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
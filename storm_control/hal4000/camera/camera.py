@@ -38,6 +38,9 @@ class Camera(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configuration", "configure1", "current parameters",
+                        "get functionality", "new parameters", "shutter clicked",
+                        "start camera", "start film", "stop camera", "stop film"])
         self.film_settings = None
 
         camera_params = module_params.get("camera")
@@ -110,8 +113,14 @@ class Camera(halModule.HalModule):
         elif message.isType("stop film"):
             # This message comes from film.film, it goes to all camera at once.
             self.film_length = None
+            data = {"parameters" : self.camera_control.getParameters()}
+
+            # Frame sequence statistics, if the camera has a frame counter.
+            seq_params = self.camera_control.getFrameSequence().getParameters(self.module_name)
+            if (len(seq_params) > 0):
+                data["acquisition"] = seq_params
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
-                                                              data = {"parameters" : self.camera_control.getParameters()}))
+                                                              data = data))
             halModule.runWorkerTask(self, message, self.stopFilm)
 
     def startCamera(self):
@@ -9,6 +9,7 @@ Note that "slave" cameras are assumed to always be hardware timed.
 Hazen 2/17
 """
 
+import numpy
 from PyQt5 import QtCore
 import time
 
@@ -16,6 +17,8 @@ import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
 import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.camera.frameSequence as frameSequence
 
 
 class CameraException(halExceptions.HardwareException):
@@ -24,6 +27,7 @@ class CameraException(halExceptions.HardwareException):
 
 class CameraControl(QtCore.QThread):
     newData = QtCore.pyqtSignal(object)
+    releaseFrames = QtCore.pyqtSignal(object)
 
     def __init__(self, camera_name = None, config = None, **kwds):
         """
@@ -50,6 +54,16 @@ class CameraControl(QtCore.QThread):
         # The current frame number, this gets reset by startCamera().
         self.frame_number = 0
 
+        # For checking that we got all the frames from the camera, this
+        # also gets reset by startCamera().
+        self.frame_sequence = frameSequence.FrameSequence()
+
+        # Pre-allocated memory for the frames from the camera. The size
+        # of the pool can be adjusted in the camera's parameters section
+        # of the config.xml file.
+        self.frame_pool = framePool.FramePool(max_frames = config.get("frame_pool_frames", 200),
+                                              max_memory = config.get("frame_pool_memory", 1024))
+
         # The camera parameters.
         self.parameters = params.StormXMLObject()
 
@@ -206,6 +220,9 @@ class CameraControl(QtCore.QThread):
         self.finished.connect(self.handleFinished)
         self.newData.connect(self.handleNewData)
 
+        # This is always queued, see handleNewData().
+        self.releaseFrames.connect(self.handleReleaseFrames, QtCore.Qt.QueuedConnection)
+
     def cleanUp(self):
         self.running = False
         self.wait()
@@ -223,6 +240,12 @@ class CameraControl(QtCore.QThread):
             raise CameraException(msg)
         return self.camera_functionality
 
+    def getFramePool(self):
+        return self.frame_pool
+
+    def getFrameSequence(self):
+        return self.frame_sequence
+
     def getParameters(self):
         return self.parameters
 
@@ -242,8 +265,16 @@ class CameraControl(QtCore.QThread):
         """
         Data from the camera should go through this method on it's
         way to the camera functionality object.
+
+        Once the frames have been emitted we release our reference to
+        them, anything that wants to keep a frame should have acquired it.
+        This is done in a queued slot in the main thread as consumers with
+        queued connections won't get the frame until later. The release is
+        queued after their newFrame slot calls so they always get the frame
+        with at least one reference, even if this is not the main thread.
         """
-        for frame in frames:
+        emitted = []
+        for i, frame in enumerate(frames):
             if self.film_length is not None:
 
                 # Stop the camera (if it has not already stopped).
@@ -253,9 +284,20 @@ class CameraControl(QtCore.QThread):
                 # This keeps us from emitting more than the expected number
                 # of newFrame signals.
                 if (frame.frame_number >= self.film_length):
+                    for unused in frames[i:]:
+                        unused.release()
                     break
-                
+
+            self.frame_sequence.addFrame(frame.hw_frame_number, frame.timestamp)
             self.camera_functionality.newFrame.emit(frame)
+            emitted.append(frame)
+
+        if (len(emitted) > 0):
+            self.releaseFrames.emit(emitted)
+
+    def handleReleaseFrames(self, frames):
+        for frame in frames:
+            frame.release()
 
     def newParameters(self, parameters):
         """
@@ -321,6 +363,15 @@ class CameraControl(QtCore.QThread):
         
         self.frame_number = 0
 
+        # Size the frame pool for the current ROI / binning. Not all cameras
+        # set x_pixels / y_pixels, in which case the pool will be sized by
+        # the first frame that the camera returns.
+        frame_pixels = self.parameters.get("x_pixels") * self.parameters.get("y_pixels")
+        if (frame_pixels > 0):
+            self.frame_pool.configure(frame_pixels)
+        self.frame_pool.resetStatistics()
+        self.frame_sequence.reset()
+
         # Start the thread to handle data from the camera.
         self.thread_started = False
         self.start(QtCore.QThread.NormalPriority)
@@ -352,6 +403,18 @@ class CameraControl(QtCore.QThread):
             self.running = False
             self.wait()
 
+            # Warn if the camera ran out of frame buffers, this means that
+            # something (probably the display or the spot counter) is
+            # holding on to frames for too long.
+            pool_stats = self.frame_pool.getStatistics()
+            if (pool_stats["exhausted"] > 0):
+                print(">> Warning", self.camera_name, "frame pool was exhausted", pool_stats["exhausted"], "times, size is", pool_stats["size"])
+
+            # Warn if there were gaps in the camera's frame numbers.
+            seq_stats = self.frame_sequence.getStatistics()
+            if (seq_stats["frames_lost"] > 0):
+                print(">> Warning", self.camera_name, "lost", seq_stats["frames_lost"], "frames in", seq_stats["gaps"], "gaps")
+
         self.camera_functionality.stopped.emit()
 
     def stopFilm(self):
@@ -395,14 +458,22 @@ class HWCameraControl(CameraControl):
             # Check if we got new frame data.
             if (len(frames) > 0):
 
-                # Create frame objects.
+                # Create frame objects. The camera data is copied into
+                # memory from the frame pool as the camera SDK may re-use
+                # it's buffers once we call getFrames() again.
+                #
+                # Not all of the camera SDKs provide a frame counter and
+                # a timestamp, these will be None if they do not.
+                #
                 frame_data = []
                 for cam_frame in frames:
-                    aframe = frame.Frame(cam_frame.getData(),
-                                         self.frame_number,
-                                         frame_size[0],
-                                         frame_size[1],
-                                         self.camera_name)
+                    aframe = self.frame_pool.getFrame(self.frame_number,
+                                                      frame_size[0],
+                                                      frame_size[1],
+                                                      self.camera_name)
+                    numpy.copyto(aframe.np_data, cam_frame.getData().reshape(aframe.np_data.shape), casting = "unsafe")
+                    aframe.hw_frame_number = getattr(cam_frame, "hw_frame_number", None)
+                    aframe.timestamp = getattr(cam_frame, "hw_timestamp", None)
                     frame_data.append(aframe)
                     self.frame_number += 1
 
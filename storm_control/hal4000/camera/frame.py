@@ -6,6 +6,17 @@ or the data from a feed and it's meta-information.
 Notes: 
  (1) The numpy data field (np_data) is expected to
      be of type numpy.uint16.
+
+ (2) Frames that come from a framePool.FramePool are reference
+     counted. Anything that keeps a frame after the newFrame signal
+     handler returns needs to call acquire() when it gets the frame
+     and release() when it is done with it. See framePool.py.
+
+ (3) frame_number is HAL's count of the frames from the camera,
+     hw_frame_number is the camera's count (if it has one). Gaps
+     in hw_frame_number mean that frames were lost, see
+     frameSequence.py. timestamp is the time in seconds from the
+     camera's clock (if it has one).
  
 Hazen 3/17
 """
@@ -16,7 +27,7 @@ class Frame(object):
     and it's meta-information.
     """
 
-    def __init__(self, np_data, frame_number, image_x, image_y, which_camera):
+    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, parent = None, pool = None, pool_index = None):
         """
         Create a camera frame object.
         FIXME: Are we consistent in the use of master vs. camera1?
@@ -25,14 +36,36 @@ class Frame(object):
         frame_number - The frame number of this frame.
         image_x - The size of the frame in pixels in x.
         image_y - The size of the frame in pixels in y.
+        parent - (Optional) The frame that np_data belongs to, for example
+                 when a feed re-uses the data of a camera frame.
+        pool - (Optional) The FramePool that np_data belongs to.
+        pool_index - (Optional) The location of np_data in the pool.
         """
 
         self.image_x = image_x
         self.image_y = image_y
         self.np_data = np_data
         self.frame_number = frame_number
+        self.hw_frame_number = None
+        self.parent = parent
+        self.pool = pool
+        self.pool_index = pool_index
+        self.ref_count = 1
+        self.timestamp = None
         self.which_camera = which_camera
 
+        if self.parent is not None:
+            self.parent.acquire()
+
+    def acquire(self):
+        """
+        Increment the reference count of the frame.
+        """
+        if self.pool is not None:
+            self.pool.acquireFrame(self)
+        else:
+            self.ref_count += 1
+
     def getData(self):
         """
         Returns the numpy object that stores the camera frame data.
@@ -46,6 +79,23 @@ class Frame(object):
         """
         return self.np_data.ctypes.data
 
+    def isPooled(self):
+        return self.pool is not None
+
+    def release(self):
+        """
+        Decrement the reference count of the frame. When it reaches
+        zero the memory goes back to the pool (if any) and the parent
+        frame (if any) is released.
+        """
+        if self.pool is not None:
+            self.pool.releaseFrame(self)
+        else:
+            self.ref_count -= 1
+            if (self.ref_count == 0) and (self.parent is not None):
+                self.parent.release()
+                self.parent = None
+
 
 #
 # The MIT License
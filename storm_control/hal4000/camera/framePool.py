@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+A pool of pre-allocated frame buffers.
+
+Rather than allocating a new numpy array for every frame that the
+camera produces, frames are drawn from a single fixed size 'slab'
+of uint16 memory and returned to the pool once everything that
+was using the frame has released it.
+
+The reference counting works like this:
+
+ 1. A frame from the pool starts with a reference count of 1, this
+    is the camera's reference.
+
+ 2. Anything that wants to keep the frame after the newFrame signal
+    handler has returned (the display, the spot counter, the feeds,
+    etc.) must call frame.acquire() and then frame.release() when
+    it is done with the frame.
+
+ 3. Once the camera has emitted the frame it releases it. This is
+    done in a queued slot in HAL's main thread (see CameraControl),
+    so it happens after consumers with queued connections have had a
+    chance to acquire the frame.
+
+Acquiring or releasing a frame whose reference count is already zero
+is an error, the frame's buffer may be in use by another frame.
+
+When the reference count reaches zero the frame's buffer goes back to
+the pool. If the pool is exhausted we fall back to allocating a new
+(un-pooled) buffer and record that this happened.
+"""
+
+from collections import deque
+
+import numpy
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.halExceptions as halExceptions
+
+import storm_control.hal4000.camera.frame as frame
+
+
+class FramePoolException(halExceptions.HalException):
+    pass
+
+
+class FramePool(object):
+    """
+    A ring buffer of frames that are all the same size.
+    """
+    def __init__(self, max_frames = 200, max_memory = 1024, **kwds):
+        """
+        max_frames - The maximum number of frames in the pool.
+        max_memory - The maximum amount of memory to use for the pool in MB.
+        """
+        super().__init__(**kwds)
+
+        self.free = deque()
+        self.frame_pixels = 0
+        self.generation = 0
+        self.max_frames = max_frames
+        self.max_memory = max_memory
+        self.mutex = QtCore.QMutex()
+        self.n_buffers = 0
+        self.ref_counts = []
+        self.slab = None
+
+        # Statistics.
+        self.exhausted = 0
+        self.high_water = 0
+        self.in_use = 0
+        self.total = 0
+
+    def acquireFrame(self, aframe):
+        [generation, index] = aframe.pool_index
+        self.mutex.lock()
+        is_free = False
+        if (generation == self.generation):
+            if (self.ref_counts[index] == 0):
+                is_free = True
+            else:
+                self.ref_counts[index] += 1
+        self.mutex.unlock()
+        if is_free:
+            raise FramePoolException("Frame " + str(aframe.frame_number) + " was acquired after it was released.")
+
+    def configure(self, frame_pixels):
+        """
+        (Re)allocate the pool for frames with frame_pixels pixels. This
+        is a NOP if the pool is already the correct size.
+
+        Frames from a previous configuration that are still in use will
+        keep their (old) memory, they just won't be returned to the pool.
+        """
+        frame_pixels = int(frame_pixels)
+        if (frame_pixels <= 0):
+            raise FramePoolException("Frame size must be greater than zero, got " + str(frame_pixels))
+
+        if (frame_pixels == self.frame_pixels):
+            return
+
+        self.mutex.lock()
+        n_buffers = int((self.max_memory * 1024.0 * 1024.0)/(2 * frame_pixels))
+        self.n_buffers = max(1, min(n_buffers, self.max_frames))
+        self.frame_pixels = frame_pixels
+        self.generation += 1
+        self.slab = numpy.empty((self.n_buffers, self.frame_pixels), dtype = numpy.uint16)
+        self.free = deque(range(self.n_buffers))
+        self.ref_counts = [0] * self.n_buffers
+        self.in_use = 0
+        self.mutex.unlock()
+
+    def getFrame(self, frame_number, image_x, image_y, camera_name):
+        """
+        Return a Frame whose data is from the pool, the contents of the
+        frame data are undefined. If the pool is exhausted this returns
+        a Frame with newly allocated (un-pooled) memory.
+        """
+        frame_pixels = image_x * image_y
+        if (frame_pixels != self.frame_pixels):
+            self.configure(frame_pixels)
+
+        self.mutex.lock()
+        self.total += 1
+        if (len(self.free) > 0):
+            index = self.free.popleft()
+            self.ref_counts[index] = 1
+            self.in_use += 1
+            if (self.in_use > self.high_water):
+                self.high_water = self.in_use
+            aframe = frame.Frame(self.slab[index],
+                                 frame_number,
+                                 image_x,
+                                 image_y,
+                                 camera_name,
+                                 pool = self,
+                                 pool_index = [self.generation, index])
+        else:
+            self.exhausted += 1
+            aframe = frame.Frame(numpy.empty(frame_pixels, dtype = numpy.uint16),
+                                 frame_number,
+                                 image_x,
+                                 image_y,
+                                 camera_name)
+        self.mutex.unlock()
+        return aframe
+
+    def getNumberFree(self):
+        return len(self.free)
+
+    def getSize(self):
+        return self.n_buffers
+
+    def getStatistics(self):
+        """
+        Return a dictionary with the pool statistics.
+        """
+        return {"exhausted" : self.exhausted,
+                "high_water" : self.high_water,
+                "in_use" : self.in_use,
+                "size" : self.n_buffers,
+                "total" : self.total}
+
+    def releaseFrame(self, aframe):
+        [generation, index] = aframe.pool_index
+        self.mutex.lock()
+        is_free = False
+        if (generation == self.generation):
+            if (self.ref_counts[index] == 0):
+                is_free = True
+            else:
+                self.ref_counts[index] -= 1
+                if (self.ref_counts[index] == 0):
+                    self.free.append(index)
+                    self.in_use -= 1
+        self.mutex.unlock()
+        if is_free:
+            raise FramePoolException("Frame " + str(aframe.frame_number) + " was released too many times.")
+
+    def resetStatistics(self):
+        self.exhausted = 0
+        self.high_water = self.in_use
+        self.total = 0
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
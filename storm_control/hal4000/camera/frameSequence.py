@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Checks that the frames from a camera are in sequence.
+
+Cameras that have a hardware frame counter set the hw_frame_number
+attribute of the frames they return. If there are gaps in the
+sequence of these numbers then frames were lost somewhere between
+the camera and HAL (or between HAL and a file writer).
+
+Cameras that have a hardware clock also set the timestamp attribute
+(in seconds, the zero point is camera dependent), which is used to
+measure the actual frame rate.
+"""
+
+import storm_control.sc_library.parameters as params
+
+
+class FrameSequence(object):
+    """
+    Gap detection and statistics for a sequence of frame numbers.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.reset()
+
+    def addFrame(self, frame_number, timestamp = None):
+        """
+        Add the next frame, returns the number of frames that were
+        lost before this frame. frame_number can be None if the camera
+        does not have a frame counter.
+        """
+        self.frames += 1
+
+        lost = 0
+        if frame_number is not None:
+            if self.last_frame_number is not None:
+                lost = frame_number - self.last_frame_number - 1
+
+                # A negative gap means that the counter was reset (or wrapped
+                # around), in which case we just restart the sequence.
+                if (lost > 0):
+                    self.gaps += 1
+                    self.frames_lost += lost
+                    if (lost > self.max_gap):
+                        self.max_gap = lost
+                else:
+                    lost = 0
+            self.checked = True
+            self.last_frame_number = frame_number
+
+        # The lost frames are included so that the frame rate is correct.
+        if timestamp is not None:
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+                self.first_timestamp_frame = self.frames + self.frames_lost
+            self.last_timestamp = timestamp
+            self.last_timestamp_frame = self.frames + self.frames_lost
+
+        return lost
+
+    def getFrameRate(self):
+        """
+        Return the frame rate measured using the (hardware) timestamps,
+        or None if this is not available.
+        """
+        if self.first_timestamp is not None:
+            elapsed = self.last_timestamp - self.first_timestamp
+            if (elapsed > 0.0):
+                return float(self.last_timestamp_frame - self.first_timestamp_frame)/elapsed
+        return None
+
+    def getFramesLost(self):
+        return self.frames_lost
+
+    def getParameters(self, prefix):
+        """
+        Return the statistics as a list of parameters for the
+        acquisition section of the movie XML file. This is empty
+        if the frames did not have frame numbers.
+        """
+        if not self.checked:
+            return []
+        stats = [params.ParameterInt(name = prefix + "_frames_lost",
+                                     value = self.frames_lost),
+                 params.ParameterInt(name = prefix + "_frame_gaps",
+                                     value = self.gaps),
+                 params.ParameterInt(name = prefix + "_max_frame_gap",
+                                     value = self.max_gap)]
+        frame_rate = self.getFrameRate()
+        if frame_rate is not None:
+            stats.append(params.ParameterFloat(name = prefix + "_hw_frame_rate",
+                                               value = frame_rate))
+        return stats
+
+    def getStatistics(self):
+        return {"checked" : self.checked,
+                "frames" : self.frames,
+                "frames_lost" : self.frames_lost,
+                "gaps" : self.gaps,
+                "max_gap" : self.max_gap}
+
+    def reset(self):
+        self.checked = False
+        self.first_timestamp = None
+        self.first_timestamp_frame = 0
+        self.frames = 0
+        self.frames_lost = 0
+        self.gaps = 0
+        self.last_frame_number = None
+        self.last_timestamp = None
+        self.last_timestamp_frame = 0
+        self.max_gap = 0
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
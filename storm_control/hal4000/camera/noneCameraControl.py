@@ -16,6 +16,11 @@ import storm_control.hal4000.camera.frame as frame
 
 
 class NoneCameraControl(cameraControl.CameraControl):
+    """
+    Sub-classes can change min_exposure_time and override makeFakeFrame()
+    and run() to provide other kinds of test data.
+    """
+    min_exposure_time = 0.01
 
     def __init__(self, config = None, is_master = False, **kwds):
         kwds["config"] = config
@@ -50,7 +55,7 @@ class NoneCameraControl(cameraControl.CameraControl):
         self.parameters.set("exposure_time", params.ParameterRangeFloat(description = "Exposure time (seconds)", 
                                                                         name = "exposure_time", 
                                                                         value = 0.02,
-                                                                        min_value = 0.01,
+                                                                        min_value = self.min_exposure_time,
                                                                         max_value = 10.0))
         self.parameters.setv("max_intensity", 512)
         
@@ -71,7 +76,7 @@ class NoneCameraControl(cameraControl.CameraControl):
                                                        value = 0.1,
                                                        min_value = 0.0,
                                                        max_value = 1.0))
-        self.parameters.setv("roll", config.get("roll"))
+        self.parameters.setv("roll", config.get("roll", 0.1))
 
         self.parameters.add(params.ParameterRangeInt(description = "EMCCD gain",
                                                      name = "emccd_gain",
@@ -121,32 +126,40 @@ class NoneCameraControl(cameraControl.CameraControl):
 
             # Configure camera.
             p = self.parameters
-            if (p.get("exposure_time") < 0.010):
-                p.set("exposure_time", 0.010)
+            if (p.get("exposure_time") < self.min_exposure_time):
+                p.set("exposure_time", self.min_exposure_time)
 
             p.set("fps", 1.0/p.get("exposure_time"))
 
             self.fake_frame_size = [size_x, size_y]
-            self.fake_frame = numpy.zeros(size_x * size_y, dtype = numpy.uint16)
-            for i in range(size_x):
-                for j in range(size_y):
-                    self.fake_frame[j*size_x+i] = i % 128 + j % 128
+            self.makeFakeFrame(size_x, size_y)
 
             if running:
                 self.startCamera()
 
             self.camera_functionality.parametersChanged.emit()
         
+    def makeFakeFrame(self, size_x, size_y):
+        """
+        The test pattern, this is i % 128 + j % 128 at pixel (i, j).
+        """
+        fake_frame = (numpy.arange(size_x) % 128)[None,:] + (numpy.arange(size_y) % 128)[:,None]
+        self.fake_frame = fake_frame.astype(numpy.uint16).reshape(-1)
+
     def run(self):
         self.running = True
         self.thread_started = True
         while(self.running):
-            aframe = frame.Frame(numpy.roll(self.fake_frame,
-                                            int(self.frame_number * self.parameters.get("roll"))),
-                                 self.frame_number,
-                                 self.fake_frame_size[0],
-                                 self.fake_frame_size[1],
-                                 self.camera_name)
+            aframe = self.frame_pool.getFrame(self.frame_number,
+                                              self.fake_frame_size[0],
+                                              self.fake_frame_size[1],
+                                              self.camera_name)
+
+            # This is numpy.roll() but without allocating a new array.
+            n_pixels = self.fake_frame.size
+            shift = int(self.frame_number * self.parameters.get("roll")) % n_pixels
+            aframe.np_data[:shift] = self.fake_frame[n_pixels-shift:]
+            aframe.np_data[shift:] = self.fake_frame[:n_pixels-shift]
             self.frame_number += 1
 
             if self.film_length is not None:
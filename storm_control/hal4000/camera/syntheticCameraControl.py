@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+Software emulation of a fast camera looking at a sample of blinking
+fluorophores. This is for testing (spot counter, etc.) and for measuring
+the throughput of HAL without any hardware.
+
+Frames are emitted in batches of 'frames_per_batch' frames, and the
+exposure time can be as short as 0.1ms, so this camera can run at
+kHz frame rates. If 'frame_cache' is greater than zero then this
+many frames are created in advance and then played back in a loop,
+this is useful for benchmarking as the cost of creating the frames
+is then (nearly) zero.
+
+The frames have a (simulated) hardware frame number and timestamp,
+and frames can be randomly lost with probability 'frame_loss' for
+testing frame drop detection.
+"""
+
+import numpy
+from PyQt5 import QtCore
+
+import storm_control.sc_library.parameters as params
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+
+
+class SyntheticCameraControl(noneCameraControl.NoneCameraControl):
+    min_exposure_time = 0.0001
+
+    def __init__(self, config = None, **kwds):
+        super().__init__(config = config, **kwds)
+
+        self.emitters = None
+        self.frame_cache = []
+        if config.has("seed"):
+            self.rng = numpy.random.default_rng(config.get("seed"))
+        else:
+            self.rng = numpy.random.default_rng()
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Background (photons per pixel)",
+                                                       name = "background",
+                                                       value = config.get("background", 20.0),
+                                                       min_value = 0.0,
+                                                       max_value = 10000.0))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Probability an off fluorophore turns on",
+                                                       name = "blink_on",
+                                                       value = config.get("blink_on", 0.05),
+                                                       min_value = 0.0,
+                                                       max_value = 1.0))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Probability an on fluorophore turns off",
+                                                       name = "blink_off",
+                                                       value = config.get("blink_off", 0.5),
+                                                       min_value = 0.0,
+                                                       max_value = 1.0))
+
+        self.parameters.add(params.ParameterRangeInt(description = "Number of pre-calculated frames (0 = none)",
+                                                     name = "frame_cache",
+                                                     value = config.get("frame_cache", 0),
+                                                     min_value = 0,
+                                                     max_value = 10000))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Probability that a frame is lost",
+                                                       name = "frame_loss",
+                                                       value = config.get("frame_loss", 0.0),
+                                                       min_value = 0.0,
+                                                       max_value = 0.99))
+
+        self.parameters.add(params.ParameterRangeInt(description = "Frames per batch",
+                                                     name = "frames_per_batch",
+                                                     value = config.get("frames_per_batch", 1),
+                                                     min_value = 1,
+                                                     max_value = 1000))
+
+        self.parameters.add(params.ParameterSetBoolean(description = "Add shot noise",
+                                                       name = "noise",
+                                                       value = config.get("noise", True)))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Fluorophore brightness (photons)",
+                                                       name = "photons",
+                                                       value = config.get("photons", 2000.0),
+                                                       min_value = 0.0,
+                                                       max_value = 1.0e6))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Fluorophore density (per 100x100 pixels)",
+                                                       name = "spot_density",
+                                                       value = config.get("spot_density", 50.0),
+                                                       min_value = 0.0,
+                                                       max_value = 10000.0))
+
+        self.parameters.add(params.ParameterRangeFloat(description = "Fluorophore sigma (pixels)",
+                                                       name = "spot_sigma",
+                                                       value = config.get("spot_sigma", 1.5),
+                                                       min_value = 0.5,
+                                                       max_value = 10.0))
+
+        self.newParameters(self.parameters, initialization = True)
+
+    def makeFakeFrame(self, size_x, size_y):
+        """
+        Scatter the fluorophores (uniformly) across the camera. The
+        initial on / off state is the steady state of the blinking.
+
+        This is called by NoneCameraControl.newParameters() when the
+        camera is stopped.
+        """
+        p = self.parameters
+
+        # This is also called by NoneCameraControl.__init__().
+        if not p.has("spot_density"):
+            return
+
+        n_emitters = int(round(p.get("spot_density") * size_x * size_y * 1.0e-4))
+
+        p_on = p.get("blink_on")
+        p_off = p.get("blink_off")
+        if ((p_on + p_off) > 0.0):
+            on_fraction = p_on/(p_on + p_off)
+        else:
+            on_fraction = 0.0
+
+        #
+        # This is replaced rather than changed so that the camera thread
+        # always sees a consistent set of fluorophores.
+        #
+        self.emitters = {"x" : self.rng.uniform(0.0, size_x, n_emitters),
+                         "y" : self.rng.uniform(0.0, size_y, n_emitters),
+                         "on" : (self.rng.random(n_emitters) < on_fraction)}
+
+        self.frame_cache = []
+        for i in range(p.get("frame_cache")):
+            self.frame_cache.append(self.renderFrame())
+
+    def renderFrame(self, np_data = None):
+        """
+        Update the state of the fluorophores and draw them. np_data is
+        a (flat) uint16 array of the correct size, or None in which case
+        a new array is returned.
+        """
+        p = self.parameters
+        [size_x, size_y] = self.fake_frame_size
+        emitters = self.emitters
+
+        # Blink.
+        switch = self.rng.random(emitters["on"].size)
+        emitters["on"] = numpy.where(emitters["on"], (switch >= p.get("blink_off")), (switch < p.get("blink_on")))
+
+        image = numpy.full((size_y, size_x), p.get("background"), dtype = numpy.float32)
+
+        # Draw the fluorophores that are on as (pixel sampled) gaussians.
+        on = numpy.nonzero(emitters["on"])[0]
+        if (on.size > 0):
+            sigma = p.get("spot_sigma")
+            k = numpy.arange(-int(3.0 * sigma) - 1, int(3.0 * sigma) + 2)
+            cx = emitters["x"][on]
+            cy = emitters["y"][on]
+            ix = numpy.floor(cx).astype(numpy.int64)
+            iy = numpy.floor(cy).astype(numpy.int64)
+
+            # Pixel centers are at 0.5, 1.5, etc.
+            gx = numpy.exp(-(k[None,:] + ix[:,None] + 0.5 - cx[:,None])**2/(2.0 * sigma * sigma))
+            gy = numpy.exp(-(k[None,:] + iy[:,None] + 0.5 - cy[:,None])**2/(2.0 * sigma * sigma))
+            spots = (p.get("photons")/(2.0 * numpy.pi * sigma * sigma)) * gy[:,:,None] * gx[:,None,:]
+
+            px = numpy.broadcast_to(ix[:,None,None] + k[None,None,:], spots.shape)
+            py = numpy.broadcast_to(iy[:,None,None] + k[None,:,None], spots.shape)
+            mask = (px >= 0) & (px < size_x) & (py >= 0) & (py < size_y)
+            image += numpy.bincount((py[mask] * size_x + px[mask]),
+                                    weights = spots[mask],
+                                    minlength = size_x * size_y).reshape(size_y, size_x)
+
+        # Shot noise, this uses the normal approximation to the Poisson
+        # distribution as numpy's Poisson random numbers are very slow.
+        if p.get("noise"):
+            image += numpy.sqrt(image) * self.rng.standard_normal(image.shape, dtype = numpy.float32)
+
+        if np_data is None:
+            np_data = numpy.empty(size_x * size_y, dtype = numpy.uint16)
+        numpy.copyto(np_data, numpy.clip(image, 0, 65535).reshape(-1), casting = "unsafe")
+        return np_data
+
+    def run(self):
+        self.running = True
+        self.thread_started = True
+
+        hw_frame_number = 0
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        while(self.running):
+            exposure_time = self.parameters.get("exposure_time")
+            frame_cache = self.frame_cache
+            frame_loss = self.parameters.get("frame_loss")
+
+            frames = []
+            for i in range(self.parameters.get("frames_per_batch")):
+                aframe = self.frame_pool.getFrame(self.frame_number,
+                                                  self.fake_frame_size[0],
+                                                  self.fake_frame_size[1],
+                                                  self.camera_name)
+                if (len(frame_cache) > 0):
+                    aframe.np_data[:] = frame_cache[self.frame_number % len(frame_cache)]
+                else:
+                    self.renderFrame(aframe.np_data)
+
+                # Simulate the camera losing frames.
+                if (frame_loss > 0.0):
+                    while (self.rng.random() < frame_loss):
+                        hw_frame_number += 1
+                aframe.hw_frame_number = hw_frame_number
+                aframe.timestamp = hw_frame_number * exposure_time
+                hw_frame_number += 1
+
+                frames.append(aframe)
+                self.frame_number += 1
+
+                if self.film_length is not None:
+                    if (self.frame_number == self.film_length):
+                        self.running = False
+                        break
+
+            # Emit new data signal.
+            self.newData.emit(frames)
+
+            # Wait until these frames (and any lost frames) 'should' have been acquired.
+            wait_time = int(1000.0 * hw_frame_number * exposure_time) - timer.elapsed()
+            if (wait_time > 0):
+                self.msleep(wait_time)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
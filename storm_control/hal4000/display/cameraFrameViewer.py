@@ -11,6 +11,17 @@ frame display. This includes:
 6. Handling the changing the feed.
 7. Handling information, target, and grid.
 
+The frames are converted to QImages in a worker thread by a
+frameRenderer.FrameRenderer, at no more than 'max_fps' frames
+per second. When the view is zoomed out the frames are binned
+down to the screen resolution first, using 'downsample_mode'.
+
+The renderer also keeps a running intensity histogram for each
+feed. This is shown next to the display range slider, and the
+autoscale button uses it to set the display range so that
+'autoscale_percentile' percent of the pixels are below / above
+the display range.
+
 Hazen 2/17
 """
 import os
@@ -21,10 +32,13 @@ import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
 import storm_control.hal4000.colorTables.colorTables as colorTables
+import storm_control.hal4000.display.frameRenderer as frameRenderer
+import storm_control.hal4000.display.intensityHistogram as intensityHistogram
 import storm_control.hal4000.halLib.halMessage as halMessage
 
 import storm_control.hal4000.qtWidgets.qtCameraGraphicsScene as qtCameraGraphicsScene
 import storm_control.hal4000.qtWidgets.qtColorGradient as qtColorGradient
+import storm_control.hal4000.qtWidgets.qtHistogram as qtHistogram
 import storm_control.hal4000.qtWidgets.qtRangeSlider as qtRangeSlider
 
 import storm_control.hal4000.qtdesigner.camera_display_ui as cameraDisplayUi
@@ -42,6 +56,10 @@ class CameraFrameViewer(QtWidgets.QFrame):
     parameters file.
 
     <displayn>
+      <autoscale_percentile></autoscale_percentile>
+      <downsample_mode></downsample_mode>
+      <feed_name></feed_name>
+      <max_fps></max_fps>
       <cameran>
         <colortable></colortable>
         <display_max></display_max>
@@ -79,7 +97,10 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.display_timer = QtCore.QTimer(self)
         self.filming = False
         self.frame = False
+        self.frame_renderer = frameRenderer.FrameRenderer(parent = self)
+        self.histograms = {}
         self.parameters = False
+        self.render_needed = False
         self.rubber_band_rect = None
         self.show_grid = False
         self.show_info = True
@@ -95,6 +116,24 @@ class CameraFrameViewer(QtWidgets.QFrame):
                                                            value = feed_name,
                                                            is_mutable = False))
 
+        self.default_parameters.add(params.ParameterRangeFloat(description = "Percentage of pixels below / above the display range after autoscale",
+                                                               name = "autoscale_percentile",
+                                                               value = 0.01,
+                                                               min_value = 0.0,
+                                                               max_value = 10.0,
+                                                               decimals = 3))
+
+        self.default_parameters.add(params.ParameterSetString(description = "How to bin the image when zoomed out",
+                                                              name = "downsample_mode",
+                                                              value = "max",
+                                                              allowed = ["max", "mean", "none"]))
+
+        self.default_parameters.add(params.ParameterRangeInt(description = "Maximum display update rate (frames per second)",
+                                                             name = "max_fps",
+                                                             value = 10,
+                                                             min_value = 1,
+                                                             max_value = 100))
+
         # Set current parameters to default parameters.
         self.parameters = self.default_parameters.copy()
         
@@ -106,6 +145,7 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.camera_view = self.ui.cameraGraphicsView
         self.camera_scene = qtCameraGraphicsScene.QtCameraGraphicsScene(parent = self)
         self.camera_widget = qtCameraGraphicsScene.QtCameraGraphicsItem()
+        self.camera_widget.setDownsampleMode(self.parameters.get("downsample_mode"))
         
         self.camera_scene.addItem(self.camera_widget)
         self.camera_view.setScene(self.camera_scene)
@@ -119,6 +159,14 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.ui.rangeSliderWidget.setLayout(layout)
         self.ui.rangeSlider.setEmitWhileMoving(True)
 
+        # Intensity histogram, this goes to the left of the display range slider.
+        self.ui.histogram = qtHistogram.QHistogram(parent = self.ui.slideWidget)
+        self.ui.histogram.setMinimumWidth(24)
+        self.ui.histogram.setMaximumWidth(24)
+        self.ui.slideWidget.layout().insertWidget(0, self.ui.histogram)
+        self.ui.scaleWidget.setMinimumWidth(100)
+        self.ui.scaleWidget.setMaximumWidth(100)
+
         # Color tables combo box.
         for color_name in sorted(self.color_tables.getColorTableNames()):
             self.ui.colorComboBox.addItem(color_name[:-5])
@@ -158,11 +206,17 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.ui.syncSpinBox.valueChanged.connect(self.handleSync)
         self.ui.targetAct.triggered.connect(self.handleTarget)
 
-        # Display timer, the display updates at approximately 10Hz.
-        self.display_timer.setInterval(100)
+        self.frame_renderer.imageReady.connect(self.handleImageReady)
+
+        # Display timer, this sets the maximum display update rate.
+        self.setDisplayTimerInterval()
         self.display_timer.timeout.connect(self.handleDisplayTimer)
         self.display_timer.start()
 
+    def cleanUp(self):
+        self.display_timer.stop()
+        self.frame_renderer.cleanUp()
+
     def contextMenuEvent(self, event):
         menu = QtWidgets.QMenu(self)
         menu.addAction(self.ui.infoAct)
@@ -263,8 +317,20 @@ class CameraFrameViewer(QtWidgets.QFrame):
         """
         return self.parameters
 
+    def getHistogram(self):
+        """
+        Return the running intensity histogram for the current feed.
+        """
+        if not self.getFeedName() in self.histograms:
+            self.histograms[self.getFeedName()] = intensityHistogram.IntensityHistogram()
+        return self.histograms[self.getFeedName()]
+
     def handleAutoScale(self, bool):
-        [scalemin, scalemax] = self.camera_widget.getAutoScale()
+        percentile = self.parameters.get("autoscale_percentile")
+        scale_range = self.getHistogram().getPercentiles(percentile, 100.0 - percentile)
+        if scale_range is None:
+            scale_range = self.camera_widget.getAutoScale()
+        [scalemin, scalemax] = scale_range
         if scalemin < 0:
             scalemin = 0
         if scalemax > self.getParameter("max_intensity"):
@@ -277,15 +343,19 @@ class CameraFrameViewer(QtWidgets.QFrame):
         color_table = self.color_tables.getTableByName(self.getParameter("colortable"))
         self.camera_widget.newColorTable(color_table)
         self.color_gradient.newColorTable(color_table)
+        self.render_needed = True
 
     def handleDisplayTimer(self):
-        if self.frame:
-            self.camera_widget.updateImageWithFrame(self.frame)
-            if self.show_info:
-                self.handleIntensityInfo(*self.camera_widget.getIntensityInfo())
-            # This is a stub. Fill it out when we get Bluetooth up and running again.
-            if self.broadcast_q_image:
-                pass
+        """
+        Send the current frame to the renderer if it (or how it should be
+        displayed) has changed. The renderer will drop this frame if it
+        gets a newer one before it can start on this one.
+        """
+        if self.frame and self.render_needed:
+            self.render_needed = False
+            settings = self.camera_widget.getRenderSettings()
+            settings["histogram"] = self.getHistogram()
+            self.frame_renderer.render(self.frame, settings)
 
     def handleDragMove(self, dx, dy):
         self.stage_functionality.dragMove(dx, dy)
@@ -321,6 +391,16 @@ class CameraFrameViewer(QtWidgets.QFrame):
             self.ui.gridAct.setText("Hide Grid")
         self.camera_widget.setShowGrid(self.show_grid)
 
+    def handleImageReady(self, rendered):
+        self.camera_widget.setRenderedImage(rendered)
+        if rendered.binned_histogram is not None:
+            self.ui.histogram.setHistogram(rendered.binned_histogram)
+        if self.show_info:
+            self.handleIntensityInfo(*rendered.click_pos, rendered.intensity_info)
+        # This is a stub. Fill it out when we get Bluetooth up and running again.
+        if self.broadcast_q_image:
+            pass
+
     def handleInfo(self, boolean):
         if self.show_info:
             self.show_info = False
@@ -341,16 +421,19 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.setParameter("center_x", cx)
         self.setParameter("center_y", cy)
         self.camera_widget.setClickPos(*self.cam_fn.transformChipToFrame(cx, cy))
+        self.render_needed = True
 
     def handleNewFrame(self, frame):
         if self.filming and (self.getParameter("sync") != 0):
             if((frame.frame_number % self.cycle_length) == (self.getParameter("sync") - 1)):
-                self.frame = frame
+                self.setFrame(frame)
         else:
-            self.frame = frame
+            self.setFrame(frame)
 
     def handleNewScale(self, scale):
         self.setParameter("scale", scale)
+        self.camera_widget.setZoom(self.camera_view.getZoom())
+        self.render_needed = True
 
     def handleRangeChange(self, scale_min, scale_max):
         if (scale_max == scale_min):
@@ -410,6 +493,9 @@ class CameraFrameViewer(QtWidgets.QFrame):
             if not self.parameters.has(attr):
                 self.parameters.add(attr, self.default_parameters.getp(attr).copy())
 
+        self.camera_widget.setDownsampleMode(self.parameters.get("downsample_mode"))
+        self.setDisplayTimerInterval()
+
     def setCameraFunctionality(self, camera_functionality):
         """
         This method gets called when the view changes it's current feed. The
@@ -484,6 +570,10 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.camera_widget.newConfiguration(self.cam_fn)
         self.updateRange()
 
+        # Start a new histogram as the camera settings may have changed.
+        self.getHistogram().reset()
+        self.ui.histogram.setHistogram(None)
+
         # Configure the QtCameraGraphicsView.
         self.camera_view.newConfiguration(self.cam_fn, self.parameters.get(self.getFeedName()))
 
@@ -506,6 +596,9 @@ class CameraFrameViewer(QtWidgets.QFrame):
 
         self.ui.syncSpinBox.setValue(self.getParameter("sync"))
 
+    def setDisplayTimerInterval(self):
+        self.display_timer.setInterval(int(round(1000.0/self.parameters.get("max_fps"))))
+
     def setFeedNames(self, feed_names):
         """
         This updates feed selector combo box with a list of 
@@ -530,6 +623,17 @@ class CameraFrameViewer(QtWidgets.QFrame):
         # Switch to the correct feed.
         self.handleFeedChange(self.getFeedName())
 
+    def setFrame(self, frame):
+        """
+        Keep a reference to the frame that we will display, and let
+        go of the frame we were previously going to display.
+        """
+        frame.acquire()
+        if self.frame:
+            self.frame.release()
+        self.frame = frame
+        self.render_needed = True
+
     def setParameter(self, pname, pvalue):
         """
         Wrapper to make it easier to set the appropriate parameter value.
@@ -580,6 +684,10 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.ui.scaleMax.setText(str(self.getParameter("display_max")))
         self.ui.scaleMin.setText(str(self.getParameter("display_min")))
         self.camera_widget.newRange(self.getParameter("display_min"), self.getParameter("display_max"))
+        max_intensity = float(max(self.getParameter("max_intensity"), 1))
+        self.ui.histogram.setDisplayRange(self.getParameter("display_min")/max_intensity,
+                                          self.getParameter("display_max")/max_intensity)
+        self.render_needed = True
 
 
 #
@@ -24,6 +24,8 @@ class Display(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configuration", "configure1", "current parameters",
+                        "new parameters", "show", "start", "start film", "stop film"])
 
         self.have_stage = False
         self.is_classic = (module_params.get("ui_type") == "classic")
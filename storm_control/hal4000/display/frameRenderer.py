@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Renders camera frames for display using QRunnables and QThreadPool,
+so that the (expensive) conversion of the frame to a QImage does not
+happen in the GUI thread.
+
+There is at most one frame being rendered per viewer. If a new frame
+arrives while the renderer is busy it waits, replacing any frame that
+was already waiting, so the viewer always shows the most recent frame
+and stale frames are dropped.
+
+Each renderer has its own single thread pool so that rendering does not
+compete with other users of HAL's thread pool (such as the spot counter).
+"""
+import traceback
+
+from PyQt5 import QtCore
+
+import storm_control.hal4000.qtWidgets.qtCameraGraphicsScene as qtCameraGraphicsScene
+
+
+class RenderWorker(QtCore.QRunnable):
+    """
+    Runnable for converting a frame to a QImage.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.busy = False
+        self.frame = None
+        self.mutex = QtCore.QMutex()
+        self.rw_signaler = RenderWorkerSignaler()
+        self.settings = None
+        self.wait_condition = QtCore.QWaitCondition()
+
+    def isBusy(self):
+        self.mutex.lock()
+        busy = self.busy
+        self.mutex.unlock()
+        return busy
+
+    def run(self):
+        rendered = None
+        try:
+            rendered = qtCameraGraphicsScene.renderFrame(self.frame, self.settings)
+        except Exception:
+            traceback.print_exc()
+        self.frame.release()
+        self.frame = None
+
+        # This is not busy once the frame is released, the result
+        # is just a local variable. The mutex makes sure that this
+        # result is queued before the worker can be started again,
+        # otherwise the next result could arrive before this one.
+        self.mutex.lock()
+        self.busy = False
+        self.rw_signaler.renderDone.emit(rendered)
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    def setFrame(self, frame, settings):
+        self.mutex.lock()
+        self.busy = True
+        self.frame = frame
+        self.settings = settings
+        self.mutex.unlock()
+
+    def waitUntilDone(self):
+        self.mutex.lock()
+        while self.busy:
+            self.wait_condition.wait(self.mutex)
+        self.mutex.unlock()
+
+
+class RenderWorkerSignaler(QtCore.QObject):
+    """
+    Signal class used by the RenderWorker to indicate that
+    the frame has been rendered.
+    """
+    renderDone = QtCore.pyqtSignal(object)
+
+
+class FrameRenderer(QtCore.QObject):
+    """
+    Renders frames for a single viewer.
+    """
+    imageReady = QtCore.pyqtSignal(object)
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.dropped = 0
+        self.pending = None
+        self.rendered = 0
+        self.threadpool = QtCore.QThreadPool()
+        self.threadpool.setMaxThreadCount(1)
+
+        self.worker = RenderWorker()
+        self.worker.setAutoDelete(False)
+        self.worker.rw_signaler.renderDone.connect(self.handleRenderDone)
+
+    def cleanUp(self):
+        """
+        Wait for the worker to finish and let go of the waiting frame (if any).
+        """
+        self.worker.waitUntilDone()
+        if self.pending is not None:
+            self.pending[0].release()
+            self.pending = None
+
+    def getStatistics(self):
+        return {"dropped" : self.dropped,
+                "rendered" : self.rendered}
+
+    def handleRenderDone(self, rendered):
+        self.rendered += 1
+
+        # The worker could have already started on a new frame.
+        if (self.pending is not None) and not self.worker.isBusy():
+            self.startWorker(*self.pending)
+            self.pending = None
+        if rendered is not None:
+            self.imageReady.emit(rendered)
+
+    def isBusy(self):
+        return self.worker.isBusy() or (self.pending is not None)
+
+    def render(self, frame, settings):
+        """
+        Render frame using settings, which is a dictionary from
+        QtCameraGraphicsItem.getRenderSettings(). The result
+        is emitted by the imageReady signal.
+        """
+        frame.acquire()
+
+        # Replace the frame that is waiting for the worker.
+        if self.worker.isBusy():
+            if self.pending is not None:
+                self.pending[0].release()
+                self.dropped += 1
+            self.pending = [frame, settings]
+
+        else:
+            self.startWorker(frame, settings)
+
+    def startWorker(self, frame, settings):
+        self.worker.setFrame(frame, settings)
+        self.threadpool.start(self.worker)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+A running histogram of the pixel intensities of a camera / feed.
+
+The histogram of each frame is calculated by the render worker in
+the same pass as the conversion to 8 bits, see renderFrame() in
+qtWidgets/qtCameraGraphicsScene.py, and is then added to the running
+histogram (also in the worker thread). The counts decay by 'decay'
+with every frame that is added, so the histogram follows changes in
+the sample without being as noisy as the histogram of a single frame.
+
+Auto-contrast uses percentiles of the running histogram, so a few
+hot pixels don't determine the display range.
+"""
+
+import numpy
+
+from PyQt5 import QtCore
+
+
+class IntensityHistogram(object):
+    """
+    65536 bin (one per uint16 value) running histogram.
+    """
+    def __init__(self, decay = 0.5, **kwds):
+        """
+        decay - How much of the previous histogram to keep when a new
+                frame is added, 0.0 is only the most recent frame.
+        """
+        super().__init__(**kwds)
+        self.counts = numpy.zeros(65536, dtype = numpy.float64)
+        self.decay = decay
+        self.mutex = QtCore.QMutex()
+        self.n_frames = 0
+
+    def addHistogram(self, histogram):
+        """
+        Add the histogram of a single frame, this is a 65536 element array.
+        """
+        self.mutex.lock()
+        self.counts *= self.decay
+        self.counts += histogram
+        self.n_frames += 1
+        self.mutex.unlock()
+
+    def getBinned(self, max_intensity, n_bins = 128):
+        """
+        Return the log10 of the counts in n_bins bins covering 0 - max_intensity,
+        normalized so that the largest bin is 1.0. This is for display.
+        """
+        n_values = min(max_intensity + 1, 65536)
+        edges = numpy.linspace(0, n_values, n_bins + 1).astype(numpy.int64)
+        self.mutex.lock()
+        binned = numpy.add.reduceat(self.counts[:n_values], edges[:-1])
+        self.mutex.unlock()
+
+        # reduceat() gives the value at the edge for empty bins.
+        binned[edges[:-1] == edges[1:]] = 0.0
+
+        binned = numpy.log10(binned + 1.0)
+        if (numpy.max(binned) > 0.0):
+            binned = binned/numpy.max(binned)
+        return binned
+
+    def getNFrames(self):
+        return self.n_frames
+
+    def getPercentiles(self, low, high):
+        """
+        Return the intensities at the low and high percentiles (0.0 - 100.0),
+        or None if there is nothing in the histogram.
+        """
+        self.mutex.lock()
+        cumulative = numpy.cumsum(self.counts)
+        self.mutex.unlock()
+
+        total = cumulative[-1]
+        if (total <= 0.0):
+            return None
+        v_min = int(numpy.searchsorted(cumulative, total * 0.01 * low, side = "right"))
+        v_max = int(numpy.searchsorted(cumulative, total * 0.01 * high, side = "left"))
+        return [min(v_min, 65535), min(v_max, 65535)]
+
+    def reset(self):
+        self.mutex.lock()
+        self.counts[:] = 0.0
+        self.n_frames = 0
+        self.mutex.unlock()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -123,13 +123,32 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         """
         return self.feed_name
 
+    def emitFrame(self, np_data, frame_number, source_frame):
+        """
+        Create and emit a new frame. If the data is shared with the camera
+        frame (i.e. it was not sliced) then the new frame keeps a reference
+        to the camera frame so that the memory is not re-used by the camera
+        while the feed frame is still in use.
+        """
+        parent = None
+        if source_frame is not None and (np_data is source_frame.np_data):
+            parent = source_frame
+        feed_frame = frame.Frame(np_data,
+                                 frame_number,
+                                 self.x_pixels,
+                                 self.y_pixels,
+                                 self.camera_name,
+                                 parent = parent)
+
+        # Feeds number their own frames so only the timestamp is kept.
+        if source_frame is not None:
+            feed_frame.timestamp = source_frame.timestamp
+        self.newFrame.emit(feed_frame)
+        feed_frame.release()
+
     def handleNewFrame(self, new_frame):
         sliced_data = self.sliceFrame(new_frame)
-        self.newFrame.emit(frame.Frame(sliced_data,
-                                       new_frame.frame_number,
-                                       self.x_pixels,
-                                       self.y_pixels,
-                                       self.camera_name))
+        self.emitFrame(sliced_data, new_frame.frame_number, new_frame)
 
     def handleStarted(self):
         self.started.emit()
@@ -256,11 +275,7 @@ class FeedFunctionalityAverage(FeedFunctionality):
 
         if (self.counts == self.frames_to_average):
             average_frame = self.average_frame/self.frames_to_average
-            self.newFrame.emit(frame.Frame(average_frame.astype(numpy.uint16),
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
+            self.emitFrame(average_frame.astype(numpy.uint16), self.frame_number, None)
             self.average_frame = None
             self.counts = 0
             self.frame_number += 1
@@ -286,11 +301,7 @@ class FeedFunctionalityInterval(FeedFunctionality):
         sliced_data = self.sliceFrame(new_frame)
         
         if (new_frame.frame_number % self.cycle_length) in self.capture_frames:
-            self.newFrame.emit(frame.Frame(sliced_data,
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
+            self.emitFrame(sliced_data, self.frame_number, new_frame)
             self.frame_number += 1
 
 
@@ -439,6 +450,9 @@ class Feeds(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configure1", "get feed names", "get functionality",
+                        "new parameters", "start film", "stop film",
+                        "updated parameters"])
         self.camera_names = []
         self.feed_controller = None
         self.feed_names = []
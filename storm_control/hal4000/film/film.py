@@ -269,14 +269,28 @@ class FilmBox(QtWidgets.QGroupBox):
             self.will_overwrite = False
             self.ui.filenameLabel.setStyleSheet("QLabel { color: black}")
         
-    def updateFrames(self, new_number):
-        self.ui.framesText.setText(str(new_number))
+    def updateFrames(self, new_number, frames_behind = 0):
+        """
+        frames_behind is the number of frames that the image
+        writers still have to save.
+        """
+        if (frames_behind > 0):
+            self.ui.framesText.setText("{0:d} ({1:d} behind)".format(new_number, frames_behind))
+        else:
+            self.ui.framesText.setText(str(new_number))
 
-    def updateSize(self, new_size):
+    def updateSize(self, new_size, compression = None):
+        """
+        compression is either None or [compression ratio, compression pool
+        utilization].
+        """
         if (new_size < 1000.0):
-            self.ui.sizeText.setText("{0:.1f} MB".format(new_size))
+            text = "{0:.1f} MB".format(new_size)
         else:
-            self.ui.sizeText.setText("{0:.1f} GB".format(new_size * 0.00097656))
+            text = "{0:.1f} GB".format(new_size * 0.00097656)
+        if compression is not None:
+            text += " ({0:.1f}x, {1:d}%)".format(compression[0], int(100.0 * compression[1]))
+        self.ui.sizeText.setText(text)
 
 
 class Film(halModule.HalModule):
@@ -315,12 +329,37 @@ class Film(halModule.HalModule):
         self.number_fn_requested = 0
         self.parameter_change = False
         self.pixel_size = 1.0
+        self.stage_functionality = None
         self.timing_functionality = None
         self.wait_for = []
         self.waiting_on = []
+        self.writer_stats = None
         self.writers = None
         self.writers_stopped_timer = QtCore.QTimer(self)
 
+        #
+        # Image writer configuration. With a queue_depth of 0 frames are
+        # saved on the GUI thread, otherwise they are saved by a separate
+        # writer thread. direct_io, preallocate and write_batch are only
+        # used for .dax files, chunk_frames is only used for .h5 files.
+        # If compressed is True the frames are compressed (in parallel)
+        # before they are saved, .h5 files are always compressed if the
+        # compression_level is greater than 0. See halLib/imagewriters.py.
+        #
+        self.writer_config = {"chunk_frames" : 16,
+                              "compressed" : False,
+                              "compression_level" : 1,
+                              "compression_threads" : 2,
+                              "direct_io" : False,
+                              "preallocate" : True,
+                              "queue_depth" : 100,
+                              "queue_policy" : "block",
+                              "write_batch" : 8}
+        if module_params.has("configuration"):
+            configuration = module_params.get("configuration")
+            for pname in self.writer_config:
+                self.writer_config[pname] = configuration.get(pname, self.writer_config[pname])
+
         try:
             self.logfile_fp = open(module_params.get("directory") + "image_log.txt", "a")
         except FileNotFoundError:
@@ -414,18 +453,37 @@ class Film(halModule.HalModule):
     def handleNewFrame(self, frame_number):
         self.number_frames = frame_number + 1
 
-        # Update display of the number of frames.
-        self.view.updateFrames(self.number_frames)
-
-        # Update display of the (total) storage used.
+        # Update display of the (total) storage used and the
+        # number of frames that have not been saved yet.
+        compression = None
+        frames_behind = 0
         total_size = 0.0
         for writer in self.writers:
+            frames_behind += writer.getFramesBehind()
             total_size += writer.getSize()
-        self.view.updateSize(total_size)
+
+            # For multiple cameras we show the lowest compression
+            # ratio and the highest compression pool utilization.
+            writer_compression = writer.getCompression()
+            if writer_compression is not None:
+                if compression is None:
+                    compression = writer_compression
+                else:
+                    compression = [min(compression[0], writer_compression[0]),
+                                   max(compression[1], writer_compression[1])]
+        self.view.updateSize(total_size, compression)
+
+        # Update display of the number of frames.
+        self.view.updateFrames(self.number_frames, frames_behind)
         
     def handleResponses(self, message):
 
-        if message.isType("get functionality"):
+        if message.isType("get functionality") and (message.getData().get("extra data") == "stage_fn"):
+            # This is used to record the stage position in .h5 files.
+            for response in message.getResponses():
+                self.stage_functionality = response.getData()["functionality"]
+
+        elif message.isType("get functionality"):
             assert (len(message.getResponses()) == 1)
             for response in message.getResponses():
                 self.camera_functionalities.append(response.getData()["functionality"])
@@ -517,6 +575,12 @@ class Film(halModule.HalModule):
                 # we can save this in the tif images / stacks.
                 self.pixel_size = message.getData()["properties"]["pixel_size"]
                     
+            elif message.sourceIs("stage"):
+                stage_fn_name = message.getData()["properties"]["stage functionality name"]
+                self.sendMessage(halMessage.HalMessage(m_type = "get functionality",
+                                                       data = {"name" : stage_fn_name,
+                                                               "extra data" : "stage_fn"}))
+
             elif message.sourceIs("timing"):
                 # We'll get this message from timing.timing, the part we are interested in is
                 # the timing functionality which we will use both to update the frame counter
@@ -586,8 +650,16 @@ class Film(halModule.HalModule):
                 raise halException.HalException("'stop camera' received while locked out.")
 
         elif message.isType("stop film"):
+            data = {"parameters" : self.view.getParameters()}
+            if self.writer_stats is not None:
+                data["acquisition"] = [params.ParameterInt(name = "writer_dropped",
+                                                           value = self.writer_stats[0]),
+                                       params.ParameterInt(name = "writer_max_behind",
+                                                           value = self.writer_stats[1]),
+                                       params.ParameterInt(name = "writer_frames_lost",
+                                                           value = self.writer_stats[2])]
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
-                                                              data = {"parameters" : self.view.getParameters()}))
+                                                              data = data))
 
         elif message.isType("stop film request"):
             if (self.film_state != "run"):
@@ -666,7 +738,10 @@ class Film(halModule.HalModule):
         if self.film_settings.isSaved():
             for camera in self.camera_functionalities:
                 if camera.getParameter("saved"):
-                    self.writers.append(imagewriters.createFileWriter(camera, self.film_settings))
+                    self.writers.append(imagewriters.createFileWriter(camera,
+                                                                      self.film_settings,
+                                                                      stage_functionality = self.stage_functionality,
+                                                                      **self.writer_config))
         if (len(self.writers) == 0):
             self.view.updateSize(0.0)
         
@@ -728,9 +803,20 @@ class Film(halModule.HalModule):
                 self.writers_stopped_timer.start()
                 return
 
-        # Close writers.
+        # Close writers. An error in one writer should not stop us from
+        # closing the others, or from finishing the stop.
+        self.writer_stats = None
+        writer_errors = []
         for writer in self.writers:
-            writer.closeWriter()
+            try:
+                writer.closeWriter()
+            except imagewriters.ImageWriterException as exception:
+                writer_errors.append(str(exception))
+            if self.writer_stats is None:
+                self.writer_stats = [0, 0, 0]
+            self.writer_stats[0] += writer.getDropped()
+            self.writer_stats[1] = max(self.writer_stats[1], writer.getMaxBehind())
+            self.writer_stats[2] += writer.getFramesLost()
 
         # Enable the UI.
         self.view.enableUI(True)
@@ -754,6 +840,13 @@ class Film(halModule.HalModule):
             if self.view.soundBell():
                 print("\7\7")
 
+        # Report any writer errors.
+        if (len(writer_errors) > 0):
+            msg = "\n".join(writer_errors)
+            print(">> Warning", msg)
+            if not self.film_settings.isTCPRequest():
+                halMessageBox.halMessageBoxInfo(msg, is_error = True)
+
         #raise halExceptions.HalException("done now!")
 
 #
@@ -208,9 +208,11 @@ class FocusLock(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configuration", "configure1", "configure2", "new parameters",
+                        "show", "start", "start film", "stop film", "tcp message"])
         self.configuration = module_params.get("configuration")
 
-        self.control = lockControl.LockControl()
+        self.control = lockControl.LockControl(configuration = self.configuration)
         self.view = FocusLockView(module_name = self.module_name,
                                   configuration = module_params.get("configuration"))
         self.view.halDialogInit(qt_settings,
@@ -224,6 +226,7 @@ class FocusLock(halModule.HalModule):
         self.view.modeChanged.connect(self.control.handleModeChanged)
 
     def cleanUp(self, qt_settings):
+        self.control.cleanUp()
         self.view.cleanUp(qt_settings)
 
     def handleControlMessage(self, message):
@@ -266,6 +269,12 @@ class FocusLock(halModule.HalModule):
             self.sendMessage(halMessage.HalMessage(m_type = "get functionality",
                                                    data = {"name" : self.configuration.get("z_stage"),
                                                            "extra data" : "z_stage"}))
+
+            # This is optional, it is only used for feed-forward focus correction.
+            if self.configuration.has("xy_stage"):
+                self.sendMessage(halMessage.HalMessage(m_type = "get functionality",
+                                                       data = {"name" : self.configuration.get("xy_stage"),
+                                                               "extra data" : "xy_stage"}))
             
         elif message.isType("new parameters"):
             p = message.getData()["parameters"]
@@ -300,11 +309,19 @@ class FocusLock(halModule.HalModule):
                                                 value = self.control.getQPDSumSignal())
             lock_target = params.ParameterFloat(name = "lock_target",
                                                 value = self.control.getLockTarget())
+            acquisition = [lock_good, lock_mode, lock_sum, lock_target]
+
+            # Control loop timing, if the lock engine is being used.
+            stats = self.control.getEngineStatistics()
+            if stats is not None:
+                acquisition.append(params.ParameterFloat(name = "lock_loop_jitter",
+                                                         value = stats["period_jitter"]))
+                acquisition.append(params.ParameterFloat(name = "lock_loop_latency",
+                                                         value = stats["latency_mean"]))
+                acquisition.append(params.ParameterFloat(name = "lock_loop_period",
+                                                         value = stats["period_mean"]))
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
-                                                              data = {"acquisition" : [lock_good,
-                                                                                       lock_mode,
-                                                                                       lock_sum,
-                                                                                       lock_target]}))
+                                                              data = {"acquisition" : acquisition}))
 
         elif message.isType("tcp message"):
 
@@ -3,6 +3,12 @@
 This class handles focus lock control, i.e. updating the
 position if the focus lock is locked, etc.
 
+If the 'lock_engine' configuration option is True (and the
+QPD and the z stage support it) the control loop is run by a
+lockEngine.LockEngine thread instead of in response to the QPD's
+qpdUpdate signal. If the engine fails we go back to using the
+qpdUpdate signal.
+
 Hazen 04/17
 """
 
@@ -10,24 +16,44 @@ from PyQt5 import QtCore
 
 import storm_control.hal4000.halLib.halMessage as halMessage
 
+import storm_control.hal4000.focusLock.lockEngine as lockEngine
+import storm_control.hal4000.focusLock.lockTelemetry as lockTelemetry
+
 
 class LockControl(QtCore.QObject):
     controlMessage = QtCore.pyqtSignal(object)
 
-    def __init__(self, **kwds):
+    def __init__(self, configuration = None, **kwds):
         super().__init__(**kwds)
+        self.configuration = configuration
         self.current_state = None
+        self.engine = None
         self.lock_mode = None
         self.offset_fp = None
         self.qpd_functionality = None
+        self.telemetry = lockTelemetry.LockTelemetry()
         self.timing_functionality = None
         self.working = False
+        self.xy_stage_functionality = None
         self.z_stage_functionality = None
 
         # Qt timer for checking focus lock
         self.check_focus_timer = QtCore.QTimer()
         self.check_focus_timer.setSingleShot(True)
         self.check_focus_timer.timeout.connect(self.handleCheckFocusLock)
+
+    def cleanUp(self):
+        if self.engine is not None:
+            self.engine.stopEngine()
+            self.engine = None
+
+    def getEngineStatistics(self):
+        """
+        Returns the control loop timing statistics, or None if the
+        lock engine is not being used.
+        """
+        if self.engine is not None:
+            return self.engine.getStatistics()
         
     def getLockModeName(self):
         return self.lock_mode.getName()
@@ -105,8 +131,25 @@ class LockControl(QtCore.QObject):
 
             self.current_state = None
 
+    def handleEngineError(self, exception, traceback_string):
+        """
+        The lock engine thread failed, report the error and go back
+        to handling the QPD updates ourselves.
+        """
+        print(">> Warning, focus lock engine failed, switching to signal driven updates.")
+        print(traceback_string)
+        if self.engine is not None:
+            self.engine.stopEngine()
+            self.engine = None
+            self.qpd_functionality.qpdUpdate.connect(self.handleQPDUpdate)
+            self.qpd_functionality.getOffset()
+
     def handleJump(self, delta_z):
-        self.lock_mode.handleJump(delta_z)
+        self.lock_mode.mutex.lock()
+        try:
+            self.lock_mode.handleJump(delta_z)
+        finally:
+            self.lock_mode.mutex.unlock()
 
     def handleLockStarted(self, on):
         """
@@ -118,7 +161,11 @@ class LockControl(QtCore.QObject):
             self.stopLock()
         
     def handleLockTarget(self, new_target):
-        self.lock_mode.setLockTarget(new_target)
+        self.lock_mode.mutex.lock()
+        try:
+            self.lock_mode.setLockTarget(new_target)
+        finally:
+            self.lock_mode.mutex.unlock()
 
     def handleModeChanged(self, new_mode):
         """
@@ -134,9 +181,12 @@ class LockControl(QtCore.QObject):
         self.lock_mode = new_mode
 
         # FIXME: We only need to do this once, maybe not that big a deal.
+        self.lock_mode.setTelemetry(self.telemetry)
         self.lock_mode.setZStageFunctionality(self.z_stage_functionality)
         
         self.lock_mode.done.connect(self.handleDone)
+        if self.engine is not None:
+            self.engine.setLockMode(self.lock_mode)
         self.z_stage_functionality.recenter()
 
     def handleNewFrame(self, frame):
@@ -150,7 +200,11 @@ class LockControl(QtCore.QObject):
                                                                           offset,
                                                                           power,
                                                                           stage_z))
-        self.lock_mode.handleNewFrame(frame)
+        self.lock_mode.mutex.lock()
+        try:
+            self.lock_mode.handleNewFrame(frame)
+        finally:
+            self.lock_mode.mutex.unlock()
                 
     def handleQPDUpdate(self, qpd_dict):
         """
@@ -162,6 +216,22 @@ class LockControl(QtCore.QObject):
             self.lock_mode.handleQPDUpdate(qpd_dict)
         self.qpd_functionality.getOffset()
 
+    def handleStageMove(self, x, y):
+        """
+        Tell the lock mode how far the xy stage is about to move, 
+        x and y are the new stage position in microns.
+        """
+        if self.xy_stage_functionality is None:
+            return
+        
+        pos_dict = self.xy_stage_functionality.getCurrentPosition()
+        if pos_dict is not None:
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.handleStageMove(x - pos_dict["x"], y - pos_dict["y"])
+            finally:
+                self.lock_mode.mutex.unlock()
+
     def handleTCPMessage(self, message):
         """
         Handles TCP messages from tcpControl.TCPControl.
@@ -169,10 +239,19 @@ class LockControl(QtCore.QObject):
         if not self.working:
             return False
 
+        tcp_message = message.getData()["tcp message"]
+
+        # The stage module handles stage moves, but we use them
+        # for feed-forward focus correction.
+        if tcp_message.isType("Move Stage"):
+            if not tcp_message.isTest():
+                self.handleStageMove(tcp_message.getData("stage_x"),
+                                     tcp_message.getData("stage_y"))
+            return False
+
         if not self.lock_mode.canHandleTCPMessages():
             return False
         
-        tcp_message = message.getData()["tcp message"]
         if tcp_message.isType("Check Focus Lock"):
             if tcp_message.isTest():
                 tcp_message.addResponse("duration", 2)
@@ -228,7 +307,7 @@ class LockControl(QtCore.QObject):
 
         elif tcp_message.isType("Set Lock Target"):
             if not tcp_message.isTest():
-                self.lock_mode.setLockTarget(tcp_message.getData("lock_target"))
+                self.handleLockTarget(tcp_message.getData("lock_target"))
             return True
         
         return False
@@ -244,6 +323,8 @@ class LockControl(QtCore.QObject):
         if (name == "qpd"):
             self.qpd_functionality = functionality
             self.qpd_functionality.qpdUpdate.connect(self.handleQPDUpdate)
+        elif (name == "xy_stage"):
+            self.xy_stage_functionality = functionality
         elif (name == "z_stage"):
             self.z_stage_functionality = functionality
 
@@ -255,8 +336,26 @@ class LockControl(QtCore.QObject):
     def start(self):
         if (self.qpd_functionality is not None) and (self.z_stage_functionality is not None):
             self.working = True
+
+            # Use the lock engine thread. The z stage is also moved from HAL's
+            # main thread (jumps, recentering, etc.) so it must be thread safe.
+            use_engine = self.configuration.get("lock_engine", False) and self.qpd_functionality.haveSynchronousRead()
+            if use_engine and not self.z_stage_functionality.isThreadSafe():
+                print(">> Warning, not using the focus lock engine as the z stage is not thread safe.")
+                use_engine = False
+
+            if use_engine:
+                self.qpd_functionality.qpdUpdate.disconnect(self.handleQPDUpdate)
+                self.engine = lockEngine.LockEngine(display_decimation = self.configuration.get("display_decimation", 1),
+                                                    loop_rate = self.configuration.get("loop_rate", 10.0),
+                                                    qpd_functionality = self.qpd_functionality)
+                self.engine.engineError.connect(self.handleEngineError)
+                self.engine.setLockMode(self.lock_mode)
+                self.engine.startEngine()
+
             # Start polling the QPD.
-            self.qpd_functionality.getOffset()
+            else:
+                self.qpd_functionality.getOffset()
         
     def startFilm(self, film_settings):
         # Open file to save the lock status at each frame.
@@ -265,17 +364,35 @@ class LockControl(QtCore.QObject):
                 self.offset_fp = open(film_settings.getBasename() + ".off", "w")
                 self.offset_fp.write(" ".join(["frame", "offset", "power", "stage-z"]) + "\n")
 
+                # Save the lock performance, see lockTelemetry.py.
+                self.lock_mode.mutex.lock()
+                try:
+                    self.telemetry.startRecording(film_settings.getBasename() + ".lck")
+                finally:
+                    self.lock_mode.mutex.unlock()
+
             # Check for a waveform from a hardware timed lock mode that uses the DAQ.
             waveform = self.lock_mode.getWaveform()
             if waveform is not None:
                 self.controlMessage.emit(halMessage.HalMessage(m_type = "daq waveforms",
                                                                data = {"waveforms" : [waveform]}))
-                
-            self.lock_mode.startFilm()
+
+            if self.engine is not None:
+                self.engine.resetStatistics()
+
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.startFilm()
+            finally:
+                self.lock_mode.mutex.unlock()
         
     def startLock(self, lock_target = None):
         if self.working:
-            self.lock_mode.startLock(lock_target)
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.startLock(lock_target)
+            finally:
+                self.lock_mode.mutex.unlock()
 
     def startLockBehavior(self, sub_mode_name, sub_mode_params):
         """
@@ -285,18 +402,31 @@ class LockControl(QtCore.QObject):
         calling this function.
         """
         if self.working:
-            self.lock_mode.startLockBehavior(sub_mode_name, sub_mode_params)
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.startLockBehavior(sub_mode_name, sub_mode_params)
+            finally:
+                self.lock_mode.mutex.unlock()
 
     def stopFilm(self):
         if self.working:
             if self.offset_fp is not None:
                 self.offset_fp.close()
                 self.offset_fp = None
-            self.lock_mode.stopFilm()
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.stopFilm()
+                self.telemetry.stopRecording()
+            finally:
+                self.lock_mode.mutex.unlock()
 
         self.timing_functionality.newFrame.disconnect(self.handleNewFrame)
         self.timing_functionality = None
 
     def stopLock(self):
         if self.working:
-            self.lock_mode.stopLock()
+            self.lock_mode.mutex.lock()
+            try:
+                self.lock_mode.stopLock()
+            finally:
+                self.lock_mode.mutex.unlock()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+The control laws for the 'locked' behavior of the lock modes
+(lockModes.LockedMixin). These take the difference between the
+QPD offset and the lock target (the error, in microns) and return
+how much to move the z stage (the correction, in microns).
+
+The sign convention is that a positive error is corrected by
+moving the stage down, so with only proportional control the
+correction is -kp * error.
+"""
+
+import storm_control.sc_library.halExceptions as halExceptions
+
+
+class LockControllerException(halExceptions.HalException):
+    pass
+
+
+class LockController(object):
+    """
+    Base class for the controllers.
+    """
+    def __init__(self, max_correction = None, **kwds):
+        """
+        max_correction - The largest allowed correction (in microns) in
+                         a single update, None is no limit.
+        """
+        super().__init__(**kwds)
+        self.max_correction = max_correction
+        self.reset()
+
+    def clamp(self, dz):
+        if self.max_correction is not None:
+            return max(-self.max_correction, min(self.max_correction, dz))
+        return dz
+
+    def feedForward(self, dz):
+        """
+        Called when the lock mode moved the stage by dz (microns) to
+        compensate for a (planned) disturbance, such as a stage move,
+        that the controller has not yet seen in the error.
+        """
+        pass
+
+    def isSaturated(self, dz):
+        return (self.max_correction is not None) and (abs(dz) >= self.max_correction)
+
+    def reset(self):
+        """
+        Called when the lock starts.
+        """
+        self.last_error = None
+        self.last_time = None
+
+    def update(self, error, time):
+        """
+        error - The offset minus the lock target in microns.
+        time - When the offset was measured in seconds (time.perf_counter()).
+
+        Returns the correction in microns.
+        """
+        raise LockControllerException("update() is not implemented.")
+
+
+class ProportionalController(LockController):
+    """
+    Simple proportional control, this is what the focus lock has
+    always done.
+    """
+    def __init__(self, kp = 0.9, **kwds):
+        super().__init__(**kwds)
+        self.kp = kp
+
+    def update(self, error, time):
+        self.last_error = error
+        self.last_time = time
+        return self.clamp(-self.kp * error)
+
+
+class PIDController(LockController):
+    """
+    PID control. The integral and derivative terms use the time
+    between updates, so the gains don't depend on the loop rate.
+
+    Anti-windup:
+    (1) The integral is not increased while the correction is
+        saturated (at max_correction) in the same direction.
+    (2) The integral term alone cannot exceed max_correction.
+
+    The derivative is of the measured error. It is skipped for the
+    first update after a reset or a feed-forward move so that these
+    don't cause a 'kick'.
+    """
+    def __init__(self, kd = 0.0, ki = 0.0, kp = 0.9, **kwds):
+        """
+        kp - Proportional gain.
+        ki - Integral gain (1/seconds).
+        kd - Derivative gain (seconds).
+        """
+        self.kd = kd
+        self.ki = ki
+        self.kp = kp
+        super().__init__(**kwds)
+
+    def feedForward(self, dz):
+        self.last_error = None
+
+    def reset(self):
+        super().reset()
+        self.integral = 0.0
+
+    def update(self, error, time):
+        p_term = self.kp * error
+
+        d_term = 0.0
+        dt = 0.0
+        if self.last_time is not None:
+            dt = max(0.0, time - self.last_time)
+        if (self.last_error is not None) and (dt > 0.0):
+            d_term = self.kd * (error - self.last_error)/dt
+
+        # Only integrate if this doesn't make the saturation worse.
+        if (dt > 0.0) and (self.ki != 0.0):
+            integral = self.integral + error * dt
+            dz = -(p_term + self.ki * integral + d_term)
+            if not self.isSaturated(dz) or ((dz * error) > 0.0):
+                self.integral = integral
+                if self.max_correction is not None:
+                    i_max = self.max_correction/abs(self.ki)
+                    self.integral = max(-i_max, min(i_max, self.integral))
+
+        self.last_error = error
+        self.last_time = time
+        return self.clamp(-(p_term + self.ki * self.integral + d_term))
+
+
+controllers = {"pid" : PIDController,
+               "proportional" : ProportionalController}
+
+
+def createController(parameters):
+    """
+    Create a controller from the 'locked' parameters of the lock modes.
+    """
+    name = parameters.get("controller")
+    if not name in controllers:
+        raise LockControllerException("Unknown lock controller '" + name + "'.")
+
+    max_correction = parameters.get("max_correction")
+    if (max_correction <= 0.0):
+        max_correction = None
+
+    if (name == "pid"):
+        return PIDController(kd = parameters.get("kd"),
+                             ki = parameters.get("ki"),
+                             kp = parameters.get("kp"),
+                             max_correction = max_correction)
+    else:
+        return ProportionalController(kp = parameters.get("kp"),
+                                      max_correction = max_correction)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+The focus lock engine. This runs the focus lock control loop,
+i.e. reading the QPD, calling the current lock mode and moving
+the z stage, in a single high priority thread at a fixed rate.
+
+Without the engine the loop goes through the Qt event loop (the
+QPD's qpdUpdate signal is handled by lockControl.LockControl in
+the GUI thread), so anything that stalls the GUI also delays the
+focus correction. With the engine the GUI only gets every Nth QPD
+reading (via the same qpdUpdate signal) for display.
+
+The engine can only be used with QPDs that support synchronous
+reads, see lockModule.QPDFunctionalityMixin.readOffset(), and with
+z stages that are thread safe, see lockModule.ZStageFunctionalityMixin.
+
+If anything in the loop fails the engine stops and emits engineError,
+lockControl.LockControl then goes back to the qpdUpdate signal driven
+loop.
+"""
+import math
+import time
+import traceback
+
+from PyQt5 import QtCore
+
+
+class LoopStatistics(object):
+    """
+    Running statistics of the control loop timing.
+
+    The period is the time between the start of consecutive loops,
+    the latency is the time from the start of the QPD reading to
+    when the lock mode has finished (and issued any stage move).
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.mutex = QtCore.QMutex()
+        self.reset()
+
+    def addLoop(self, period, latency):
+        """
+        period - The loop period in seconds, None for the first loop.
+        latency - The loop latency in seconds.
+        """
+        self.mutex.lock()
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_sum += latency
+        self.loops += 1
+        if period is not None:
+            self.n_periods += 1
+            self.period_max = max(self.period_max, period)
+            self.period_sum += period
+            self.period_sum_sqr += period * period
+        self.mutex.unlock()
+
+    def addOverrun(self):
+        self.mutex.lock()
+        self.overruns += 1
+        self.mutex.unlock()
+
+    def getStatistics(self):
+        """
+        Returns a dictionary of the statistics, all the times are in milliseconds.
+        """
+        self.mutex.lock()
+        stats = {"latency_max" : 1.0e3 * self.latency_max,
+                 "latency_mean" : 0.0,
+                 "loops" : self.loops,
+                 "overruns" : self.overruns,
+                 "period_jitter" : 0.0,
+                 "period_max" : 1.0e3 * self.period_max,
+                 "period_mean" : 0.0}
+        if (self.loops > 0):
+            stats["latency_mean"] = 1.0e3 * self.latency_sum/self.loops
+        if (self.n_periods > 0):
+            mean = self.period_sum/self.n_periods
+            variance = max(0.0, self.period_sum_sqr/self.n_periods - mean * mean)
+            stats["period_jitter"] = 1.0e3 * math.sqrt(variance)
+            stats["period_mean"] = 1.0e3 * mean
+        self.mutex.unlock()
+        return stats
+
+    def reset(self):
+        self.mutex.lock()
+        self.latency_max = 0.0
+        self.latency_sum = 0.0
+        self.loops = 0
+        self.n_periods = 0
+        self.overruns = 0
+        self.period_max = 0.0
+        self.period_sum = 0.0
+        self.period_sum_sqr = 0.0
+        self.mutex.unlock()
+
+
+class LockEngine(QtCore.QThread):
+    """
+    Runs the focus lock control loop.
+    """
+    engineError = QtCore.pyqtSignal(object, str)
+
+    def __init__(self,
+                 display_decimation = 1,
+                 loop_rate = 10.0,
+                 qpd_functionality = None,
+                 **kwds):
+        """
+        display_decimation - Only send every Nth QPD reading to the GUI.
+        loop_rate - The loop rate in Hz.
+        """
+        super().__init__(**kwds)
+        self.display_decimation = max(1, display_decimation)
+        self.lock_mode = None
+        self.period = 1.0/loop_rate
+        self.qpd_functionality = qpd_functionality
+        self.running = False
+        self.statistics = LoopStatistics()
+
+    def getStatistics(self):
+        return self.statistics.getStatistics()
+
+    def isLoopRunning(self):
+        """
+        This is whether or not the control loop should be running,
+        not QThread.isRunning().
+        """
+        return self.running
+
+    def loop(self):
+        """
+        One iteration of the control loop, returns the QPD state.
+        """
+        qpd_state = self.qpd_functionality.readOffset()
+        if (qpd_state is not None) and qpd_state["is_good"] and (self.lock_mode is not None):
+
+            # The lock modes are shared with the GUI thread, see lockModes.LockMode.
+            mutex = self.lock_mode.mutex
+            mutex.lock()
+            try:
+                self.lock_mode.handleQPDUpdate(qpd_state)
+            finally:
+                mutex.unlock()
+        return qpd_state
+
+    def resetStatistics(self):
+        self.statistics.reset()
+
+    def run(self):
+        count = 0
+        last_start = None
+        next_time = time.perf_counter()
+        while(self.running):
+            start = time.perf_counter()
+            try:
+                qpd_state = self.loop()
+            except Exception as exception:
+                self.running = False
+                self.engineError.emit(exception, traceback.format_exc())
+                break
+            if last_start is None:
+                self.statistics.addLoop(None, time.perf_counter() - start)
+            else:
+                self.statistics.addLoop(start - last_start, time.perf_counter() - start)
+            last_start = start
+
+            # Publish (some of) the readings for the GUI.
+            count += 1
+            if (qpd_state is not None) and ((count % self.display_decimation) == 0):
+                self.qpd_functionality.qpdUpdate.emit(qpd_state)
+
+            # Wait for the next loop. If we are already late then start
+            # again from now rather than trying to catch up.
+            next_time += self.period
+            delay = next_time - time.perf_counter()
+            if (delay > 0.0):
+                time.sleep(delay)
+            else:
+                self.statistics.addOverrun()
+                next_time = time.perf_counter()
+
+    def setLockMode(self, lock_mode):
+        """
+        This is called from the GUI thread when the lock mode changes.
+        """
+        lock_mode.mutex.lock()
+        try:
+            self.lock_mode = lock_mode
+        finally:
+            lock_mode.mutex.unlock()
+
+    def startEngine(self):
+        self.running = True
+        self.start(QtCore.QThread.TimeCriticalPriority)
+
+    def stopEngine(self):
+        self.running = False
+        self.wait()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
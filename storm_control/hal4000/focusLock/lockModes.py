@@ -7,6 +7,7 @@ Hazen 05/15
 """
 import numpy
 import scipy.optimize
+import time
 
 from PyQt5 import QtCore
 
@@ -16,6 +17,9 @@ import storm_control.sc_library.parameters as params
 # Focus quality determination for the optimal lock.
 import storm_control.hal4000.focusLock.focusQuality as focusQuality
 
+import storm_control.hal4000.focusLock.lockControllers as lockControllers
+import storm_control.hal4000.focusLock.lockTelemetry as lockTelemetry
+
 
 class LockModeException(halExceptions.HalException):
     pass
@@ -137,6 +141,9 @@ class LockedMixin(object):
     """
     This will try and hold the specified lock target. It 
     also keeps track of the quality of the lock.
+
+    The control law is a lockControllers.LockController, which
+    one is set by the 'controller' parameter.
     """
     lm_pname = "locked"
 
@@ -144,12 +151,14 @@ class LockedMixin(object):
         super().__init__(**kwds)
         self.lm_buffer = None
         self.lm_buffer_length = 1
+        self.lm_controller = lockControllers.ProportionalController()
         self.lm_counter = 0
+        self.lm_ff_tilt_x = 0.0
+        self.lm_ff_tilt_y = 0.0
         self.lm_min_sum = 0.0
         self.lm_mode_name = "locked"
         self.lm_offset_threshold = 0.02
         self.lm_target = 0.0
-        self.lm_gain = -0.9
 
         if not hasattr(self, "behavior_names"):
             self.behavior_names = []
@@ -174,8 +183,48 @@ class LockedMixin(object):
                                     name = "minimum_sum",
                                     value = -1.0))
 
+        p.add(params.ParameterSetString(description = "Lock control law.",
+                                        name = "controller",
+                                        value = "proportional",
+                                        allowed = sorted(lockControllers.controllers)))
+
+        p.add(params.ParameterFloat(description = "Proportional gain.",
+                                    name = "kp",
+                                    value = 0.9))
+
+        p.add(params.ParameterFloat(description = "Integral gain (1/s, PID only).",
+                                    name = "ki",
+                                    value = 0.0))
+
+        p.add(params.ParameterFloat(description = "Derivative gain (s, PID only).",
+                                    name = "kd",
+                                    value = 0.0))
+
+        p.add(params.ParameterFloat(description = "Maximum correction per update in microns (0 is no limit).",
+                                    name = "max_correction",
+                                    value = 0.0))
+
+        p.add(params.ParameterFloat(description = "Feed-forward z change per micron of x stage motion.",
+                                    name = "ff_tilt_x",
+                                    value = 0.0))
+
+        p.add(params.ParameterFloat(description = "Feed-forward z change per micron of y stage motion.",
+                                    name = "ff_tilt_y",
+                                    value = 0.0))
+
     def getLockTarget(self):
         return self.lm_target
+
+    def handleFeedForward(self, dz):
+        """
+        Move the stage by dz now, rather than waiting for the
+        QPD to see the error.
+        """
+        if (self.behavior == self.lm_mode_name):
+            self.z_stage_functionality.goRelative(dz)
+            self.lm_controller.feedForward(dz)
+            if self.telemetry is not None:
+                self.telemetry.addEvent(lockTelemetry.FLAG_FEED_FORWARD)
         
     def handleQPDUpdate(self, qpd_state):
         if hasattr(super(), "handleQPDUpdate"):
@@ -189,17 +238,21 @@ class LockedMixin(object):
                 else:
                     self.lm_buffer[self.lm_counter] = 0
 
-                # Simple proportional control.
-                dz = self.lm_gain * diff
+                dz = self.lm_controller.update(diff, time.perf_counter())
                 self.z_stage_functionality.goRelative(dz)
             else:
                 self.lm_buffer[self.lm_counter] = 0
+                diff = float("nan")
+                dz = 0.0
 
             good_lock = bool(numpy.sum(self.lm_buffer) == self.lm_buffer_length)
             self.last_good_z = self.z_stage_functionality.getCurrentPosition()
             if (good_lock != self.good_lock):
                 self.setLockStatus(good_lock)
 
+            if self.telemetry is not None:
+                self.telemetry.record(diff, dz, good_lock)
+
             self.lm_counter += 1
             if (self.lm_counter == self.lm_buffer_length):
                 self.lm_counter = 0
@@ -212,13 +265,27 @@ class LockedMixin(object):
         self.lm_buffer_length = p.get("buffer_length")
         self.lm_buffer = numpy.zeros(self.lm_buffer_length, dtype = numpy.uint8)
         self.lm_counter = 0
+        self.lm_controller = lockControllers.createController(p)
+        self.lm_ff_tilt_x = p.get("ff_tilt_x")
+        self.lm_ff_tilt_y = p.get("ff_tilt_y")
         self.lm_min_sum = p.get("minimum_sum")
         self.lm_offset_threshold = 1.0e-3 * p.get("offset_threshold")
 
+    def handleStageMove(self, dx, dy):
+        if hasattr(super(), "handleStageMove"):
+            super().handleStageMove(dx, dy)
+
+        dz = self.lm_ff_tilt_x * dx + self.lm_ff_tilt_y * dy
+        if (dz != 0.0):
+            self.handleFeedForward(dz)
+
     def startLock(self):
         self.lm_counter = 0
         self.lm_buffer = numpy.zeros(self.lm_buffer_length, dtype = numpy.uint8)
+        self.lm_controller.reset()
         self.behavior = "locked"
+        if self.telemetry is not None:
+            self.telemetry.addEvent(lockTelemetry.FLAG_LOCK_STARTED)
 
     def startLockBehavior(self, behavior_name, behavior_params):
         if hasattr(super(), "startLockBehavior"):
@@ -431,10 +498,21 @@ class LockMode(QtCore.QObject):
     # Emitted when the current lock target is changed.
     lockTarget = QtCore.pyqtSignal(float)
 
+    # All the modes share this mutex. When the focus lock engine is used
+    # handleQPDUpdate() is called from the engine thread (with this locked),
+    # so everything else that changes the state of a mode must also lock it.
+    # It is recursive as the signals from the modes can call back into them.
+    mutex = QtCore.QMutex(QtCore.QMutex.Recursive)
+
     # The current QPD state. This is a class rather than an instance
     # variable so it is still available even when we change lock modes.
     qpd_state = None
 
+    # Lock performance recording, a lockTelemetry.LockTelemetry
+    # object. This is set on each mode by setTelemetry() when
+    # lockControl.LockControl switches to it.
+    telemetry = None
+
     # Z stage functionality. All the classes use the same one.
     z_stage_functionality = None
     
@@ -496,6 +574,14 @@ class LockMode(QtCore.QObject):
         if hasattr(super(), "handleQPDUpdate"):
             super().handleQPDUpdate(qpd_state)
 
+    def handleStageMove(self, dx, dy):
+        """
+        Called when the xy stage is about to move by dx, dy microns. Modes
+        that lock can use this to correct for the tilt of the sample.
+        """
+        if hasattr(super(), "handleStageMove"):
+            super().handleStageMove(dx, dy)
+
     def isGoodLock(self):
         return self.good_lock
 
@@ -512,6 +598,9 @@ class LockMode(QtCore.QObject):
         self.lockTarget.emit(target)
         self.lm_target = target
 
+    def setTelemetry(self, telemetry):
+        self.telemetry = telemetry
+
     def setZStageFunctionality(self, z_stage_functionality):
         self.z_stage_functionality = z_stage_functionality
 
@@ -589,7 +678,11 @@ class JumpLockMode(LockMode, FindSumMixin, LockedMixin, ScanMixin):
         """
         Restarts the focus lock when the relock timer fires.
         """
-        self.startLock()
+        self.mutex.lock()
+        try:
+            self.startLock()
+        finally:
+            self.mutex.unlock()
 
 
 #
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Records the performance of the focus lock control loop during a film.
+
+There is one record per update of the 'locked' behavior, these are
+saved in a binary file (basename.lck) next to the movie. Each record
+is a packed numpy 'record_dtype' (25 bytes), so the file can be read
+with loadTelemetry() or just numpy.fromfile(name, dtype = record_dtype).
+
+The fields are:
+  time - Seconds since the start of the film.
+  error - Offset minus lock target (microns), NaN if the sum was too low.
+  correction - The requested z stage move (microns).
+  period - Seconds since the previous record.
+  settling - If the lock just became good, the time (seconds) since it
+             started, was lost or there was a feed-forward move, otherwise 0.
+  flags - See the FLAG_ constants.
+"""
+import numpy
+import time
+
+
+FLAG_GOOD_LOCK = 1
+FLAG_FEED_FORWARD = 2
+FLAG_LOCK_STARTED = 4
+FLAG_LOW_SUM = 8
+
+record_dtype = numpy.dtype([("time", numpy.float64),
+                            ("error", numpy.float32),
+                            ("correction", numpy.float32),
+                            ("period", numpy.float32),
+                            ("settling", numpy.float32),
+                            ("flags", numpy.uint8)])
+
+
+def loadTelemetry(filename):
+    return numpy.fromfile(filename, dtype = record_dtype)
+
+
+class LockTelemetry(object):
+    """
+    Records are buffered and written in blocks of buffer_size, so the
+    memory used doesn't depend on the length of the film.
+    """
+    def __init__(self, buffer_size = 1024, **kwds):
+        super().__init__(**kwds)
+        self.buffer = numpy.zeros(buffer_size, dtype = record_dtype)
+        self.fp = None
+        self.last_time = None
+        self.n_records = 0
+        self.next_flags = 0
+        self.settle_start = None
+        self.settling_times = []
+        self.start_time = None
+        self.was_good = False
+
+    def addEvent(self, flag):
+        """
+        Note that something happened (the lock started or a feed-forward
+        move) that will disturb the lock. This starts the settling timer.
+        """
+        self.next_flags |= flag
+        self.settle_start = time.perf_counter()
+
+    def flush(self):
+        if (self.fp is not None) and (self.n_records > 0):
+            self.buffer[:self.n_records].tofile(self.fp)
+        self.n_records = 0
+
+    def getSettlingTimes(self):
+        """
+        Returns a list of the settling times (in seconds) in the current
+        (or last) film.
+        """
+        return self.settling_times
+
+    def isRecording(self):
+        return self.fp is not None
+
+    def record(self, error, correction, good_lock):
+        if self.fp is None:
+            return
+
+        now = time.perf_counter()
+        rec = self.buffer[self.n_records]
+        rec["time"] = now - self.start_time
+        rec["error"] = error
+        rec["correction"] = correction
+        rec["period"] = 0.0 if self.last_time is None else (now - self.last_time)
+        rec["settling"] = 0.0
+
+        flags = self.next_flags
+        if good_lock:
+            flags |= FLAG_GOOD_LOCK
+            if self.settle_start is not None:
+                rec["settling"] = now - self.settle_start
+                self.settling_times.append(now - self.settle_start)
+                self.settle_start = None
+        elif self.was_good:
+            self.settle_start = now
+        if numpy.isnan(error):
+            flags |= FLAG_LOW_SUM
+        rec["flags"] = flags
+
+        self.last_time = now
+        self.next_flags = 0
+        self.was_good = good_lock
+        self.n_records += 1
+        if (self.n_records == self.buffer.size):
+            self.flush()
+
+    def startRecording(self, filename):
+        self.stopRecording()
+        self.fp = open(filename, "wb")
+        self.last_time = None
+        self.n_records = 0
+        self.settling_times = []
+        self.start_time = time.perf_counter()
+
+    def stopRecording(self):
+        if self.fp is not None:
+            self.flush()
+            self.fp.close()
+            self.fp = None
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -34,6 +34,7 @@ import storm_control.hal4000.halLib.halDialog as halDialog
 import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.halLib.halMessageBox as halMessageBox
 import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.hal4000.halLib.halProfiler as halProfiler
 import storm_control.hal4000.qtWidgets.qtAppIcon as qtAppIcon
 
 
@@ -48,6 +49,8 @@ class HalController(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["add to menu", "add to ui", "change directory", "start",
+                        "start film", "stop film", "tests done"])
 
         if (module_params.get("ui_type") == "classic"):
             self.view = ClassicView(module_params = module_params,
@@ -358,6 +361,67 @@ class DetachedView(HalView):
         self.ui.recordButton.stopFilm()
         
 
+#
+# Module startup.
+#
+class StartupWorker(QtCore.QRunnable):
+    """
+    For running a slow part of HAL's startup, importing a module or
+    calling a module's initModule() method, in a separate thread.
+
+    Unlike HalWorker this is waited on by HalCore.__init__(), so the
+    exception (if any) is saved and raised later in the main thread.
+    """
+    def __init__(self, task = None, **kwds):
+        super().__init__(**kwds)
+        self.elapsed = 0.0
+        self.exception = None
+        self.task = task
+
+        self.setAutoDelete(False)
+
+    def getElapsed(self):
+        """
+        Returns how long the task took in seconds.
+        """
+        if self.exception is not None:
+            raise self.exception
+        return self.elapsed
+
+    def run(self):
+        start_time = time.perf_counter()
+        try:
+            self.task()
+        except Exception as exception:
+            self.exception = exception
+        self.elapsed = time.perf_counter() - start_time
+
+
+def runStartupTasks(tasks, parallel = True):
+    """
+    Runs tasks, a dictionary of functions, returns a dictionary of
+    how long each of them took in seconds.
+    """
+    workers = {}
+    for key in tasks:
+        workers[key] = StartupWorker(task = tasks[key])
+
+    if parallel:
+        threadpool = QtCore.QThreadPool()
+        threadpool.setMaxThreadCount(len(workers))
+        for key in workers:
+            threadpool.start(workers[key])
+        threadpool.waitForDone()
+    else:
+        for key in workers:
+            workers[key].run()
+
+    times = {}
+    for key in workers:
+        times[key] = workers[key].getElapsed()
+    return times
+
+
 #
 # The core..
 #
@@ -372,14 +436,27 @@ class HalCore(QtCore.QObject):
                  show_gui = True,
                  **kwds):
         super().__init__(**kwds)
+        start_time = time.perf_counter()
 
+        self.configure1_time = None
+        self.module_times = {}
         self.modules = []
         self.module_name = "core"
+        self.print_module_times = config.get("print_module_times", False)
         self.qt_settings = QtCore.QSettings("storm-control", "hal4000" + config.get("setup_name").lower())
         self.queued_messages = deque()
         self.queued_messages_timer = QtCore.QTimer(self)
-        self.sent_messages = []
+        self.sent_messages = {}
+        self.startup_times = {}
         self.strict = config.get("strict", False)
+        self.subscribers = None
+        self.subscribers_all = None
+
+        #
+        # How long (in seconds) to spend sending queued messages before
+        # letting Qt handle other events. Zero means one message at a time.
+        #
+        self.message_time_budget = 1.0e-3 * config.get("message_time_budget", 5)
 
         self.queued_messages_timer.setInterval(0)
         self.queued_messages_timer.timeout.connect(self.handleSendMessage)
@@ -387,6 +464,10 @@ class HalCore(QtCore.QObject):
 
         # Initialize messages.
         halMessage.initializeMessages()
+
+        # Message profiling is off unless a module turns it on.
+        halProfiler.profiler.reset()
+        halProfiler.profiler.setEnabled(False)
         
         # Load all the modules.
         print("Loading modules")
@@ -416,8 +497,35 @@ class HalCore(QtCore.QObject):
         #
         module_names = sorted(config.get("modules").getAttrs())
         module_names.insert(0, module_names.pop(module_names.index("hal")))        
+
+        #
+        # Import the Python modules first. Importing hardware modules can
+        # be slow (DLLs, etc.) so by default this is done in parallel. The
+        # Python modules are only imported once, the import time is assigned
+        # to the first HAL module that uses the Python module.
+        #
+        python_modules = {}
+        for module_name in module_names:
+            self.module_times[module_name] = {"construct" : 0.0, "import" : 0.0, "init" : 0.0}
+            python_module = config.get("modules").get(module_name).get("module_name")
+            if not python_module in python_modules:
+                python_modules[python_module] = module_name
+
+        tasks = {}
+        for python_module in python_modules:
+            tasks[python_module] = lambda x = python_module : importlib.import_module(x)
+        import_times = runStartupTasks(tasks, parallel = config.get("parallel_import", True))
+        for python_module in python_modules:
+            self.module_times[python_modules[python_module]]["import"] = import_times[python_module]
+        self.startup_times["import"] = time.perf_counter() - start_time
+
+        #
+        # Create the modules. This is done in the main thread as they
+        # will create QObjects.
+        #
         for module_name in module_names:
             print("  " + module_name)
+            construct_time = time.perf_counter()
 
             # Get module specific parameters.
             module_params = config.get("modules").get(module_name)
@@ -446,7 +554,27 @@ class HalCore(QtCore.QObject):
             else:
                 all_modules[module_name] = True
 
+            self.module_times[module_name]["construct"] = time.perf_counter() - construct_time
+
+        #
+        # Initialize the modules. The modules that said that it is safe
+        # are initialized in parallel in separate threads, then the
+        # others are initialized one at a time in the main thread.
+        #
+        init_time = time.perf_counter()
+        for parallel in [True, False]:
+            tasks = {}
+            for module in self.modules:
+                if (module.parallel_init == parallel):
+                    tasks[module.module_name] = module.initModule
+            init_times = runStartupTasks(tasks, parallel = parallel)
+            for module_name in init_times:
+                self.module_times[module_name]["init"] = init_times[module_name]
+        self.startup_times["init"] = time.perf_counter() - init_time
+
         print("")
+        self.startup_times["load"] = time.perf_counter() - start_time
+        self.logModuleTimes()
 
         # Connect signals.
         for module in self.modules:
@@ -520,6 +648,7 @@ class HalCore(QtCore.QObject):
                                                       sync = True))
            message_chain.append(halMessage.SyncMessage(source = self))
 
+        self.configure1_time = time.perf_counter()
         self.handleMessage(halMessage.chainMessages(self.handleMessage,
                                                     message_chain))
 
@@ -563,6 +692,8 @@ class HalCore(QtCore.QObject):
             halMessage.validateData(validator, message)
             
         message.logEvent("queued")
+        if halProfiler.profiler.enabled:
+            message.time_queued = time.perf_counter()
 
         self.queued_messages.append(message)
 
@@ -575,14 +706,31 @@ class HalCore(QtCore.QObject):
         and performs message finalization.
         """
 
-        # Remove message from list of sent messages.
-        self.sent_messages.remove(message)
+        # Remove message from the sent messages.
+        del self.sent_messages[id(message)]
 
         # Disconnect messages processed signal.
         message.processed.disconnect(self.handleProcessed)
         
+        # Once all the modules have configured we know which
+        # messages they want to receive.
+        if message.isType("configure1"):
+            self.updateSubscriptions()
+
+        # Record how long it took to configure and start the modules.
+        elif message.isType("start") and (message.getSource() is self):
+            self.startup_times["configure"] = time.perf_counter() - self.configure1_time
+            print("Loading modules took {0:.1f}ms, configuring them took {1:.1f}ms".format(1.0e3 * self.startup_times["load"],
+                                                                                       1.0e3 * self.startup_times["configure"]))
+
         # Call message finalizer.
-        message.finalize()
+        if halProfiler.profiler.enabled and (message.time_sent is not None):
+            start_time = time.perf_counter()
+            halProfiler.profiler.addTime("total", message.m_type, "core", start_time - message.time_sent)
+            message.finalize()
+            halProfiler.profiler.addTime("finalize", message.m_type, "core", time.perf_counter() - start_time)
+        else:
+            message.finalize()
 
         # Always exit on exceptions in strict mode.
         if self.strict and message.hasErrors():
@@ -618,6 +766,54 @@ class HalCore(QtCore.QObject):
         # waiting for this message to get finalized.
         self.startMessageTimer()
 
+    def getStartupTimes(self):
+        """
+        Returns how long it took to load the modules and how long it
+        took from 'configure1' to 'start' being processed, in milliseconds.
+
+        'modules' is the breakdown of the load time for each module.
+        """
+        times = {}
+        for key in self.startup_times:
+            times[key] = 1.0e3 * self.startup_times[key]
+
+        times["modules"] = {}
+        for module_name in self.module_times:
+            times["modules"][module_name] = {}
+            for key in self.module_times[module_name]:
+                times["modules"][module_name][key] = 1.0e3 * self.module_times[module_name][key]
+        return times
+
+    def getSubscribers(self, m_type):
+        """
+        Returns the list of modules that should get a message of type m_type,
+        in the order that they were loaded.
+        """
+        if self.subscribers is None:
+            return self.modules
+        return self.subscribers.get(m_type, self.subscribers_all)
+
+    def logModuleTimes(self):
+        """
+        Log how long each module took to load, slowest first. This is
+        also printed if the 'print_module_times' configuration option
+        is True.
+        """
+        lines = ["{0:<24s} {1:>11s} {2:>14s} {3:>9s}".format("Module", "import (ms)", "construct (ms)", "init (ms)")]
+        for module_name in sorted(self.module_times, key = lambda x : -sum(self.module_times[x].values())):
+            m_times = self.module_times[module_name]
+            lines.append("{0:<24s} {1:11.1f} {2:14.1f} {3:9.1f}".format(module_name,
+                                                                        1.0e3 * m_times["import"],
+                                                                        1.0e3 * m_times["construct"],
+                                                                        1.0e3 * m_times["init"]))
+        text = "\n".join(lines)
+
+        if hdebug.getDebug():
+            hdebug.logText(text)
+        if self.print_module_times:
+            print(text)
+            print("")
+
     def handleResponses(self, message):
         """
         This is just a place holder. There should not be any responses
@@ -627,60 +823,106 @@ class HalCore(QtCore.QObject):
 
     def handleSendMessage(self):
         """
-        Handle sending the current message to all the modules.
+        Handle sending the queued messages to the modules. Messages are sent
+        until the queue is empty, a sync message has to wait, or we have used
+        up our time budget.
         """
-        # Process the next message.
-        if (len(self.queued_messages) > 0):
+        start_time = time.perf_counter()
+        while (len(self.queued_messages) > 0):
             cur_message = self.queued_messages.popleft()
             
             #
             # If this message requested synchronization and there are
-            # pending messages then push it back into the queue.
+            # pending messages then push it back into the queue. The
+            # timer will be restarted by handleProcessed().
             #
             if cur_message.sync and (len(self.sent_messages) > 0):
                 print("> waiting for the following to be processed:")
-                for message in self.sent_messages:
+                for message in self.sent_messages.values():
                     text = "  '" + message.m_type + "' from " + message.getSourceName() + ", "
                     text += str(message.getRefCount()) + " module(s) have not responded yet."
+                    if message.time_sent is not None:
+                        text += " Sent {0:.1f}ms ago.".format(1.0e3 * (time.perf_counter() - message.time_sent))
                     print(text)
                 print("")
                 self.queued_messages.appendleft(cur_message)
+                return
             
-            #
-            # Otherwise process the message.
-            #
-            else:
-                print(cur_message.source.module_name + " '" + cur_message.m_type + "'")
+            print(cur_message.source.module_name + " '" + cur_message.m_type + "'")
 
-                # Check for "closeEvent" message from the main window.
-                if cur_message.isType("close event") and (cur_message.getSourceName() == "hal"):
-                    self.cleanUp()
-                    return
+            # Check for "closeEvent" message from the main window.
+            if cur_message.isType("close event") and (cur_message.getSourceName() == "hal"):
+                self.cleanUp()
+                return
 
-                else:
-                    # Check for "sync" message, these don't actually get sent.
-                    if cur_message.isType("sync"):
-                        pass
+            # Check for "sync" message, these don't actually get sent.
+            if not cur_message.isType("sync"):
+                self.sendMessage(cur_message)
 
-                    # Otherwise send the message.
-                    else:
-                        cur_message.logEvent("sent")
+            # Give Qt a chance to handle other events.
+            if ((time.perf_counter() - start_time) >= self.message_time_budget):
+                break
 
-                        cur_message.processed.connect(self.handleProcessed)
-                        self.sent_messages.append(cur_message)
-                        for module in self.modules:
-                            cur_message.ref_count += 1
-                            module.handleMessage(cur_message)
+        # Process any remaining messages with immediate timeout.
+        if (len(self.queued_messages) > 0):
+            self.startMessageTimer()
 
-                    # Process any remaining messages with immediate timeout.
-                    if (len(self.queued_messages) > 0):
-                        self.startMessageTimer()
+    def sendMessage(self, message):
+        """
+        Send a message to all the modules that handle it.
+        """
+        message.logEvent("sent")
+        if halProfiler.profiler.enabled:
+            message.time_sent = time.perf_counter()
+            if message.time_queued is not None:
+                halProfiler.profiler.addTime("queue",
+                                             message.m_type,
+                                             "core",
+                                             message.time_sent - message.time_queued)
+
+        message.processed.connect(self.handleProcessed)
+        self.sent_messages[id(message)] = message
+        subscribers = self.getSubscribers(message.m_type)
+        for module in subscribers:
+            message.ref_count += 1
+            module.handleMessage(message)
+
+        # If no module handles this message then it is already
+        # processed, but the sender still needs to be notified.
+        if (len(subscribers) == 0):
+            self.handleProcessed(message)
 
     def startMessageTimer(self, interval = 0):
         if not self.queued_messages_timer.isActive():
             self.queued_messages_timer.setInterval(interval)
             self.queued_messages_timer.start()
 
+    def updateSubscriptions(self):
+        """
+        Build the table of which modules handle which message types. Modules
+        that did not subscribe to specific messages get every message.
+        """
+        self.subscribers = {}
+        self.subscribers_all = []
+        for module in self.modules:
+            m_types = module.getSubscriptions()
+            if m_types is None:
+                self.subscribers_all.append(module)
+            else:
+                for m_type in m_types:
+                    self.subscribers[m_type] = []
+
+        for m_type in self.subscribers:
+            for module in self.modules:
+                m_types = module.getSubscriptions()
+                if (m_types is None) or (m_type in m_types):
+                    self.subscribers[m_type].append(module)
+
+        if self.strict:
+            for m_type in self.subscribers:
+                if not m_type in halMessage.valid_messages:
+                    print(">> Warning modules subscribed to unknown message type '" + m_type + "' <<")
+
 
 if (__name__ == "__main__"):
 
@@ -10,6 +10,9 @@
  *
  * Hazen 09/15
  *
+ * Add rescaleImageLUT(), which uses a look up table and which works on
+ * bands of the image so that it can be run in multiple threads.
+ *
  *
  * Compilation (windows):
  * gcc -c c_image_manipulation.c -O3
@@ -36,6 +39,7 @@ void rescaleImage100(uint8_t*, unsigned short *, int, int, int, int, int, double
 void rescaleImage101(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
 void rescaleImage110(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
 void rescaleImage111(uint8_t*, unsigned short *, int, int, int, int, int, double, int *, int *);
+void rescaleImageLUT(void *, uint16_t *, uint8_t *, uint32_t *, int, int, int, int, int, int, int, int32_t *, int, int *, int *);
 
 /* 
  * Functions 
@@ -435,6 +439,92 @@ void rescaleImage111(uint8_t *scaled_image, unsigned short *image, int image_wid
   *image_max = cur_max;
 }
 
+/* rescaleImageLUT
+ *
+ * Converts a band of rows of the image to 8 bit for Qt using a look up
+ * table, and also applies the orientation. This also calculates the 
+ * minimum and maximum of the band and (optionally) the histogram of the 
+ * band and applies the color table, all in a single pass through the
+ * image. The idea is that the image is divided up into bands and each 
+ * band is processed in a different thread.
+ *
+ * @param scaled_image Storage for the scaled image (uint8 or uint32 if colors is not NULL).
+ * @param image The original image data from the camera, assumed to be 16 bit.
+ * @param lut The look up table, 65536 entries.
+ * @param colors (optional) The color table, 256 entries.
+ * @param image_rows The number of rows in the image (the "slow" dimension).
+ * @param image_cols The number of columns in the image (the "fast" dimension).
+ * @param row_start The first row in the band.
+ * @param row_end The last row in the band (exclusive).
+ * @param flip_h Flip horizontal.
+ * @param flip_v Flip vertical.
+ * @param transpose Transpose.
+ * @param histogram (optional) Storage for the histogram of the band.
+ * @param histogram_shift The histogram bin size is 2^histogram_shift.
+ * @param band_min The minimum value in the band.
+ * @param band_max The maxiumum value in the band.
+ */
+void rescaleImageLUT(void *scaled_image, uint16_t *image, uint8_t *lut, uint32_t *colors, int image_rows, int image_cols, int row_start, int row_end, int flip_h, int flip_v, int transpose, int32_t *histogram, int histogram_shift, int *band_min, int *band_max)
+{
+  int i,j,oi,stride;
+  long base;
+  uint16_t cur_min,cur_max;
+  uint16_t *row;
+  uint8_t *scaled8;
+  uint32_t *scaled32;
+
+  scaled8 = (uint8_t *)scaled_image;
+  scaled32 = (uint32_t *)scaled_image;
+
+  cur_min = 65535;
+  cur_max = 0;
+  for(i=row_start;i<row_end;i++){
+    row = image + (long)i*image_cols;
+
+    /* Minimum and maximum, kept separate so that the compiler can vectorize it. */
+    for(j=0;j<image_cols;j++){
+      cur_min = (row[j] < cur_min) ? row[j] : cur_min;
+      cur_max = (row[j] > cur_max) ? row[j] : cur_max;
+    }
+
+    if (histogram != NULL){
+      for(j=0;j<image_cols;j++){
+	histogram[row[j] >> histogram_shift] += 1;
+      }
+    }
+
+    /* Where this row starts in the scaled image & the step between pixels. */
+    oi = flip_v ? (image_rows - i - 1) : i;
+    if (transpose){
+      base = flip_h ? ((long)(image_cols - 1)*image_rows + oi) : oi;
+      stride = flip_h ? -image_rows : image_rows;
+    }
+    else{
+      base = flip_h ? ((long)oi*image_cols + image_cols - 1) : ((long)oi*image_cols);
+      stride = flip_h ? -1 : 1;
+    }
+
+    if (colors != NULL){
+      for(j=0;j<image_cols;j++){
+	scaled32[base + (long)j*stride] = colors[lut[row[j]]];
+      }
+    }
+    else if (stride == 1){
+      for(j=0;j<image_cols;j++){
+	scaled8[base + j] = lut[row[j]];
+      }
+    }
+    else{
+      for(j=0;j<image_cols;j++){
+	scaled8[base + (long)j*stride] = lut[row[j]];
+      }
+    }
+  }
+
+  *band_min = cur_min;
+  *band_max = cur_max;
+}
+
 /*
  * The MIT License
  *
@@ -8,9 +8,15 @@
 # to do the image scaling and type conversion was not fast enough.
 #
 # Hazen 09/15
+#
+# The default is now to use rescaleImageLUT(). This converts the image using
+# a (cached) look up table, and splits the image into bands of rows which
+# are processed in parallel by a pool of threads (ctypes releases the GIL).
 # 
 
+import concurrent.futures
 import ctypes
+import functools
 import math
 import numpy
 from numpy.ctypeslib import ndpointer
@@ -58,6 +64,37 @@ except OSError:
     print("C image manipulation library not found, reverting to numpy.")
     image_manip = None
 
+# Older versions of the library don't have rescaleImageLUT.
+has_lut = False
+if image_manip is not None:
+    try:
+        image_manip.rescaleImageLUT.argtypes = [ctypes.c_void_p,
+                                                ndpointer(dtype=numpy.uint16, flags="C_CONTIGUOUS"),
+                                                ndpointer(dtype=numpy.uint8),
+                                                ctypes.c_void_p,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_int,
+                                                ctypes.c_void_p,
+                                                ctypes.c_int,
+                                                ctypes.c_void_p,
+                                                ctypes.c_void_p]
+        has_lut = True
+    except AttributeError:
+        print("C image manipulation library is out of date, please re-compile.")
+
+# Images smaller than this (in pixels) are not split into bands.
+min_band_size = 65536
+
+# The number of threads to use in rescaleImageLUT().
+n_threads = min(os.cpu_count() or 1, 8)
+
+thread_pool = None
+
 ## compare
 #
 # This does a bytewise comparison of two images.
@@ -76,6 +113,47 @@ def compare(image1, image2):
     return image_manip.compare(image1, image2, image1.size)
 
 
+## getLUT
+#
+# Returns the look up table for converting a uint16 image into a uint8 image.
+# The tables are cached, so they are only re-calculated when the display
+# range or the saturated value change. These tables should not be modified.
+#
+# @param display_min The image value that equals 0.
+# @param display_max The image value that equals 255 (or 254).
+# @param saturated_value The value above which the image has saturated the camera, can be None.
+#
+# @return A numpy.uint8 array with 65536 elements.
+#
+@functools.lru_cache(maxsize = 16)
+def getLUT(display_min, display_max, saturated_value):
+    if saturated_value is not None:
+        max_range = 254.0
+    else:
+        max_range = 255.0
+
+    values = numpy.arange(65536, dtype = numpy.float64)
+    values = max_range*(values - display_min)/max(display_max - display_min, 1)
+    values = numpy.clip(values, 0.0, max_range) + 0.5
+    lut = values.astype(numpy.uint8)
+    if saturated_value is not None:
+        lut[max(saturated_value, 0):] = 255
+
+    lut.flags.writeable = False
+    return lut
+
+
+## getThreadPool
+#
+# @return The thread pool used by rescaleImageLUT().
+#
+def getThreadPool():
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers = n_threads)
+    return thread_pool
+
+
 ## rescaleImage
 #
 # This converts a uint16 image into a uint8 image based on the display
@@ -89,10 +167,11 @@ def compare(image1, image2):
 # @param display_range [image value that equals 0, image value that equals 255].
 # @param saturated_value The value above which the image has saturated the camera.
 # @param use_numpy (optional) Use numpy even if the C library exists, defaults to False.
+# @param use_lut (optional) Use rescaleImageLUT() if the C library supports it, defaults to True.
 #
 # @return [numpy.uint8 image, original image minimum, original image maximum]
 #
-def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_value, use_numpy = False):
+def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_value, use_numpy = False, use_lut = True):
 
     # Create a string specifying the operations that will be performed on the image.
     op_code = ""
@@ -102,6 +181,10 @@ def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_valu
         else:
             op_code += "0"
 
+    # Use look up table version.
+    if has_lut and use_lut and (not use_numpy):
+        return rescaleImageLUT(image, flip_h, flip_v, transpose, display_range, saturated_value)[:3]
+    
     # Determine maximum in the rescaled image.
     if saturated_value is not None:
         max_range = 254.0
@@ -167,6 +250,122 @@ def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_valu
     return [rescaled, image_min, image_max]
 
 
+## rescaleImageLUT
+#
+# This converts a uint16 image into a uint8 image based on the display
+# range using a look up table. It can also calculate the histogram of
+# the image and apply a color table at the same time.
+#
+# @param image The original image as numpy.uint16 array.
+# @param flip_h Flip horizontal.
+# @param flip_v Flip vertical.
+# @param transpose Transpose image.
+# @param display_range [image value that equals 0, image value that equals 255].
+# @param saturated_value The value above which the image has saturated the camera.
+# @param colors (optional) A numpy.uint32 array with the 256 colors of the color table.
+# @param histogram_bins (optional) The number of bins in the histogram, a power of 2, defaults to 0 (no histogram).
+# @param use_numpy (optional) Use numpy even if the C library exists, defaults to False.
+#
+# @return [numpy.uint8 (or numpy.uint32 if colors) image, original image minimum, original image maximum, histogram]
+#
+def rescaleImageLUT(image, flip_h, flip_v, transpose, display_range, saturated_value, colors = None, histogram_bins = 0, use_numpy = False):
+
+    lut = getLUT(int(display_range[0]), int(display_range[1]), saturated_value)
+
+    histogram_shift = 0
+    if (histogram_bins > 0):
+        if (histogram_bins > 65536) or ((histogram_bins & (histogram_bins - 1)) != 0):
+            raise ValueError("The number of histogram bins must be a power of 2, got " + str(histogram_bins))
+        histogram_shift = 16 - int(round(math.log2(histogram_bins)))
+
+    if colors is not None:
+        colors = numpy.ascontiguousarray(colors, dtype = numpy.uint32)
+        if (colors.size != 256):
+            raise ValueError("The color table must have 256 colors, got " + str(colors.size))
+        dtype = numpy.uint32
+    else:
+        dtype = numpy.uint8
+        
+    # Use the C library.
+    if has_lut and (not use_numpy):
+        image = numpy.ascontiguousarray(image, dtype = numpy.uint16)
+        [rows, cols] = image.shape
+        if transpose:
+            rescaled = numpy.empty((cols, rows), dtype = dtype)
+        else:
+            rescaled = numpy.empty((rows, cols), dtype = dtype)
+
+        # Divide the image up into bands.
+        n_bands = max(1, min(n_threads, image.size//min_band_size, rows))
+        edges = [(rows * i)//n_bands for i in range(n_bands + 1)]
+
+        if (histogram_bins > 0):
+            histograms = numpy.zeros((n_bands, histogram_bins), dtype = numpy.int32)
+        min_max = numpy.zeros((n_bands, 2), dtype = numpy.int32)
+
+        def doBand(i):
+            if (histogram_bins > 0):
+                hist_ptr = histograms[i].ctypes.data
+            else:
+                hist_ptr = None
+            image_manip.rescaleImageLUT(rescaled.ctypes.data,
+                                        image,
+                                        lut,
+                                        colors.ctypes.data if colors is not None else None,
+                                        rows,
+                                        cols,
+                                        edges[i],
+                                        edges[i+1],
+                                        flip_h,
+                                        flip_v,
+                                        transpose,
+                                        hist_ptr,
+                                        histogram_shift,
+                                        min_max[i,:].ctypes.data,
+                                        min_max[i,:].ctypes.data + 4)
+
+        # The first band is done in this thread.
+        futures = []
+        if (n_bands > 1):
+            pool = getThreadPool()
+            futures = [pool.submit(doBand, i) for i in range(1, n_bands)]
+        doBand(0)
+        for future in futures:
+            future.result()
+
+        image_min = int(numpy.min(min_max[:,0]))
+        image_max = int(numpy.max(min_max[:,1]))
+        if (histogram_bins > 0):
+            histogram = numpy.sum(histograms, axis = 0)
+        else:
+            histogram = None
+
+    # Fall back to using numpy.
+    else:
+        image_min = int(numpy.min(image))
+        image_max = int(numpy.max(image))
+        if (histogram_bins > 0):
+            histogram = numpy.bincount((image >> histogram_shift).ravel(), minlength = histogram_bins).astype(numpy.int32)
+        else:
+            histogram = None
+
+        if flip_h:
+            image = numpy.fliplr(image)
+            
+        if flip_v:
+            image = numpy.flipud(image)
+
+        if transpose:
+            image = numpy.transpose(image)
+
+        if colors is not None:
+            rescaled = numpy.ascontiguousarray(colors[lut[image]])
+        else:
+            rescaled = numpy.ascontiguousarray(lut[image])
+        
+    return [rescaled, image_min, image_max, histogram]
+
+
 # Testing
 #
 # This does a quick test for all the different possibilities. You will need to provide a raw image.
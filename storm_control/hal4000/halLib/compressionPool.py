@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Compresses blocks of data in a pool of threads.
+
+The compression is zlib (deflate), optionally with the data 'shuffled'
+first, i.e. the first bytes of all the elements followed by the second
+bytes, etc. This is the same as the HDF5 shuffle and deflate filters,
+and zlib releases the GIL so the threads really do run in parallel.
+
+The output can also be in gzip format, in which case the compressed
+blocks can just be concatenated to create a valid gzip file.
+
+The results are returned in the same order as the data was submitted.
+"""
+
+from collections import deque
+import numpy
+import zlib
+
+from PyQt5 import QtCore
+
+
+def gzipWBits():
+    """
+    The zlib wbits value for gzip format output.
+    """
+    return 16 + zlib.MAX_WBITS
+
+def shuffle(np_data):
+    """
+    Return the (shuffled) bytes of a numpy array.
+    """
+    itemsize = np_data.dtype.itemsize
+    if (itemsize == 1):
+        return np_data.tobytes()
+    return np_data.reshape(-1).view(numpy.uint8).reshape(-1, itemsize).T.tobytes()
+
+def unshuffle(data, dtype):
+    """
+    Inverse of shuffle().
+    """
+    dtype = numpy.dtype(dtype)
+    itemsize = dtype.itemsize
+    np_data = numpy.frombuffer(data, dtype = numpy.uint8)
+    if (itemsize > 1):
+        np_data = numpy.ascontiguousarray(np_data.reshape(itemsize, -1).T)
+    return np_data.view(dtype).reshape(-1)
+
+
+class CompressionJob(QtCore.QRunnable):
+    """
+    Compress a single block of data.
+    """
+    def __init__(self, np_data = None, level = 1, shuffle = True, tag = None, wbits = zlib.MAX_WBITS, **kwds):
+        super().__init__(**kwds)
+        self.done = QtCore.QSemaphore(0)
+        self.level = level
+        self.np_data = np_data
+        self.result = None
+        self.run_time = 0.0
+        self.shuffle = shuffle
+        self.tag = tag
+        self.wbits = wbits
+        self.setAutoDelete(False)
+
+    def isDone(self):
+        return (self.done.available() > 0)
+
+    def run(self):
+        start_time = QtCore.QElapsedTimer()
+        start_time.start()
+        if self.shuffle:
+            data = shuffle(self.np_data)
+        else:
+            data = self.np_data.tobytes()
+        if (self.wbits != zlib.MAX_WBITS):
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+            self.result = compressor.compress(data) + compressor.flush()
+        elif (self.level > 0):
+            self.result = zlib.compress(data, self.level)
+        else:
+            self.result = data
+        self.np_data = None
+        self.run_time = 1.0e-3 * start_time.elapsed()
+        self.done.release()
+
+    def wait(self):
+        self.done.acquire()
+        self.done.release()
+
+
+class CompressionPool(object):
+    """
+    A pool of threads for compressing data.
+    """
+    def __init__(self, level = 1, max_pending = None, n_threads = 2, shuffle = True, wbits = zlib.MAX_WBITS, **kwds):
+        """
+        level - The zlib compression level (0 - 9), 0 is no compression.
+        max_pending - The maximum number of jobs in the queue, submit()
+                      will wait if there are more than this.
+        n_threads - The number of compression threads.
+        shuffle - Shuffle the data bytes before compressing it.
+        wbits - The zlib wbits parameter, use gzipWBits() for gzip output.
+        """
+        super().__init__(**kwds)
+        self.level = level
+        self.n_threads = max(1, n_threads)
+        self.pending = deque()
+        self.shuffle = shuffle
+        self.wbits = wbits
+
+        if max_pending is None:
+            self.max_pending = 4 * self.n_threads
+        else:
+            self.max_pending = max_pending
+
+        self.threadpool = QtCore.QThreadPool()
+        self.threadpool.setMaxThreadCount(self.n_threads)
+
+        # Statistics.
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.busy_time = 0.0
+        self.elapsed_timer = QtCore.QElapsedTimer()
+        self.elapsed_timer.start()
+
+    def completed(self, wait = False):
+        """
+        Return the jobs that are complete, in order. If wait is True
+        this waits for all the jobs to complete.
+        """
+        jobs = []
+        while (len(self.pending) > 0):
+            job = self.pending[0]
+            if wait:
+                job.wait()
+            elif not job.isDone():
+                break
+            jobs.append(self.pending.popleft())
+            self.bytes_out += len(job.result)
+            self.busy_time += job.run_time
+        return jobs
+
+    def getCompressionRatio(self):
+        if (self.bytes_out > 0):
+            return float(self.bytes_in)/float(self.bytes_out)
+        return 1.0
+
+    def getNumberPending(self):
+        return len(self.pending)
+
+    def getUtilization(self):
+        """
+        Return the fraction of the available thread time that was used.
+        """
+        elapsed = 1.0e-3 * self.elapsed_timer.elapsed()
+        if (elapsed > 0.0):
+            return min(1.0, self.busy_time/(elapsed * self.n_threads))
+        return 0.0
+
+    def submit(self, np_data, tag = None):
+        """
+        Add np_data to the compression queue. The caller should not
+        change np_data after it has been submitted.
+        """
+        if (len(self.pending) >= self.max_pending):
+            self.pending[0].wait()
+
+        job = CompressionJob(np_data = np_data,
+                             level = self.level,
+                             shuffle = self.shuffle,
+                             tag = tag,
+                             wbits = self.wbits)
+        self.bytes_in += np_data.nbytes
+        self.pending.append(job)
+        self.threadpool.start(job)
+        return job
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
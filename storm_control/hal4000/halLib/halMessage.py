@@ -218,6 +218,10 @@ class HalMessage(QtCore.QObject):
         self.source = source
         self.sync = sync
 
+        # These are only set when HAL's message profiler is enabled.
+        self.time_queued = None
+        self.time_sent = None
+
         # We use a mutex for the ref_count because threaded
         # modules could change this inside the thread.
         self.ref_count = 0
@@ -6,6 +6,7 @@ a sub-class of this module.
 Hazen 01/17
 """
 
+import time
 import traceback
 
 from collections import deque
@@ -16,6 +17,7 @@ import storm_control.sc_library.halExceptions as halExceptions
 
 import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.halLib.halMessageBox as halMessageBox
+import storm_control.hal4000.halLib.halProfiler as halProfiler
 
 
 threadpool = QtCore.QThreadPool.globalInstance()
@@ -70,6 +72,7 @@ class HalWorker(QtCore.QRunnable):
     """
     def __init__(self, message = None, mutex = None, task = None, **kwds):
         super().__init__(**kwds)
+        self.elapsed = None
         self.message = message
         self.mutex = mutex
         self.task = task
@@ -77,13 +80,21 @@ class HalWorker(QtCore.QRunnable):
 
         self.hwsignaler = HalWorkerSignaler()
 
+    def getElapsed(self):
+        """
+        Returns how long the task took in seconds, or None if it failed.
+        """
+        return self.elapsed
+
     def isFinished(self):
         return self.task_complete
     
     def run(self):
         try:
             self.mutex.lock()
+            start_time = time.perf_counter()
             self.task()
+            self.elapsed = time.perf_counter() - start_time
             self.mutex.unlock()
         except Exception as exception:
             self.hwsignaler.workerError.emit(id(self),
@@ -108,18 +119,30 @@ class HalModule(QtCore.QObject):
     that message processing is not complete. This will keep the task from 
     freezing the GUI and causing other issues.
 
+    By default a module gets every message. Modules can use subscribe()
+    to declare which message types processMessage() handles, then HAL
+    will only send them these messages.
+
+    Slow initialization that doesn't involve Qt, such as opening a serial
+    port or loading a DLL, can be done in initModule(). HAL calls this
+    after it has created all the modules. If the module sets parallel_init
+    to True HAL will call initModule() in a worker thread at the same time
+    as the other modules that set it, so it must not create QObjects.
+
     Conventions:
        1. self.view is the GUI view, if any that is associated with this module.
        2. self.control is the controller, if any.
 
     """
     newMessage = QtCore.pyqtSignal(object)
+    parallel_init = False
 
     def __init__(self, module_name = "", **kwds):
         super().__init__(**kwds)
         self.module_name = module_name
 
         self.queued_messages = deque()
+        self.subscriptions = None
         self.workers = {}
         self.worker_mutex = QtCore.QMutex()
 
@@ -144,6 +167,13 @@ class HalModule(QtCore.QObject):
         worker.hwsignaler.workerError.disconnect(self.handleWorkerError)
         del self.workers[worker_id]
         
+    def getSubscriptions(self):
+        """
+        Returns the set of message types that this module handles, or
+        None if it wants to get every message.
+        """
+        return self.subscriptions
+
     def handleError(self, message, m_error):
         """
         Override this with class specific error handling.
@@ -199,6 +229,11 @@ class HalModule(QtCore.QObject):
         """
         You probably don't want to override this..
         """
+        if halProfiler.profiler.enabled:
+            elapsed = self.workers[worker_id].getElapsed()
+            if elapsed is not None:
+                halProfiler.profiler.addTime("worker", message.m_type, self.module_name, elapsed)
+
         message.decRefCount()
 
         # Log when the worker finished.
@@ -215,6 +250,12 @@ class HalModule(QtCore.QObject):
         # Cleanup the worker.
         self.cleanUpWorker(worker_id)
 
+    def initModule(self):
+        """
+        Override to do slow module initialization, see above.
+        """
+        pass
+
     def processMessage(self, message):
         """
         Override with class specific handling of messages.
@@ -231,6 +272,10 @@ class HalModule(QtCore.QObject):
         # Get the next message from the queue.
         message = self.queued_messages.popleft()
 
+        profile = halProfiler.profiler.enabled
+        if profile:
+            start_time = time.perf_counter()
+
         try:
             self.processMessage(message)
         except Exception as exception:
@@ -238,12 +283,30 @@ class HalModule(QtCore.QObject):
                                                         message = str(exception),
                                                         m_exception = exception,
                                                         stack_trace = traceback.format_exc()))
+
+        if profile:
+            halProfiler.profiler.addTime("process",
+                                         message.m_type,
+                                         self.module_name,
+                                         time.perf_counter() - start_time)
         message.decRefCount()
 
         # Start the timer if we still have messages left.
         if (len(self.queued_messages) > 0):
             self.queued_messages_timer.start()
 
+    def subscribe(self, m_types):
+        """
+        Add to the list of message types that this module handles. This
+        must be done before the 'configure1' message is processed as that
+        is when HalCore decides which modules get which messages.
+
+        Note that the 'configure1' message is always sent to every module.
+        """
+        if self.subscriptions is None:
+            self.subscriptions = set()
+        self.subscriptions.update(m_types)
+
     def sendMessage(self, message):
         """
         Use this to send a message from the module.
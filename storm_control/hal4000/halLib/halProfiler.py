@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Profiling of HAL's message passing.
+
+When enabled this records how long the messages spend in each step
+of their processing in histograms. The steps are:
+
+  queue    - In HalCore's queue, from when the message was sent by a
+             module to when HalCore sent it to the modules.
+  process  - In a module's processMessage() method.
+  worker   - In a task started with halModule.runWorkerTask().
+  finalize - In the message's finalizer.
+  total    - From when HalCore sent the message to the modules to when
+             all the modules finished processing it.
+
+The 'process' and 'worker' steps are recorded per message type and
+per module, the other steps are recorded per message type.
+
+Profiling is off by default. In this case the only overhead is
+checking profiler.enabled. The profiler.profiler module can be
+used to turn it on and to look at the results.
+"""
+import math
+
+
+class MessageHistogram(object):
+    """
+    A histogram of times with logarithmically spaced bins. The first
+    bin is everything less than min_time, the last bin is everything
+    greater than min_time * 10^decades.
+    """
+    bins_per_decade = 5
+    decades = 8
+    min_time = 1.0e-6
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.counts = [0] * (self.bins_per_decade * self.decades + 2)
+        self.max_time = 0.0
+        self.n_times = 0
+        self.total_time = 0.0
+
+    def addTime(self, elapsed):
+        """
+        elapsed - The time in seconds.
+        """
+        if (elapsed < self.min_time):
+            index = 0
+        else:
+            index = int(self.bins_per_decade * math.log10(elapsed/self.min_time)) + 1
+            index = min(index, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.max_time = max(self.max_time, elapsed)
+        self.n_times += 1
+        self.total_time += elapsed
+
+    def binEdge(self, index):
+        """
+        Returns the upper edge of a bin in seconds.
+        """
+        return self.min_time * math.pow(10.0, index/self.bins_per_decade)
+
+    def getCount(self):
+        return self.n_times
+
+    def getCounts(self):
+        """
+        Returns a list of [upper bin edge (ms), count] for the non-empty bins.
+        """
+        counts = []
+        for i, count in enumerate(self.counts):
+            if (count > 0):
+                counts.append([1.0e3 * min(self.binEdge(i), self.max_time), count])
+        return counts
+
+    def getPercentile(self, percentile):
+        """
+        Returns the (approximate) percentile in seconds. This is the upper
+        edge of the bin that contains the percentile.
+        """
+        if (self.n_times == 0):
+            return 0.0
+        target = 0.01 * percentile * self.n_times
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if (cumulative >= target) and (count > 0):
+                return min(self.binEdge(i), self.max_time)
+        return self.max_time
+
+    def getStatistics(self):
+        """
+        Returns a dictionary of the statistics, all the times are in milliseconds.
+        """
+        stats = {"count" : self.n_times,
+                 "max" : 1.0e3 * self.max_time,
+                 "mean" : 0.0,
+                 "p50" : 1.0e3 * self.getPercentile(50.0),
+                 "p90" : 1.0e3 * self.getPercentile(90.0),
+                 "p99" : 1.0e3 * self.getPercentile(99.0),
+                 "total" : 1.0e3 * self.total_time}
+        if (self.n_times > 0):
+            stats["mean"] = 1.0e3 * self.total_time/self.n_times
+        return stats
+
+
+class HalProfiler(object):
+    """
+    The histograms are indexed by (step, message type, module name),
+    the module name is "core" for the steps that HalCore records.
+
+    This is only used from HAL's main thread, HalWorker measures its
+    own time and this is recorded by the module when the worker is done.
+    """
+    steps = ["queue", "process", "worker", "finalize", "total"]
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.enabled = False
+        self.histograms = {}
+
+    def addTime(self, step, m_type, module_name, elapsed):
+        key = (step, m_type, module_name)
+        if not key in self.histograms:
+            self.histograms[key] = MessageHistogram()
+        self.histograms[key].addTime(elapsed)
+
+    def getHistogram(self, step, m_type, module_name = "core"):
+        return self.histograms.get((step, m_type, module_name))
+
+    def getStatistics(self, step = None):
+        """
+        Returns a list of dictionaries, one for each histogram (or just
+        the histograms for step) sorted by step and then by the total
+        time (longest first).
+        """
+        stats = []
+        for key in self.histograms:
+            if (step is not None) and (key[0] != step):
+                continue
+            h_stats = self.histograms[key].getStatistics()
+            h_stats["step"] = key[0]
+            h_stats["m_type"] = key[1]
+            h_stats["module"] = key[2]
+            stats.append(h_stats)
+        return sorted(stats, key = lambda x : (self.steps.index(x["step"]), -x["total"]))
+
+    def isEnabled(self):
+        return self.enabled
+
+    def reset(self):
+        self.histograms = {}
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+
+
+#
+# There is only one profiler, like halModule.threadpool.
+#
+profiler = HalProfiler()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
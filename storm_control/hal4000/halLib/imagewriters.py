@@ -2,19 +2,42 @@
 """
 Image file writers for various formats.
 
+The writers can either save frames directly (on the GUI thread) or
+hand them to a WriterThread which saves them in the background. In
+the later case the number of frames that can be waiting to be saved
+is limited by the queue depth, and the queue policy determines what
+happens when the queue is full:
+
+  "block" - Wait for the writer thread to make room in the queue.
+  "drop"  - Don't save the frame.
+
 Hazen 03/17
 """
 
 import copy
+from collections import deque
 import datetime
+import numpy
+import os
 import struct
 import tifffile
+import time
+import zlib
+
+# HDF5 support is optional.
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 from PyQt5 import QtCore
 
 import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
+import storm_control.hal4000.camera.frameSequence as frameSequence
+import storm_control.hal4000.halLib.compressionPool as compressionPool
+
 
 class ImageWriterException(halExceptions.HalException):
     pass
@@ -30,38 +53,210 @@ def availableFileFormats():
     #        extension.
     #
 #    return [".dax", ".spe", ".tif"]
-    return [".dax", ".tif", ".big.tif"]
+    formats = [".dax", ".tif", ".big.tif"]
+    if h5py is not None:
+        formats.append(".h5")
+    return formats
 
-def createFileWriter(camera_functionality, film_settings):
+def availableQueuePolicies():
+    """
+    Return a list of the available writer queue policies.
+    """
+    return ["block", "drop"]
+
+def createFileWriter(camera_functionality,
+                     film_settings,
+                     chunk_frames = 16,
+                     compressed = False,
+                     compression_level = 1,
+                     compression_threads = 2,
+                     direct_io = False,
+                     preallocate = True,
+                     stage_functionality = None,
+                     write_batch = 1,
+                     **kwds):
     """
     This is convenience function which creates the appropriate file writer
-    based on the filetype.
+    based on the filetype. Additional keyword arguments (queue_depth,
+    queue_policy) are passed through to the writer.
+
+    direct_io, preallocate and write_batch are only used by the .dax writer.
+
+    chunk_frames and stage_functionality are only used by the .h5 writer.
+
+    If compressed is True the frames are compressed in a pool of
+    compression_threads threads before they are saved. .h5 files
+    are always compressed if compression_level is greater than 0.
     """
     ft = film_settings.getFiletype()
+    if compressed and (ft != ".h5"):
+        writer = createFileWriter(camera_functionality,
+                                  film_settings,
+                                  direct_io = direct_io,
+                                  encoded = True,
+                                  preallocate = preallocate,
+                                  write_batch = write_batch)
+        return CompressedFileWriter(camera_functionality = camera_functionality,
+                                    compression_level = compression_level,
+                                    compression_threads = compression_threads,
+                                    film_settings = film_settings,
+                                    writer = writer,
+                                    **kwds)
     if (ft == ".dax"):
         return DaxFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+                       direct_io = direct_io,
+                       film_settings = film_settings,
+                       preallocate = preallocate,
+                       write_batch = write_batch,
+                       **kwds)
     elif (ft == ".big.tif"):
         return TIFFile(bigtiff = True,
                        camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+                       film_settings = film_settings,
+                       **kwds)
+    elif (ft == ".h5") and (h5py is not None):
+        return HDF5File(camera_functionality = camera_functionality,
+                        chunk_frames = chunk_frames,
+                        compression_level = compression_level,
+                        compression_threads = compression_threads,
+                        film_settings = film_settings,
+                        stage_functionality = stage_functionality,
+                        **kwds)
     elif (ft == ".spe"):
         return SPEFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+                       film_settings = film_settings,
+                       **kwds)
     elif (ft == ".tif"):
         return TIFFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+                       film_settings = film_settings,
+                       **kwds)
     else:
         raise ImageWriterException("Unknown output file format '" + ft + "'")
 
 
+class WriterThread(QtCore.QThread):
+    """
+    Saves frames in a separate thread so that the GUI thread does
+    not have to wait for the disk.
+    """
+    def __init__(self, writer = None, queue_depth = 1, queue_policy = "block", **kwds):
+        super().__init__(**kwds)
+
+        if not queue_policy in availableQueuePolicies():
+            raise ImageWriterException("Unknown writer queue policy '" + queue_policy + "'")
+
+        self.dropped = 0
+        self.error = None
+        self.max_behind = 0
+        self.mutex = QtCore.QMutex()
+        self.not_empty = QtCore.QWaitCondition()
+        self.not_full = QtCore.QWaitCondition()
+        self.queue = deque()
+        self.queue_depth = max(1, queue_depth)
+        self.queue_policy = queue_policy
+        self.running = True
+        self.writer = writer
+
+    def addFrame(self, frame):
+        """
+        Add a frame to the queue. Returns False if the frame was dropped.
+        """
+        self.mutex.lock()
+        if (len(self.queue) >= self.queue_depth):
+            if (self.queue_policy == "drop"):
+                self.dropped += 1
+                self.mutex.unlock()
+                return False
+            while (len(self.queue) >= self.queue_depth):
+                self.not_full.wait(self.mutex)
+
+        # The frame could be re-used by the camera before we get
+        # to it if we don't keep a reference to it.
+        frame.acquire()
+        self.queue.append(frame)
+        if (len(self.queue) > self.max_behind):
+            self.max_behind = len(self.queue)
+        self.not_empty.wakeOne()
+        self.mutex.unlock()
+        return True
+
+    def getDropped(self):
+        return self.dropped
+
+    def getFramesBehind(self):
+        return len(self.queue)
+
+    def getMaxBehind(self):
+        return self.max_behind
+
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while (len(self.queue) == 0) and self.running:
+                self.not_empty.wait(self.mutex)
+            if (len(self.queue) == 0):
+                self.mutex.unlock()
+                break
+            frame = self.queue[0]
+            self.mutex.unlock()
+
+            #
+            # If we get an error we keep going so that the queue still gets
+            # emptied. The error is raised in the GUI thread when the writer
+            # is closed.
+            #
+            if self.error is None:
+                try:
+                    self.writer.writeFrame(frame)
+                except Exception as exception:
+                    self.error = exception
+            frame.release()
+
+            self.mutex.lock()
+            self.queue.popleft()
+            self.not_full.wakeAll()
+            self.mutex.unlock()
+
+    def stopThread(self):
+        """
+        Stop the thread once all the frames in the queue have been saved.
+        """
+        self.mutex.lock()
+        self.running = False
+        self.not_empty.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+        if self.error is not None:
+            raise ImageWriterException("Saving " + self.writer.filename + " failed with '" + str(self.error) + "'")
+
+
 class BaseFileWriter(object):
+    """
+    Sub-classes that can save frames that have already been compressed
+    should set encoding to the type of compression they expect, either
+    'gzip' or 'zlib', and implement writeEncodedFrame().
+    """
+    encoding = None
 
-    def __init__(self, camera_functionality = None, film_settings = None, **kwds):
+    def __init__(self, camera_functionality = None, encoded = False, film_settings = None, queue_depth = 0, queue_policy = "block", **kwds):
+        """
+        encoded - If True the frames are compressed by a CompressedFileWriter
+                  which will call saveEncodedFrame().
+        queue_depth - The maximum number of frames waiting to be saved. If
+                      this is 0 the frames are saved in the GUI thread.
+        queue_policy - What to do when the queue is full, see availableQueuePolicies().
+        """
         super().__init__(**kwds)
         self.cam_fn = camera_functionality
+        self.encoded = encoded
         self.film_settings = film_settings
+        self.frame_sequence = frameSequence.FrameSequence()
         self.stopped = False
+        self.writer_thread = None
+
+        if self.encoded and (self.encoding is None):
+            raise ImageWriterException("Compression is not supported for '" + self.film_settings.getFiletype() + "' files.")
 
         # This is the frame size in MB.
         self.frame_size = self.cam_fn.getParameter("bytes_per_frame") *  0.000000953674
@@ -73,15 +268,73 @@ class BaseFileWriter(object):
             self.basename += "_" + self.cam_fn.getParameter("extension")
         self.filename = self.basename + self.film_settings.getFiletype()
 
+        # Encoded frames come from the CompressedFileWriter, not the camera.
+        if self.encoded:
+            return
+
+        # Start the writer thread.
+        if (queue_depth > 0):
+            self.writer_thread = WriterThread(writer = self,
+                                              queue_depth = queue_depth,
+                                              queue_policy = queue_policy)
+            self.writer_thread.start(QtCore.QThread.NormalPriority)
+
         # Connect the camera functionality.
         self.cam_fn.newFrame.connect(self.saveFrame)
         self.cam_fn.stopped.connect(self.handleStopped)
 
     def closeWriter(self):
+        """
+        Sub-classes should call this before closing their file(s) as
+        this is where we wait for the writer thread to finish. This will
+        raise an ImageWriterException if saving failed in the writer
+        thread, so sub-classes should close their file(s) in a finally
+        clause.
+        """
         assert self.stopped
+        if self.encoded:
+            return
         self.cam_fn.newFrame.disconnect(self.saveFrame)
         self.cam_fn.stopped.disconnect(self.handleStopped)
+        if self.writer_thread is not None:
+            try:
+                self.writer_thread.stopThread()
+            finally:
+                if (self.writer_thread.getDropped() > 0):
+                    print(">> Warning", self.filename, "dropped", self.writer_thread.getDropped(), "frames")
+
+    def getCompression(self):
+        """
+        Return [compression ratio, compression pool utilization] or
+        None if the frames are not compressed.
+        """
+        return None
+
+    def getDropped(self):
+        if self.writer_thread is not None:
+            return self.writer_thread.getDropped()
+        return 0
+
+    def getFramesBehind(self):
+        """
+        Return the number of frames that are waiting to be saved.
+        """
+        if self.writer_thread is not None:
+            return self.writer_thread.getFramesBehind()
+        return 0
+
+    def getFramesLost(self):
+        """
+        Return the number of frames that are missing from the file, either
+        because the camera lost them or because the writer dropped them.
+        """
+        return self.frame_sequence.getFramesLost()
 
+    def getMaxBehind(self):
+        if self.writer_thread is not None:
+            return self.writer_thread.getMaxBehind()
+        return 0
+        
     def getSize(self):
         return self.frame_size * self.number_frames
     
@@ -91,25 +344,169 @@ class BaseFileWriter(object):
     def isStopped(self):
         return self.stopped
         
-    def saveFrame(self):
+    def saveEncodedFrame(self, frame, data):
+        self.writeEncodedFrame(frame, data)
         self.number_frames += 1
 
+    def saveFrame(self, frame):
+        """
+        The camera's frame number is used to check the sequence of the
+        frames that were saved if it is available, otherwise HAL's frame
+        number is used.
+        """
+        if self.writer_thread is not None:
+            if not self.writer_thread.addFrame(frame):
+                return
+        else:
+            self.writeFrame(frame)
+        self.number_frames += 1
+        if frame.hw_frame_number is not None:
+            self.frame_sequence.addFrame(frame.hw_frame_number, frame.timestamp)
+        else:
+            self.frame_sequence.addFrame(frame.frame_number, frame.timestamp)
+
+    def writeEncodedFrame(self, frame, data):
+        """
+        Sub-classes that support encoding should override this to save
+        the compressed frame data. Note that this might be called from
+        the writer thread.
+        """
+        raise NotImplementedError(self.__class__.__name__ + " does not support encoded frames.")
+
+    def writeFrame(self, frame):
+        """
+        Sub-classes should override this to actually save the frame. Note
+        that this might be called from the writer thread.
+        """
+        raise NotImplementedError(self.__class__.__name__ + " does not implement writeFrame().")
+
+
+class CompressedFileWriter(BaseFileWriter):
+    """
+    Wraps another file writer. The frames are compressed in a pool of
+    threads and then passed, in order, to the saveEncodedFrame() method
+    of the wrapped writer.
+    """
+    def __init__(self, compression_level = 1, compression_threads = 2, writer = None, **kwds):
+        super().__init__(**kwds)
+        self.bytes_written = 0
+        self.writer = writer
+        self.filename = self.writer.filename
+
+        if (self.writer.encoding == "gzip"):
+            wbits = compressionPool.gzipWBits()
+        else:
+            wbits = zlib.MAX_WBITS
+        self.pool = compressionPool.CompressionPool(level = compression_level,
+                                                    n_threads = compression_threads,
+                                                    shuffle = False,
+                                                    wbits = wbits)
+
+    def closeWriter(self):
+        try:
+            super().closeWriter()
+        finally:
+            try:
+                self.writeJobs(self.pool.completed(wait = True))
+            finally:
+                self.writer.handleStopped()
+                self.writer.closeWriter()
+
+    def getCompression(self):
+        return [self.pool.getCompressionRatio(), self.pool.getUtilization()]
+
+    def getSize(self):
+        return self.bytes_written * 0.000000953674
+
+    def writeFrame(self, frame):
+        """
+        The frame is released once it has been compressed and saved.
+        """
+        frame.acquire()
+        self.pool.submit(frame.getData(), tag = frame)
+        self.writeJobs(self.pool.completed())
+
+    def writeJobs(self, jobs):
+        for job in jobs:
+            self.writer.saveEncodedFrame(job.tag, job.result)
+            self.bytes_written += len(job.result)
+            job.tag.release()
+
 
 class DaxFile(BaseFileWriter):
     """
     Dax file writing class.
+
+    Frames are copied into a buffer which is written to disk every
+    write_batch frames. For fixed length films the file is allocated
+    at its final size at the start of the film.
+
+    If direct_io is True (and the OS / file system supports it) then
+    the writes bypass the operating system page cache. The buffer is
+    aligned, and only aligned blocks are written, for this to work.
+
+    Compressed films are saved as a .dax.gz file, which is just the
+    .dax file in gzip format. In this case the direct_io, preallocate
+    and write_batch options are ignored.
     """
-    def __init__(self, **kwds):
+    alignment = 4096
+    encoding = "gzip"
+
+    def __init__(self, direct_io = False, preallocate = True, write_batch = 1, **kwds):
         super().__init__(**kwds)
-        self.fp = open(self.filename, "wb")
+        if self.encoded:
+            self.filename += ".gz"
+            direct_io = False
+            preallocate = False
+            write_batch = 1
+        self.buffer = None
+        self.buffer_used = 0
+        self.data_bytes = 0
+        self.direct_io = False
+        self.frame_bytes = 0
+        self.write_batch = max(1, write_batch)
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+        if direct_io:
+            if hasattr(os, "O_DIRECT"):
+                try:
+                    self.fd = os.open(self.filename, flags | os.O_DIRECT)
+                    self.direct_io = True
+                except OSError:
+                    print(">> Warning, direct I/O is not supported for", self.filename)
+            else:
+                print(">> Warning, direct I/O is not available on this OS.")
+        if not self.direct_io:
+            self.fd = os.open(self.filename, flags)
+
+        #
+        # Pre-allocate the file. If the film is stopped early the file
+        # is truncated to the correct size in closeWriter().
+        #
+        if preallocate and self.film_settings.isFixedLength():
+            file_size = self.film_settings.getFilmLength() * self.cam_fn.getParameter("bytes_per_frame")
+            if (file_size > 0):
+                try:
+                    if hasattr(os, "posix_fallocate"):
+                        os.posix_fallocate(self.fd, 0, file_size)
+                    else:
+                        os.ftruncate(self.fd, file_size)
+                except OSError:
+                    print(">> Warning, could not pre-allocate", self.filename)
 
     def closeWriter(self):
         """
         Close the file and write a very simple .inf file. All the metadata is
         now stored in the .xml file that is saved with each recording.
         """
-        super().closeWriter()
-        self.fp.close()
+        try:
+            super().closeWriter()
+        finally:
+            try:
+                self.writeBuffer(final = True)
+                os.ftruncate(self.fd, self.data_bytes)
+            finally:
+                os.close(self.fd)
 
         w = str(self.cam_fn.getParameter("x_pixels"))
         h = str(self.cam_fn.getParameter("y_pixels"))
@@ -125,10 +522,210 @@ class DaxFile(BaseFileWriter):
                 inf_fp.write("y_end = " + h + "\n")
             inf_fp.close()
 
+    def writeAll(self, data):
+        """
+        os.write() is not guaranteed to write all of the data.
+        """
+        data = memoryview(data)
+        while (len(data) > 0):
+            data = data[os.write(self.fd, data):]
+
+    def writeBuffer(self, final = False):
+        """
+        Write the contents of the buffer to disk. For direct I/O only
+        complete blocks are written, any left over data is moved to the
+        start of the buffer. At the end the last block is zero padded,
+        the padding is removed when the file is truncated.
+        """
+        if (self.buffer_used == 0):
+            return
+
+        n_bytes = self.buffer_used
+        if self.direct_io:
+            remainder = n_bytes % self.alignment
+            if final and (remainder > 0):
+                pad = self.alignment - remainder
+                self.buffer[n_bytes:n_bytes+pad] = 0
+                n_bytes += pad
+            else:
+                n_bytes -= remainder
+
+        self.writeAll(self.buffer[:n_bytes])
+
+        tail = self.buffer_used - n_bytes
+        if (tail > 0):
+            self.buffer[:tail] = self.buffer[n_bytes:self.buffer_used]
+            self.buffer_used = tail
+        else:
+            self.buffer_used = 0
+
+    def writeFrame(self, frame):
+        np_data = frame.getData().reshape(-1).view(numpy.uint8)
+        self.data_bytes += np_data.size
+
+        # No need to copy if we are not batching frames.
+        if (self.write_batch == 1) and not self.direct_io:
+            self.writeAll(np_data)
+            return
+
+        # Create an (aligned) buffer for the frames.
+        if self.buffer is None:
+            self.frame_bytes = np_data.size
+            size = self.write_batch * self.frame_bytes + self.alignment
+            raw = numpy.empty(size + self.alignment, dtype = numpy.uint8)
+            offset = (-raw.ctypes.data) % self.alignment
+            self.buffer = raw[offset:offset+size]
+
+        self.buffer[self.buffer_used:self.buffer_used+np_data.size] = np_data
+        self.buffer_used += np_data.size
+        if (self.buffer_used >= self.write_batch * self.frame_bytes):
+            self.writeBuffer()
+
+    def writeEncodedFrame(self, frame, data):
+        """
+        Each frame is a separate gzip 'member', gzip files can contain
+        any number of these.
+        """
+        self.data_bytes += len(data)
+        self.writeAll(data)
+
+
+class HDF5File(BaseFileWriter):
+    """
+    HDF5 file writing class.
+
+    The frames are saved in the 'movie' data set, which is chunked
+    in time (chunk_frames frames per chunk). The chunks are compressed
+    in a pool of threads, using the same algorithm as the HDF5 shuffle
+    and deflate (gzip) filters, and then written directly to the file.
+    This means that the file can be read by any HDF5 reader.
+
+    The frame number, time and stage position of each frame are saved
+    in the 'frame_metadata' data set. The camera's frame number and
+    timestamp are -1 and NaN if the camera does not provide them.
+    """
+    metadata_dtype = numpy.dtype([("frame_number", numpy.int64),
+                                  ("timestamp", numpy.float64),
+                                  ("hw_frame_number", numpy.int64),
+                                  ("hw_timestamp", numpy.float64),
+                                  ("stage_x", numpy.float64),
+                                  ("stage_y", numpy.float64)])
+
+    def __init__(self, chunk_frames = 16, compression_level = 1, compression_threads = 2, stage_functionality = None, **kwds):
+        super().__init__(**kwds)
+        self.chunk = None
+        self.chunk_frames = max(1, chunk_frames)
+        self.chunk_index = 0
+        self.chunk_used = 0
+        self.compression_level = compression_level
+        self.metadata = []
+        self.movie = None
+        self.stage_functionality = stage_functionality
+
+        self.pool = compressionPool.CompressionPool(level = self.compression_level,
+                                                    n_threads = compression_threads,
+                                                    shuffle = (self.compression_level > 0))
+
+        self.h5 = h5py.File(self.filename, "w")
+        self.h5.attrs["camera"] = self.cam_fn.getCameraName()
+        self.h5.attrs["pixel_size"] = self.film_settings.getPixelSize()
+
+    def closeWriter(self):
+        try:
+            super().closeWriter()
+        finally:
+            try:
+                # Write the last (partial) chunk.
+                if (self.chunk_used > 0):
+                    self.submitChunk()
+                self.writeChunks(self.pool.completed(wait = True))
+
+                if self.movie is None:
+                    self.createMovie(self.cam_fn.getParameter("x_pixels"), self.cam_fn.getParameter("y_pixels"))
+                self.movie.resize(self.number_frames, axis = 0)
+                self.movie.attrs["compression_ratio"] = self.pool.getCompressionRatio()
+
+                self.h5.create_dataset("frame_metadata",
+                                       data = numpy.array(self.metadata, dtype = self.metadata_dtype))
+            finally:
+                self.h5.close()
+
+    def createMovie(self, image_x, image_y):
+        if (self.compression_level > 0):
+            self.movie = self.h5.create_dataset("movie",
+                                                shape = (0, image_y, image_x),
+                                                maxshape = (None, image_y, image_x),
+                                                chunks = (self.chunk_frames, image_y, image_x),
+                                                dtype = numpy.uint16,
+                                                compression = "gzip",
+                                                compression_opts = self.compression_level,
+                                                shuffle = True)
+        else:
+            self.movie = self.h5.create_dataset("movie",
+                                                shape = (0, image_y, image_x),
+                                                maxshape = (None, image_y, image_x),
+                                                chunks = (self.chunk_frames, image_y, image_x),
+                                                dtype = numpy.uint16)
+
+    def getCompression(self):
+        if (self.compression_level > 0):
+            return [self.pool.getCompressionRatio(), self.pool.getUtilization()]
+        return None
+
     def saveFrame(self, frame):
-        super().saveFrame()
-        np_data = frame.getData()
-        np_data.tofile(self.fp)
+        """
+        The meta-data is recorded here (in the GUI thread) as we can't
+        query the stage from the writer thread.
+        """
+        number_frames = self.number_frames
+        super().saveFrame(frame)
+        if (self.number_frames > number_frames):
+            stage_x = numpy.nan
+            stage_y = numpy.nan
+            if self.stage_functionality is not None:
+                pos_dict = self.stage_functionality.getCurrentPosition()
+                if pos_dict is not None:
+                    stage_x = pos_dict["x"]
+                    stage_y = pos_dict["y"]
+            hw_frame_number = -1
+            if frame.hw_frame_number is not None:
+                hw_frame_number = frame.hw_frame_number
+            hw_timestamp = numpy.nan
+            if frame.timestamp is not None:
+                hw_timestamp = frame.timestamp
+            self.metadata.append((frame.frame_number,
+                                  time.time(),
+                                  hw_frame_number,
+                                  hw_timestamp,
+                                  stage_x,
+                                  stage_y))
+
+    def submitChunk(self):
+        self.pool.submit(self.chunk, tag = self.chunk_index)
+        self.chunk = None
+        self.chunk_index += 1
+        self.chunk_used = 0
+
+    def writeChunks(self, jobs):
+        for job in jobs:
+            start = job.tag * self.chunk_frames
+            if (self.movie.shape[0] < (start + self.chunk_frames)):
+                self.movie.resize(start + self.chunk_frames, axis = 0)
+            self.movie.id.write_direct_chunk((start, 0, 0), job.result)
+
+    def writeFrame(self, frame):
+        if self.movie is None:
+            self.createMovie(frame.image_x, frame.image_y)
+
+        # The chunk is zero filled as the last chunk may be partial.
+        if self.chunk is None:
+            self.chunk = numpy.zeros((self.chunk_frames, frame.image_y, frame.image_x), dtype = numpy.uint16)
+        self.chunk[self.chunk_used] = frame.getData().reshape(frame.image_y, frame.image_x)
+        self.chunk_used += 1
+
+        if (self.chunk_used == self.chunk_frames):
+            self.submitChunk()
+            self.writeChunks(self.pool.completed())
 
 
 class SPEFile(BaseFileWriter):
@@ -171,8 +768,7 @@ class SPEFile(BaseFileWriter):
         self.fp.seek(1446)
         self.fp.write(struct.pack("i", self.number_frames))
 
-    def saveFrame(self, frame):
-        super().saveFrame()
+    def writeFrame(self, frame):
         np_data = frame.getData()
         np_data.tofile(self.file_ptrs[index])
 
@@ -180,11 +776,16 @@ class SPEFile(BaseFileWriter):
 class TIFFile(BaseFileWriter):
     """
     TIF file writing class. This supports both normal and 'big' tiff.
+
+    Compressed (deflate) .tif files are not ImageJ format files as
+    ImageJ hyperstacks must be uncompressed.
     """
+    encoding = "zlib"
+
     def __init__(self, bigtiff = False, **kwds):
         super().__init__(**kwds)
         self.metadata = {'unit' : 'um'}
-        if bigtiff:
+        if bigtiff or self.encoded:
             self.resolution = (25400.0/self.film_settings.getPixelSize(),
                                25400.0/self.film_settings.getPixelSize())
             self.tif = tifffile.TiffWriter(self.filename,
@@ -195,15 +796,38 @@ class TIFFile(BaseFileWriter):
                                            imagej = True)
 
     def closeWriter(self):
-        super().closeWriter()
-        self.tif.close()
+        try:
+            super().closeWriter()
+        finally:
+            self.tif.close()
+
+    def writeEncodedFrame(self, frame, data):
+        """
+        The frame is saved as a single deflate compressed strip.
+        """
+        if not hasattr(self.tif, "write"):
+            raise ImageWriterException("This version of tifffile does not support compressed frames.")
+        self.tif.write(iter([data]),
+                       compression = "zlib",
+                       dtype = numpy.uint16,
+                       metadata = self.metadata,
+                       resolution = self.resolution,
+                       rowsperstrip = frame.image_y,
+                       shape = (frame.image_y, frame.image_x))
         
-    def saveFrame(self, frame):
-        super().saveFrame()
+    def writeFrame(self, frame):
         image = frame.getData()
-        self.tif.save(image.reshape((frame.image_y, frame.image_x)),
-                      metadata = self.metadata,
-                      resolution = self.resolution)
+
+        # Newer versions of tifffile renamed save() to write().
+        if hasattr(self.tif, "write"):
+            self.tif.write(image.reshape((frame.image_y, frame.image_x)),
+                           contiguous = True,
+                           metadata = self.metadata,
+                           resolution = self.resolution)
+        else:
+            self.tif.save(image.reshape((frame.image_y, frame.image_x)),
+                          metadata = self.metadata,
+                          resolution = self.resolution)
 
 
 #
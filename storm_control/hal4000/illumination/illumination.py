@@ -303,6 +303,9 @@ class Illumination(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configuration", "configure1", "current parameters",
+                        "get functionality", "new parameters", "new shutters file",
+                        "show", "start", "start film", "stop film"])
 
         configuration = module_params.get("configuration")
 
@@ -192,7 +192,7 @@ class ChannelUIAdjustable(ChannelUI):
 
         page_step = 0.1 * (maximum - minimum)
         if (page_step > 1.0):
-            self.powerslider.setPageStep(page_step)
+            self.powerslider.setPageStep(int(page_step))
         self.powerslider.setSingleStep(1)
 
         #
@@ -235,6 +235,7 @@ class ChannelUIAdjustable(ChannelUI):
             self.setAmplitude(new_power)
 
     def setAmplitude(self, amplitude):
+        amplitude = int(round(amplitude))
         if (amplitude != self.powerslider.value()):
             self.powerslider.setValue(amplitude)
 
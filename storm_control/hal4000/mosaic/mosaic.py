@@ -48,6 +48,7 @@ class Mosaic(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configure1", "new parameters", "stop film", "tcp message"])
 
         #
         # FIXME: Are these parameters mutable? They shouldn't be if they are.
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Message profiler.
+
+This turns on HAL's message profiling (see halLib.halProfiler) and
+displays the results. The results are also available to a TCP client
+with the 'Get Message Statistics' message.
+"""
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.hal4000.halLib.halDialog as halDialog
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.hal4000.halLib.halProfiler as halProfiler
+import storm_control.hal4000.qtdesigner.profiler_ui as profilerUi
+
+
+class ProfilerView(halDialog.HalDialog):
+    """
+    Manages the profiler GUI.
+    """
+    columns = ["step", "m_type", "module", "count", "mean", "p50", "p90", "p99", "max", "total"]
+    headers = ["Step", "Message", "Module", "Count", "Mean (ms)", "50% (ms)",
+               "90% (ms)", "99% (ms)", "Max (ms)", "Total (ms)"]
+
+    def __init__(self, update_interval = None, **kwds):
+        super().__init__(**kwds)
+
+        self.ui = profilerUi.Ui_Dialog()
+        self.ui.setupUi(self)
+
+        self.ui.stepComboBox.addItem("all")
+        for step in halProfiler.HalProfiler.steps:
+            self.ui.stepComboBox.addItem(step)
+
+        self.ui.statisticsTable.setColumnCount(len(self.headers))
+        self.ui.statisticsTable.setHorizontalHeaderLabels(self.headers)
+        self.ui.statisticsTable.verticalHeader().setVisible(False)
+
+        self.ui.enabledCheckBox.setChecked(halProfiler.profiler.isEnabled())
+        self.ui.enabledCheckBox.clicked.connect(self.handleEnabled)
+        self.ui.resetButton.clicked.connect(self.handleReset)
+        self.ui.stepComboBox.currentIndexChanged.connect(self.updateTable)
+
+        # Only update the table while the dialog is visible.
+        self.update_timer = QtCore.QTimer(self)
+        self.update_timer.setInterval(update_interval)
+        self.update_timer.timeout.connect(self.updateTable)
+
+    def handleEnabled(self, boolean):
+        halProfiler.profiler.setEnabled(boolean)
+
+    def handleReset(self, boolean):
+        halProfiler.profiler.reset()
+        self.updateTable()
+
+    def hideEvent(self, event):
+        self.update_timer.stop()
+        super().hideEvent(event)
+
+    def showEvent(self, event):
+        self.ui.enabledCheckBox.setChecked(halProfiler.profiler.isEnabled())
+        self.updateTable()
+        self.update_timer.start()
+        super().showEvent(event)
+
+    def updateTable(self):
+        step = self.ui.stepComboBox.currentText()
+        if (step == "all"):
+            step = None
+        stats = halProfiler.profiler.getStatistics(step = step)
+
+        table = self.ui.statisticsTable
+        table.setRowCount(len(stats))
+        for i, h_stats in enumerate(stats):
+            for j, column in enumerate(self.columns):
+                value = h_stats[column]
+                if isinstance(value, float):
+                    value = "{0:.3f}".format(value)
+                table.setItem(i, j, QtWidgets.QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+
+
+class Profiler(halModule.HalModule):
+    """
+    Message profiler controller.
+    """
+    def __init__(self, module_params = None, qt_settings = None, **kwds):
+        super().__init__(**kwds)
+        self.subscribe(["configure1", "show", "start", "tcp message"])
+
+        configuration = module_params.get("configuration")
+        halProfiler.profiler.setEnabled(configuration.get("enabled", True))
+
+        self.view = ProfilerView(module_name = self.module_name,
+                                 update_interval = configuration.get("update_interval", 1000))
+        self.view.halDialogInit(qt_settings,
+                                module_params.get("setup_name") + " message profiler")
+
+    def cleanUp(self, qt_settings):
+        self.view.cleanUp(qt_settings)
+
+    def processMessage(self, message):
+
+        if message.isType("configure1"):
+            self.sendMessage(halMessage.HalMessage(m_type = "add to menu",
+                                                   data = {"item name" : "Message Profiler",
+                                                           "item data" : "profiler"}))
+
+        elif message.isType("show"):
+            if (message.getData()["show"] == "profiler"):
+                self.view.show()
+
+        elif message.isType("start"):
+            if message.getData()["show_gui"]:
+                self.view.showIfVisible()
+
+        elif message.isType("tcp message"):
+            tcp_message = message.getData()["tcp message"]
+            if tcp_message.isType("Get Message Statistics"):
+                if not tcp_message.isTest():
+                    tcp_message.addResponse("enabled", halProfiler.profiler.isEnabled())
+                    tcp_message.addResponse("statistics",
+                                            halProfiler.profiler.getStatistics(step = tcp_message.getData("step")))
+                    if tcp_message.getData("reset"):
+                        halProfiler.profiler.reset()
+                message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                                  data = {"handled" : True}))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -3,6 +3,15 @@
 A QGraphicsScene and a QGraphicsItem customized for displaying
 data from a camera.
 
+The conversion of a frame to a QImage is done by renderFrame(),
+which does not use the QGraphicsItem so it can be called from
+a worker thread, see display/frameRenderer.py.
+
+When the view is zoomed out the frame is binned down to (about)
+the screen resolution before it is converted, so the cost of
+rendering depends on the size of the view and not the size of
+the camera frame.
+
 Hazen 3/17.
 """
 
@@ -13,6 +22,141 @@ import numpy
 import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
 
 
+def downsampleImage(image, dx, dy, mode):
+    """
+    Bin a 2D image by dx in x and dy in y, using either the maximum
+    (mode = "max") or the mean (mode = "mean") of each bin. Partial
+    bins at the right and bottom edges of the image only use the
+    pixels that they contain.
+    """
+    [h, w] = image.shape
+
+    # This is faster, but only works if there are no partial bins.
+    if ((h % dy) == 0) and ((w % dx) == 0):
+        bins = image.reshape(h//dy, dy, w//dx, dx)
+        if (mode == "mean"):
+            binned = numpy.sum(bins, axis = (1,3), dtype = numpy.uint32)//(dx * dy)
+            return binned.astype(numpy.uint16)
+        else:
+            return numpy.ascontiguousarray(numpy.max(bins, axis = (1,3)))
+
+    rows = numpy.arange(0, h, dy)
+    cols = numpy.arange(0, w, dx)
+    if (mode == "mean"):
+        binned = numpy.add.reduceat(numpy.add.reduceat(image, rows, axis = 0, dtype = numpy.uint32), cols, axis = 1)
+        binned = binned//numpy.outer(numpy.minimum(dy, h - rows), numpy.minimum(dx, w - cols))
+        return binned.astype(numpy.uint16)
+    else:
+        return numpy.maximum.reduceat(numpy.maximum.reduceat(image, rows, axis = 0), cols, axis = 1)
+
+def renderFrame(frame, settings):
+    """
+    Convert a frame to a RenderedImage using settings, which is a
+    dictionary from QtCameraGraphicsItem.getRenderSettings(). This
+    returns None if the frame is not the expected size.
+
+    If settings["histogram"] is an IntensityHistogram (display/intensityHistogram.py)
+    the histogram of the frame is added to it.
+    """
+    #
+    # For reasons lost in the mists of time 'frame' is a 1D numpy array
+    # and needs to be reshaped before rescaling and converting to a QImage.
+    #
+    w = frame.image_x
+    h = frame.image_y
+    image_data = frame.getData()
+    try:
+        image_data = image_data.reshape((h,w))
+    except ValueError as e:
+        print("Got an image with an unexpected size, ", image_data.shape, "expected [", w, ",", h, "]")
+        return None
+
+    #
+    # Rescale the image & record it's minimum, maximum and histogram. If
+    # we are downsampling then these are calculated using the full image.
+    # The downsampled image can extend up to dx - 1 (dy - 1) pixels past
+    # the edge of the frame because of the partial bins.
+    #
+    histogram_bins = 0
+    if settings["histogram"] is not None:
+        histogram_bins = 65536
+
+    [dx, dy] = settings["downsample"]
+    if (dx > 1) or (dy > 1):
+        image_min = int(image_data.min())
+        image_max = int(image_data.max())
+        if (histogram_bins > 0):
+            histogram = numpy.bincount(image_data.ravel(), minlength = histogram_bins)
+        [temp, unused, unused] = c_image.rescaleImage(downsampleImage(image_data, dx, dy, settings["downsample_mode"]),
+                                                      False,
+                                                      False,
+                                                      False,
+                                                      settings["display_range"],
+                                                      settings["saturated_value"])
+    else:
+        [temp, image_min, image_max, histogram] = c_image.rescaleImageLUT(image_data,
+                                                                          False,
+                                                                          False,
+                                                                          False,
+                                                                          settings["display_range"],
+                                                                          settings["saturated_value"],
+                                                                          histogram_bins = histogram_bins)
+
+    # Update the running histogram of this feed.
+    binned_histogram = None
+    if settings["histogram"] is not None:
+        settings["histogram"].addHistogram(histogram)
+        binned_histogram = settings["histogram"].getBinned(settings["max_intensity"])
+
+    #
+    # Create QImage. The size of the image in the scene (in camera chip
+    # pixels) is also recorded as the QImage will be smaller than this
+    # if the camera is binned or if we downsampled it.
+    #
+    [scale_x, scale_y] = settings["scale"]
+    [ih, iw] = temp.shape
+    q_image = QtGui.QImage(temp.data, iw, ih, iw, QtGui.QImage.Format_Indexed8)
+    q_image.ndarray = temp
+    image_size = [iw * dx * scale_x, ih * dy * scale_y]
+
+    # Set the images color table. If you don't do this Qt will segfault
+    # without giving you a traceback or any kind of warning message..
+    q_image.setColorTable(settings["color_table"])
+
+    # Record the intensity where the user last clicked on the image.
+    # The click position is in frame coordinates.
+    [xl, yl] = settings["click_pos"]
+    if ((xl >= 0) and (xl < w) and (yl >= 0) and (yl < h)):
+        intensity_info = image_data[yl, xl]
+    else:
+        intensity_info = 0
+
+    return RenderedImage(binned_histogram = binned_histogram,
+                         click_pos = settings["click_pos"],
+                         frame_number = frame.frame_number,
+                         image_max = image_max,
+                         image_min = image_min,
+                         image_size = image_size,
+                         intensity_info = intensity_info,
+                         q_image = q_image)
+
+
+class RenderedImage(object):
+    """
+    A frame that is ready to be displayed, and it's meta-information.
+    """
+    def __init__(self, binned_histogram = None, click_pos = None, frame_number = None, image_max = None, image_min = None, image_size = None, intensity_info = None, q_image = None, **kwds):
+        super().__init__(**kwds)
+        self.binned_histogram = binned_histogram
+        self.click_pos = click_pos
+        self.frame_number = frame_number
+        self.image_max = image_max
+        self.image_min = image_min
+        self.image_size = image_size
+        self.intensity_info = intensity_info
+        self.q_image = q_image
+
+
 class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     """
     The idea is to display the image as it would appear on the 
@@ -22,7 +166,8 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     with the appropriate x,y offset from 0,0.
 
     If the image is binned then the rendered image needs to be
-    up-sampled appropriately to compensate for the binning.
+    up-sampled appropriately to compensate for the binning. This
+    is also true if the image was downsampled for display.
     """
     def __init__(self, **kwds):
         super().__init__(**kwds)
@@ -32,20 +177,24 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         self.chip_y = 0
         self.click_x = 0
         self.click_y = 0
+        self.color_table = [QtGui.qRgb(i, i, i) for i in range(256)]
         self.colortable = None
         self.display_range = [0, 200]
         self.display_saturated_pixels = False
+        self.downsample_mode = "max"
         self.draw_grid = False
         self.draw_target = False
         self.frame_x_offset = 0
         self.frame_y_offset = 0
         self.image_max = 0
         self.image_min = 0
+        self.image_size = [0, 0]
         self.intensity_info = 0
         self.max_intensity = None
         self.q_image = None
         self.scale_x = 1
         self.scale_y = 1
+        self.zoom = 1.0
 
     def boundingRect(self):
         chip_rect = QtCore.QRectF(0, 0, self.chip_x, self.chip_y)
@@ -59,12 +208,39 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def getAutoScale(self):
         return [self.image_min, self.image_max]
 
+    def getDownsample(self):
+        """
+        Return how much to downsample in x and y, this is the number of frame
+        pixels that are shown in a single screen pixel at the current zoom.
+        """
+        if (self.downsample_mode == "none"):
+            return [1, 1]
+        return [max(1, int(1.0/(self.zoom * self.scale_x) + 1.0e-6)),
+                max(1, int(1.0/(self.zoom * self.scale_y) + 1.0e-6))]
+
     def getImage(self):
         return self.q_image
     
     def getIntensityInfo(self):
         return [self.click_x, self.click_y, self.intensity_info]
         
+    def getRenderSettings(self):
+        """
+        Return a copy of the settings that renderFrame() needs.
+        """
+        saturated_value = None
+        if self.display_saturated_pixels:
+            saturated_value = self.max_intensity
+        return {"click_pos" : [self.click_x, self.click_y],
+                "color_table" : self.color_table,
+                "display_range" : list(self.display_range),
+                "downsample" : self.getDownsample(),
+                "downsample_mode" : self.downsample_mode,
+                "histogram" : None,
+                "max_intensity" : self.max_intensity,
+                "saturated_value" : saturated_value,
+                "scale" : [self.scale_x, self.scale_y]}
+
     def newColorTable(self, colortable):
         self.colortable = colortable
         if "_sat.ctbl" in colortable:
@@ -72,6 +248,14 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         else:
             self.display_saturated_pixels = False
 
+        # This is the color table in the form that QImage.setColorTable() expects.
+        if self.colortable:
+            self.color_table = [QtGui.qRgb(self.colortable[i][0],
+                                           self.colortable[i][1],
+                                           self.colortable[i][2]) for i in range(256)]
+        else:
+            self.color_table = [QtGui.qRgb(i, i, i) for i in range(256)]
+
     def newConfiguration(self, camera_functionality):
         [chip_x, chip_y] = camera_functionality.getChipSize()
         [self.frame_x_offset, self.frame_y_offset] = camera_functionality.getFrameZeroZero()
@@ -92,8 +276,10 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         if self.q_image is not None:
 
             # Draw the image.
-            painter.drawImage(self.frame_x_offset,
-                              self.frame_y_offset,
+            painter.drawImage(QtCore.QRectF(self.frame_x_offset,
+                                            self.frame_y_offset,
+                                            self.image_size[0],
+                                            self.image_size[1]),
                               self.q_image)
             
             # Draw the grid into the buffer.
@@ -116,20 +302,24 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         self.click_x = cx
         self.click_y = cy
 
-    def setColorTable(self):
+    def setRenderedImage(self, rendered):
         """
-        Sets the color table of the new image. If you don't do this Qt
-        will segfault without giving you a traceback or any kind of
-        warning message..
+        Display an image from renderFrame().
         """
-        if self.colortable:
-            for i in range(256):
-                self.q_image.setColor(i, QtGui.qRgb(self.colortable[i][0], 
-                                                    self.colortable[i][1], 
-                                                    self.colortable[i][2]))
-        else:
-            for i in range(256):
-                self.q_image.setColor(i,QtGui.qRgb(i,i,i))        
+        self.q_image = rendered.q_image
+        self.image_min = rendered.image_min
+        self.image_max = rendered.image_max
+        self.image_size = rendered.image_size
+        self.intensity_info = rendered.intensity_info
+
+        # Force re-paint.
+        self.update()
+
+    def setDownsampleMode(self, mode):
+        """
+        mode is one of "max", "mean" or "none".
+        """
+        self.downsample_mode = mode
 
     def setShowGrid(self, show):
         self.draw_grid = show
@@ -137,57 +327,19 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def setShowTarget(self, show):
         self.draw_target = show
         
+    def setZoom(self, zoom):
+        """
+        zoom is the number of screen pixels per camera chip pixel.
+        """
+        self.zoom = zoom
+
     def updateImageWithFrame(self, frame):
         """
         Convert the frame to a QImage, then call update() to display it.
         """
-        #
-        # For reasons lost in the mists of time 'frame' is a 1D numpy array
-        # and needs to be reshaped before rescaling and converting to a QImage.
-        #
-        w = frame.image_x
-        h = frame.image_y
-        image_data = frame.getData()
-        try:
-            image_data = image_data.reshape((h,w))
-        except ValueError as e:
-            print("Got an image with an unexpected size, ", image_data.shape, "expected [", w, ",", h, "]")
-            return
-
-        max_intensity = self.max_intensity
-        if not self.display_saturated_pixels:
-            max_intensity = None
-
-        # Rescale the image & record it's minimum and maximum.
-        [temp, self.image_min, self.image_max] = c_image.rescaleImage(image_data,
-                                                                      False,
-                                                                      False,
-                                                                      False,
-                                                                      self.display_range,
-                                                                      max_intensity)
-        
-        # Create QImage & re-scale to compensate for binning, if any.
-        temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-        if (self.scale_x != 1) or (self.scale_y != 1):
-            self.q_image = temp_image.scaled(w * self.scale_x, h * self.scale_y)
-        else:
-            self.q_image = temp_image
-        self.q_image.ndarray = temp
-
-        # Set the images color table.
-        self.setColorTable()
-
-        # Record the intensity where the user last clicked on the image.
-        # self.click_x and self.click_y are in frame coordinates.
-        xl = self.click_x
-        yl = self.click_y
-        if ((xl >= 0) and (xl < w) and (yl >= 0) and (yl < h)):
-            self.intensity_info = image_data[yl, xl]
-        else:
-            self.intensity_info = 0
-
-        # Force re-paint.
-        self.update()
+        rendered = renderFrame(frame, self.getRenderSettings())
+        if rendered is not None:
+            self.setRenderedImage(rendered)
 
 
 class QtCameraGraphicsScene(QtWidgets.QGraphicsScene):
@@ -59,6 +59,18 @@ class QtCameraGraphicsView(QtWidgets.QGraphicsView):
         self.center_y = center.y()
         self.newCenter.emit(self.center_x, self.center_y)
         
+    def getZoom(self):
+        """
+        Return the current zoom, i.e. the number of screen pixels per
+        scene (camera chip) pixel.
+        """
+        if (self.display_scale == 0):
+            return 1.0
+        elif (self.display_scale > 0):
+            return float(self.display_scale + 1)
+        else:
+            return 1.0/(-self.display_scale + 1)
+
     def keyPressEvent(self, event):
         if self.can_drag and (event.key() == QtCore.Qt.Key_Control):
             self.ctrl_key_down = True
@@ -187,13 +199,7 @@ class QtCameraGraphicsView(QtWidgets.QGraphicsView):
         self.display_scale = scale
         self.newScale.emit(self.display_scale)
 
-        if (self.display_scale == 0):
-            flt_scale = 1.0
-        elif (self.display_scale > 0):
-            flt_scale = float(self.display_scale + 1)
-        else:
-            flt_scale = 1.0/(-self.display_scale + 1)
-            
+        flt_scale = self.getZoom()
         transform = QtGui.QTransform()
         transform.scale(flt_scale, flt_scale)
         self.setTransform(self.transform * transform)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Qt Widget for displaying an intensity histogram next to the
+(vertical) display range slider. Intensity increases from the
+bottom of the widget to the top, and the length of each bar
+is the (normalized) log of the number of pixels in the bin.
+"""
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class QHistogram(QtWidgets.QWidget):
+    """
+    Draws a histogram from IntensityHistogram.getBinned().
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.binned = None
+        self.display_range = [0.0, 1.0]
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        w = self.width()
+        h = self.height()
+
+        # Background.
+        painter.setPen(QtCore.Qt.gray)
+        painter.setBrush(QtCore.Qt.white)
+        painter.drawRect(0, 0, w-1, h-1)
+
+        if self.binned is None:
+            return
+
+        # Bars, the bins in the display range are darker.
+        n_bins = self.binned.size
+        bin_h = float(h - 2)/n_bins
+        for i in range(n_bins):
+            bar_w = int(round(self.binned[i] * (w - 2)))
+            if (bar_w == 0):
+                continue
+            fraction = (i + 0.5)/n_bins
+            if (fraction >= self.display_range[0]) and (fraction <= self.display_range[1]):
+                color = QtCore.Qt.darkGray
+            else:
+                color = QtCore.Qt.lightGray
+            painter.setPen(color)
+            painter.setBrush(color)
+            y = h - 1 - (i + 1) * bin_h
+            painter.drawRect(QtCore.QRectF(w - 1 - bar_w, y, bar_w, bin_h))
+
+    def setDisplayRange(self, d_min, d_max):
+        """
+        d_min, d_max - The display range as a fraction of the full range.
+        """
+        self.display_range = [d_min, d_max]
+        self.update()
+
+    def setHistogram(self, binned):
+        self.binned = binned
+        self.update()
+
+    def sizeHint(self):
+        return QtCore.QSize(24, 200)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2017 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
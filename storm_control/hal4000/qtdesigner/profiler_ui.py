@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'profiler.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_Dialog(object):
+    def setupUi(self, Dialog):
+        Dialog.setObjectName("Dialog")
+        Dialog.resize(640, 400)
+        self.verticalLayout = QtWidgets.QVBoxLayout(Dialog)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.controlsLayout = QtWidgets.QHBoxLayout()
+        self.controlsLayout.setObjectName("controlsLayout")
+        self.enabledCheckBox = QtWidgets.QCheckBox(Dialog)
+        self.enabledCheckBox.setObjectName("enabledCheckBox")
+        self.controlsLayout.addWidget(self.enabledCheckBox)
+        self.stepLabel = QtWidgets.QLabel(Dialog)
+        self.stepLabel.setObjectName("stepLabel")
+        self.controlsLayout.addWidget(self.stepLabel)
+        self.stepComboBox = QtWidgets.QComboBox(Dialog)
+        self.stepComboBox.setObjectName("stepComboBox")
+        self.controlsLayout.addWidget(self.stepComboBox)
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.controlsLayout.addItem(spacerItem)
+        self.resetButton = QtWidgets.QPushButton(Dialog)
+        self.resetButton.setObjectName("resetButton")
+        self.controlsLayout.addWidget(self.resetButton)
+        self.verticalLayout.addLayout(self.controlsLayout)
+        self.statisticsTable = QtWidgets.QTableWidget(Dialog)
+        self.statisticsTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.statisticsTable.setObjectName("statisticsTable")
+        self.statisticsTable.setColumnCount(0)
+        self.statisticsTable.setRowCount(0)
+        self.verticalLayout.addWidget(self.statisticsTable)
+        self.okLayout = QtWidgets.QHBoxLayout()
+        self.okLayout.setObjectName("okLayout")
+        spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.okLayout.addItem(spacerItem1)
+        self.okButton = QtWidgets.QPushButton(Dialog)
+        self.okButton.setObjectName("okButton")
+        self.okLayout.addWidget(self.okButton)
+        self.verticalLayout.addLayout(self.okLayout)
+
+        self.retranslateUi(Dialog)
+        QtCore.QMetaObject.connectSlotsByName(Dialog)
+
+    def retranslateUi(self, Dialog):
+        _translate = QtCore.QCoreApplication.translate
+        Dialog.setWindowTitle(_translate("Dialog", "Dialog"))
+        self.enabledCheckBox.setText(_translate("Dialog", "Enabled"))
+        self.stepLabel.setText(_translate("Dialog", "Step:"))
+        self.resetButton.setText(_translate("Dialog", "Reset"))
+        self.statisticsTable.setSortingEnabled(False)
+        self.okButton.setText(_translate("Dialog", "Ok"))
@@ -6,6 +6,10 @@
  * first moment to determine the peak center.
  * 
  * Hazen 09/13
+ *
+ * Added numberAndLocObjectsBatch() to analyze several frames in a
+ * single call, and numberAndLocObjectsRows() to analyze a band of
+ * rows of a frame so that large frames can be analyzed in parallel.
  * 
  * Compilation (windows):
  *  gcc -c LMMoment.c
@@ -62,6 +66,8 @@ void initialize(void);
 int isLocalMaxima(short [], int, int, int, int);
 int isPeak(short [], int, int, int, int, int);
 void numberAndLocObjects(short [], int, int, int, float [], float [], int *);
+int numberAndLocObjectsBatch(short **, int, int, int, int, float [], float [], int, int []);
+void numberAndLocObjectsRows(short [], int, int, int, int, int, float [], float [], int *);
 void peakPosition(short [], int, int, int, int, int, float *, float *);
 
 
@@ -218,12 +224,79 @@ int isPeak(short image[], int size_x, int size_y, int x, int y, int threshold)
  * returns nothing.
  */
 void numberAndLocObjects(short image[], int size_x, int size_y, int threshold, float x_arr[], float y_arr[], int *counts)
+{
+  numberAndLocObjectsRows(image, size_x, size_y, 0, size_x, threshold, x_arr, y_arr, counts);
+}
+
+/*
+ * numberAndLocObjectsBatch()
+ *
+ * Calls numberAndLocObjects() on several images.
+ *
+ * images[] : array of pointers to the images.
+ * n_images : the number of images.
+ * size_x : the size of the x dimension of the images.
+ * size_y : the size of the y dimension of the images.
+ * threshold : peak height above background ring to be considered a peak.
+ * x[] : (n_images x max_counts) array for storage of the object x locations.
+ * y[] : (n_images x max_counts) array for storage of the object y locations.
+ * max_counts : the maximum number of objects per image.
+ * counts[] : (out) the number of objects found in each image.
+ *
+ * returns the number of images in which max_counts objects were
+ *   found, these images may have more objects.
+ */
+int numberAndLocObjectsBatch(short **images, int n_images, int size_x, int size_y, int threshold, float x_arr[], float y_arr[], int max_counts, int counts[])
+{
+  int i,n_full;
+
+  n_full = 0;
+  for(i=0;i<n_images;i++){
+    counts[i] = max_counts;
+    numberAndLocObjects(images[i], size_x, size_y, threshold, &(x_arr[i*max_counts]), &(y_arr[i*max_counts]), &(counts[i]));
+    if(counts[i] == max_counts){
+      n_full++;
+    }
+  }
+
+  return n_full;
+}
+
+/*
+ * numberAndLocObjectsRows()
+ *
+ * Like numberAndLocObjects() but only objects whose center is in the
+ * rows x_start to x_end (exclusive) are found. The rest of the image is
+ * still used to determine whether or not a pixel is a peak, so the
+ * objects found in adjacent bands are the same as those found by
+ * numberAndLocObjects(), and are not duplicated.
+ *
+ * image[] : array of short integers representing an image.
+ * size_x : the size of the x dimension of the image.
+ * size_y : the size of the y dimension of the image.
+ * x_start : the first row of the band.
+ * x_end : the last row of the band (exclusive).
+ * threshold : peak height above background ring to be considered a peak.
+ * x[] : array for storage of the object x locations.
+ * y[] : array for storage of the object y locations.
+ * counts : (in) size of x,y (out) number of objects found.
+ *
+ * returns nothing.
+ */
+void numberAndLocObjectsRows(short image[], int size_x, int size_y, int x_start, int x_end, int threshold, float x_arr[], float y_arr[], int *counts)
 {
   int n,x,y;
   int mean;
 
+  if(x_start < BSIZE){
+    x_start = BSIZE;
+  }
+  if(x_end > (size_x-BSIZE)){
+    x_end = size_x-BSIZE;
+  }
+
   n = 0;
-  for(x=BSIZE;x<(size_x-BSIZE);x++){
+  for(x=x_start;x<x_end;x++){
     for(y=BSIZE;y<(size_y-BSIZE);y++){
       if(isLocalMaxima(image, size_x, size_y, x, y)){
 	mean = isPeak(image, size_x, size_y, x, y, threshold);
@@ -231,7 +304,7 @@ void numberAndLocObjects(short image[], int size_x, int size_y, int threshold, f
 	  peakPosition(image, size_x, size_y, x, y, mean, &(x_arr[n]), &(y_arr[n]));
 	  n++;
 	  if(n == *counts){
-	    x = size_x;
+	    x = x_end;
 	    y = size_y;
 	  }
 	}
@@ -3,11 +3,21 @@
 These classes render the graph / image for the spot
 counter.
 
+The STORM image is accumulated in numpy arrays (one per shutter
+color) and only converted to a pixmap by a display timer, so the
+cost of each analyzed frame is just binning its localizations and
+the memory used doesn't depend on the length of the film.
+
+The display image is an 8 bit RGB buffer. Usually the timer only
+re-colors the pixels that have new localizations, the whole image
+is only re-colored when the color scale changes.
+
 Hazen 05/17
 """
 import numpy
+import tifffile
 
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 
 class SpotWidget(QtWidgets.QWidget):
@@ -122,67 +132,155 @@ class SpotGraph(SpotWidget):
 
         
 class SpotPicture(SpotWidget):
-
+    """
+    The STORM image for a camera feed.
+    """
     def __init__(self,
                  camera_fn = None,
                  pixel_size = None,
                  scale_bar_len = None,
+                 update_interval = 200,
+                 zoom = 2.0,
                  **kwds):
+        """
+        update_interval - How often (in milliseconds) to update the pixmap.
+        zoom - The size of the image relative to the camera frame.
+        """
         super().__init__(**kwds)
-        
-        self.scale_bar_len = int(round(1.0e-3 * scale_bar_len/pixel_size))
-
-        self.scale = 2.0  # Fixed for now, but possibly something we can change.
 
-        # The final image size in pixels.
-        xp = int(self.scale * camera_fn.getParameter("x_pixels"))
-        yp = int(self.scale * camera_fn.getParameter("y_pixels"))
-
-        # For rendering an intermediate picture.
-        self.q_pixmap = QtGui.QPixmap(xp, yp)
-
-        # Figure out transform matrix.
-        #
-        # FIXME: Duplicated from qtWidgets.qtCameraGraphicsView
-        #
-        if camera_fn.getParameter("flip_horizontal"):
-            flip_lr = QtGui.QTransform(-1.0, 0.0, 0.0,
-                                       0.0, 1.0, 0.0,
-                                       xp, 0.0, 1.0)
+        self.changed = False
+        self.flip_horizontal = camera_fn.getParameter("flip_horizontal")
+        self.flip_vertical = camera_fn.getParameter("flip_vertical")
+        self.scale = zoom
+        self.scale_bar_len = int(round(1.0e-3 * self.scale * scale_bar_len/pixel_size))
+        self.transpose = camera_fn.getParameter("transpose")
+
+        # The size of the accumulation buffers in pixels, this is in
+        # camera (not display) coordinates.
+        self.xp = int(self.scale * camera_fn.getParameter("x_pixels"))
+        self.yp = int(self.scale * camera_fn.getParameter("y_pixels"))
+
+        # The number of localizations in each pixel, keyed by color.
+        self.counts = {}
+
+        # The total number of localizations and the number of pixels
+        # that have any localizations, keyed by color.
+        self.n_locs = {}
+        self.n_pixels = {}
+
+        # The saturation and color look up table of the displayed
+        # image, keyed by color.
+        self.luts = {}
+        self.saturations = {}
+
+        # The pixels (flat indices into the accumulation buffers) with
+        # new localizations since the last update.
+        self.dirty = []
+
+        # The displayed image. The QImage does not copy the data, so it
+        # changes when self.rgb changes.
+        if self.transpose:
+            [h, w] = [self.xp, self.yp]
         else:
-            flip_lr = QtGui.QTransform()
+            [h, w] = [self.yp, self.xp]
+        self.rgb = numpy.zeros((h, w, 3), dtype = numpy.uint8)
+        self.q_image = QtGui.QImage(self.rgb.data, w, h, 3*w, QtGui.QImage.Format_RGB888)
+        self.setFixedSize(w, h)
+        self.updatePixmap()
 
-        if camera_fn.getParameter("flip_vertical"):
-            flip_ud = QtGui.QTransform(1.0, 0.0, 0.0,
-                                       0.0, -1.0, 0.0,
-                                       0.0, yp, 1.0)
-        else:
-            flip_ud = QtGui.QTransform()
-
-        if camera_fn.getParameter("transpose"):
-            flip_xy = QtGui.QTransform(0.0, 1.0, 0.0,
-                                       1.0, 0.0, 0.0,
-                                       0.0, 0.0, 1.0)
-        else:
-            flip_xy = QtGui.QTransform()            
-
-        self.transform = flip_lr * flip_ud * flip_xy
-        
-        self.setFixedSize(xp, yp)
+        self.update_timer = QtCore.QTimer(self)
+        self.update_timer.setInterval(update_interval)
+        self.update_timer.timeout.connect(self.handleUpdateTimer)
+        self.update_timer.start()
 
     def clearPicture(self):
-        painter = QtGui.QPainter(self.q_pixmap)
-        color = QtGui.QColor(0,0,0)
-        painter.setPen(color)
-        painter.setBrush(color)
-        painter.drawRect(0,0,self.q_pixmap.width(),self.q_pixmap.height())
+        for color, counts in self.counts.items():
+            counts[:] = 0
+            self.n_locs[color] = 0
+            self.n_pixels[color] = 0
+        self.dirty = []
+        self.saturations = {}
+        self.rgb[:] = 0
+        self.updatePixmap()
         self.update()
 
+    def colorize(self, index):
+        """
+        Return the RGB values of the pixels at index in the (flattened)
+        accumulation buffers as a [pixels, 3] numpy array.
+        """
+        rgb = None
+        for color, counts in self.counts.items():
+            lut = self.luts[color]
+            color_rgb = numpy.take(lut, numpy.minimum(counts.ravel()[index], lut.shape[0] - 1), axis = 0)
+
+            if (len(self.counts) == 1):
+                return color_rgb
+            elif rgb is None:
+                rgb = color_rgb.astype(numpy.uint16)
+            else:
+                rgb += color_rgb
+
+        return numpy.minimum(rgb, 255).astype(numpy.uint8)
+
+    def colorLUT(self, color, saturation):
+        """
+        Return a [n, 3] numpy array with the RGB values of pixels with
+        0 to n - 1 localizations, pixels with more localizations than
+        this are saturated.
+        """
+        n = int(numpy.ceil(saturation)) + 1
+        intensity = numpy.minimum(numpy.arange(n)/saturation, 1.0)
+        return (numpy.array(color[:3])[None,:] * intensity[:,None]).astype(numpy.uint8)
+
+    def displayIndex(self, index):
+        """
+        Convert flat indices into the accumulation buffers to flat
+        indices into the displayed image, see orient().
+        """
+        [y, x] = numpy.divmod(index, self.xp)
+        if self.flip_horizontal:
+            x = self.xp - 1 - x
+        if self.flip_vertical:
+            y = self.yp - 1 - y
+        if self.transpose:
+            return x * self.yp + y
+        return y * self.xp + x
+
+    def getCounts(self):
+        """
+        Return the localizations per pixel for each color as a
+        [colors, y, x] numpy array in display orientation.
+        """
+        colors = list(self.counts)
+        if (len(colors) == 0):
+            counts = numpy.zeros((1, self.yp, self.xp), dtype = numpy.uint32)
+        else:
+            counts = numpy.stack([self.counts[color] for color in colors])
+        return [colors, self.orient(counts)]
+
+    def handleUpdateTimer(self):
+        if self.changed:
+            self.updatePixmap()
+            self.update()
+
+    def orient(self, image):
+        """
+        Flip / transpose the last two axes of image for display.
+        """
+        if self.flip_horizontal:
+            image = image[..., ::-1]
+        if self.flip_vertical:
+            image = image[..., ::-1, :]
+        if self.transpose:
+            image = numpy.swapaxes(image, -1, -2)
+        return image
+        
     def paintEvent(self, event):
 
         # Transfer to display.
         painter = QtGui.QPainter(self)
-        painter.drawPixmap(0, 0, self.q_pixmap)
+        painter.drawImage(0, 0, self.q_image)
         
         # Draw the scale bar.
         painter.setPen(QtGui.QColor(255,255,255))
@@ -190,23 +288,81 @@ class SpotPicture(SpotWidget):
         painter.drawRect(5, 5, 5 + self.scale_bar_len, 5)
 
     def savePicture(self, filename):
-        self.q_pixmap.save(filename + ".png", "PNG", -1)
-        
+        """
+        Save the picture as a PNG and the localizations per pixel as
+        a 16 bit TIF with one page per color.
+        """
+        self.updatePixmap()
+        self.q_image.save(filename + ".png", "PNG", -1)
+
+        [colors, counts] = self.getCounts()
+        counts = numpy.minimum(counts, 65535).astype(numpy.uint16)
+        with tifffile.TiffWriter(filename + ".tif") as tf:
+            for i in range(counts.shape[0]):
+
+                # Newer versions of tifffile renamed save() to write().
+                if hasattr(tf, "write"):
+                    tf.write(numpy.ascontiguousarray(counts[i]))
+                else:
+                    tf.save(numpy.ascontiguousarray(counts[i]))
+
     def updateImage(self, frame_number, locs):
 
         # Figure out color. If it is None we don't draw anything.
         color = self.colors[frame_number % self.cycle_length]
         if color is None:
             return
-        
-        x = numpy.round(self.scale*locs[0])
-        y = numpy.round(self.scale*locs[1])
-
-        painter = QtGui.QPainter(self.q_pixmap)
-        painter.setTransform(self.transform)
-        painter.setPen(QtGui.QColor(*color))
-        
-        for i in range(x.size):
-            painter.drawPoint(int(x[i]),
-                              int(y[i]))
-        self.update()
+        color = tuple(color)
+
+        if not color in self.counts:
+            self.counts[color] = numpy.zeros((self.yp, self.xp), dtype = numpy.uint32)
+            self.n_locs[color] = 0
+            self.n_pixels[color] = 0
+
+        x = numpy.round(self.scale*locs[0]).astype(numpy.int64)
+        y = numpy.round(self.scale*locs[1]).astype(numpy.int64)
+        mask = (x >= 0) & (x < self.xp) & (y >= 0) & (y < self.yp)
+        index = y[mask] * self.xp + x[mask]
+        pixels = numpy.unique(index)
+
+        counts = self.counts[color].ravel()
+        self.n_locs[color] += index.size
+        self.n_pixels[color] += numpy.count_nonzero(counts[pixels] == 0)
+        numpy.add.at(counts, index, 1)
+
+        self.dirty.append(pixels)
+        self.changed = True
+
+    def updatePixmap(self):
+        """
+        Update the displayed image. Each color is scaled so that pixels
+        with the average number of localizations (of the pixels that have
+        any) are at full brightness.
+
+        The whole image is only re-colored if the scale of one of the colors
+        changed by more than 2%, otherwise just the pixels with new
+        localizations are re-colored. Pixels without localizations are
+        black, so only the pixels with localizations are ever colored.
+        """
+        self.changed = False
+
+        recolor = False
+        for color in self.counts:
+            saturation = 1.0
+            if (self.n_pixels[color] > 0):
+                saturation = max(1.0, float(self.n_locs[color])/float(self.n_pixels[color]))
+            if not color in self.saturations or (abs(saturation - self.saturations[color]) > 0.02 * self.saturations[color]):
+                self.luts[color] = self.colorLUT(color, saturation)
+                self.saturations[color] = saturation
+                recolor = True
+
+        pixels = None
+        if recolor:
+            self.rgb[:] = 0
+            pixels = numpy.unique(numpy.concatenate([numpy.flatnonzero(x) for x in self.counts.values()]))
+        elif (len(self.dirty) > 0):
+            pixels = numpy.unique(numpy.concatenate(self.dirty))
+        self.dirty = []
+
+        if pixels is not None:
+            self.rgb.reshape(-1, 3)[self.displayIndex(pixels)] = self.colorize(pixels)
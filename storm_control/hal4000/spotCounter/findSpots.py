@@ -2,37 +2,131 @@
 """
 Analyze frames using QRunnables and QThreadPool.
 
+Frames that arrive while all the workers are busy wait in a (bounded)
+queue for their camera. When a worker becomes free it takes the next
+frame from the camera queues in turn, so one fast camera cannot starve
+the analysis of a slower camera. What happens to frames when the queue
+is full depends on the policy:
+
+ "latest" - The oldest frame in the queue is dropped.
+ "nth"    - Only every 'decimation' frame is analyzed, the other frames
+            are skipped (but not counted as dropped). The queue then
+            behaves as in "latest".
+ "all"    - The queue is not bounded, so no frames are dropped, but the
+            analysis can fall behind the camera.
+
+A worker takes up to 'batch_size' frames from a queue at a time, and
+analyzes all of them in a single call to the object finder. Frames
+larger than 'max_size' pixels are split into tiles of (at most)
+'max_size' pixels that are analyzed in parallel.
+
 Hazen 05/17
 """
+import numpy
 import time
+import traceback
+
+from collections import deque
 
 from PyQt5 import QtCore
 
+import storm_control.sc_library.halExceptions as halExceptions
+
 import storm_control.hal4000.halLib.halModule as halModule
 import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
 
 
+class SpotCounterException(halExceptions.HalException):
+    pass
+
+
 class AnalysisWorker(QtCore.QRunnable):
     """
     Runnable for performing image analysis.
     """
-    def __init__(self, **kwds):
+    def __init__(self, max_size = 0, **kwds):
         super().__init__(**kwds)
         self.aw_signaler = AnalysisWorkerSignaler()
-        self.frame_analysis = None
         self.busy = False
+        self.frame_analyses = []
+        self.locs_buffer = lmmObjectFinder.LocsBuffer()
+        self.max_size = max_size
+        self.mutex = QtCore.QMutex()
+        self.wait_condition = QtCore.QWaitCondition()
 
+    def getFrameAnalyses(self):
+        return self.frame_analyses
+    
     def isBusy(self):
-        return self.busy
+        self.mutex.lock()
+        busy = self.busy
+        self.mutex.unlock()
+        return busy
         
+    def analyze(self):
+        frames = [x.getFrame() for x in self.frame_analyses]
+        threshold = self.frame_analyses[0].getThreshold()
+
+        # Large frames are analyzed one at a time in tiles.
+        n_pixels = frames[0].image_x * frames[0].image_y
+        if (self.max_size > 0) and (n_pixels > self.max_size):
+            n_tiles = (n_pixels + self.max_size - 1)//self.max_size
+            for frame_analysis in self.frame_analyses:
+                start_time = time.perf_counter()
+                [x, y, n] = lmmObjectFinder.findObjectsTiled(frame_analysis.getFrame(),
+                                                             threshold,
+                                                             self.locs_buffer,
+                                                             n_tiles)
+                frame_analysis.setLocalizations(x, y, time.perf_counter() - start_time)
+
+        else:
+            start_time = time.perf_counter()
+            lmmObjectFinder.findObjectsBatch(frames, threshold, self.locs_buffer)
+            analysis_time = (time.perf_counter() - start_time)/len(frames)
+
+            for i, frame_analysis in enumerate(self.frame_analyses):
+                [x, y] = self.locs_buffer.getLocalizations(i)
+                frame_analysis.setLocalizations(x, y, analysis_time)
+
     def run(self):
-        self.frame_analysis.analyzeImage()
-        self.aw_signaler.analysisDone.emit(self.frame_analysis)
-        self.busy = False
+        """
+        The frames are always released and the worker is always marked as
+        done, even if the analysis failed, otherwise cleanUp() would hang.
+        """
+        try:
+            self.analyze()
+        except Exception:
+            traceback.print_exc()
+            for frame_analysis in self.frame_analyses:
+                if not frame_analysis.isAnalyzed():
+                    frame_analysis.setLocalizations(numpy.zeros(0), numpy.zeros(0), 0.0)
+        finally:
+            for frame_analysis in self.frame_analyses:
+                frame_analysis.releaseFrame()
+
+            # The mutex makes sure that the result is queued before the
+            # worker can be given more frames.
+            self.mutex.lock()
+            self.busy = False
+            self.aw_signaler.analysisDone.emit(self)
+            self.wait_condition.wakeAll()
+            self.mutex.unlock()
         
-    def setFrameAnalysis(self, frame_analysis):
-        self.frame_analysis = frame_analysis
+    def setFrameAnalyses(self, frame_analyses):
+        """
+        frame_analyses is a list of FrameAnalysis objects for frames from
+        the same camera that have the same size and threshold.
+        """
+        self.mutex.lock()
+        self.frame_analyses = frame_analyses
         self.busy = True
+        self.mutex.unlock()
+
+    def waitUntilDone(self):
+        self.mutex.lock()
+        while self.busy:
+            self.wait_condition.wait(self.mutex)
+        self.mutex.unlock()
 
 
 class AnalysisWorkerSignaler(QtCore.QObject):
@@ -47,7 +141,7 @@ class FrameAnalysis(QtCore.QObject):
     """
     This class:
      1. Stores the frame to analyze.
-     2. Does the analysis (with AnalysisWorker).
+     2. Is analyzed by an AnalysisWorker.
      3. Stores the results of the analysis.
     """
     def __init__(self,
@@ -56,48 +150,127 @@ class FrameAnalysis(QtCore.QObject):
                  threshold = None,
                  **kwds):
         super().__init__(**kwds)
+        self.analysis_time = 0.0
         self.camera_name = camera_name
         self.frame = frame
         self.locs_count = 0
+        self.queued_time = time.perf_counter()
         self.threshold = threshold
         self.x_locs = None
         self.y_locs = None
         
-    def analyzeImage(self):
-        [self.x_locs, self.y_locs, self.locs_count] = lmmObjectFinder.findObjects(self.frame,
-                                                                                  self.threshold)
-
+    def getAnalysisTime(self):
+        """
+        Return how long the analysis took in seconds.
+        """
+        return self.analysis_time
+    
     def getCameraName(self):
         return self.camera_name
     
     def getCounts(self):
         return self.locs_count
 
+    def getFrame(self):
+        return self.frame
+
     def getFrameNumber(self):
         return self.frame.frame_number
+
+    def getLatency(self):
+        """
+        Return the time in seconds from when the frame was queued to now.
+        """
+        return time.perf_counter() - self.queued_time
         
     def getLocalizations(self):
-        return [self.x_locs[:self.locs_count],
-                self.y_locs[:self.locs_count]]
+        return [self.x_locs, self.y_locs]
+
+    def getThreshold(self):
+        return self.threshold
+
+    def isAnalyzed(self):
+        return self.x_locs is not None
+
+    def releaseFrame(self):
+        """
+        Let the camera re-use the frame memory. Note that after
+        this only the frame meta-information is still valid.
+        """
+        self.frame.release()
+
+    def setLocalizations(self, x_locs, y_locs, analysis_time):
+        """
+        x_locs and y_locs are copied as they are views into the worker's buffer.
+        """
+        self.analysis_time = analysis_time
+        self.locs_count = x_locs.size
+        self.x_locs = x_locs.copy()
+        self.y_locs = y_locs.copy()
+
+
+class AnalysisStatistics(object):
+    """
+    Analysis statistics for a single camera.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.analysis_time = 0.0
+        self.analyzed = 0
+        self.decimated = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.total = 0
+
+    def addAnalysis(self, frame_analysis):
+        latency = frame_analysis.getLatency()
+        self.analysis_time += frame_analysis.getAnalysisTime()
+        self.analyzed += 1
+        self.latency += latency
+        if (latency > self.max_latency):
+            self.max_latency = latency
+
+    def getStatistics(self):
+        """
+        Return the statistics as a dictionary, times are in milliseconds.
+        """
+        n = max(self.analyzed, 1)
+        return {"analysis_time" : 1.0e3 * self.analysis_time/n,
+                "analyzed" : self.analyzed,
+                "decimated" : self.decimated,
+                "dropped" : self.dropped,
+                "latency" : 1.0e3 * self.latency/n,
+                "max_latency" : 1.0e3 * self.max_latency,
+                "total" : self.total}
         
 
 class SpotCounter(QtCore.QObject):
     imageProcessed = QtCore.pyqtSignal(object)
 
-    def __init__(self, max_threads = None, max_size = 0, **kwds):
+    def __init__(self, batch_size = 1, decimation = 1, max_queue = 2, max_threads = None, max_size = 0, policy = "latest", **kwds):
         super().__init__(**kwds)
 
-        self.dropped = 0
-        self.max_size = max_size
+        if not policy in ["all", "latest", "nth"]:
+            raise SpotCounterException("Unknown spot counter policy '" + policy + "'")
+        
+        self.batch_size = max(1, batch_size)
+        self.decimation = max(1, decimation)
+        self.idle_workers = deque()
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.queues = {}
+        self.statistics = {}
         self.threadpool = halModule.threadpool
-        self.total = 0
+        self.turn = 0
         self.workers = []
 
         # Create analysis workers.
         for i in range(max_threads):
-            aw = AnalysisWorker()
+            aw = AnalysisWorker(max_size = max_size)
             aw.setAutoDelete(False)
             aw.aw_signaler.analysisDone.connect(self.handleAnalysisDone)
+            self.idle_workers.append(aw)
             self.workers.append(aw)
 
         # Initialize object finder.
@@ -105,48 +278,96 @@ class SpotCounter(QtCore.QObject):
             
     def cleanUp(self):
 
+        # Let go of the frames that are waiting.
+        for queue in self.queues.values():
+            while queue:
+                queue.popleft().releaseFrame()
+
         # Wait for workers to finish.
-        still_busy = True
-        while still_busy:
-            all_busy = False
-            for worker in self.workers:
-                if worker.isBusy():
-                    all_busy = True
-                    break
-            still_busy = all_busy
-            time.sleep(0.1)
+        for worker in self.workers:
+            worker.waitUntilDone()
         
         # Object finder cleanup.
         lmmObjectFinder.cleanUp()
 
         # Print statistics.
-        print("> spot counter dropped", self.dropped, "images out of", self.total, "total images")
+        for camera_name in sorted(self.statistics):
+            stats = self.getStatistics(camera_name)
+            print("> spot counter", camera_name, "analyzed", stats["analyzed"], "dropped", stats["dropped"],
+                  "skipped", stats["decimated"], "images out of", stats["total"], "total images")
+
+    def getStatistics(self, camera_name):
+        """
+        Return the statistics for camera_name, or None if we have not
+        had any frames from this camera.
+        """
+        if camera_name in self.statistics:
+            return self.statistics[camera_name].getStatistics()
 
-    def handleAnalysisDone(self, frame_analysis):
-        self.imageProcessed.emit(frame_analysis)
+    def handleAnalysisDone(self, worker):
+        frame_analyses = worker.getFrameAnalyses()
+        self.idle_workers.append(worker)
+        self.startWorkers()
+        for frame_analysis in frame_analyses:
+            self.statistics[frame_analysis.getCameraName()].addAnalysis(frame_analysis)
+            self.imageProcessed.emit(frame_analysis)
         
     def newFrameToAnalyze(self, camera_name, frame, threshold):
+
+        if not camera_name in self.queues:
+            self.queues[camera_name] = deque()
+            self.statistics[camera_name] = AnalysisStatistics()
+        queue = self.queues[camera_name]
+        stats = self.statistics[camera_name]
         
-        # Check if the current camera image is small
-        # enough that we can analyze it.
-        if ((frame.image_x * frame.image_y) > self.max_size):
+        stats.total += 1
+
+        if (self.policy == "nth") and ((frame.frame_number % self.decimation) != 0):
+            stats.decimated += 1
             return
-        
-        self.total += 1
 
-        # Check if there is a thread available to analyze the image.
-        was_dropped = True
-        for worker in self.workers:
-            if not worker.isBusy():
-                worker.setFrameAnalysis(FrameAnalysis(camera_name = camera_name,
-                                                      frame = frame,
-                                                      threshold = threshold))
-                self.threadpool.start(worker)
-                was_dropped = False
-                break
-
-        if was_dropped:
-            self.dropped += 1
+        # Make room in the queue.
+        if (self.policy != "all") and (len(queue) >= self.max_queue):
+            queue.popleft().releaseFrame()
+            stats.dropped += 1
+
+        frame.acquire()
+        queue.append(FrameAnalysis(camera_name = camera_name,
+                                   frame = frame,
+                                   threshold = threshold))
+        self.startWorkers()
+
+    def startWorkers(self):
+        """
+        Give frames to the idle workers, taking (up to batch_size)
+        frames from each camera's queue in turn. A batch ends at the
+        first frame with a different size or threshold.
+        """
+        camera_names = sorted(self.queues)
+        while self.idle_workers:
+            frame_analyses = []
+            for i in range(len(camera_names)):
+                queue = self.queues[camera_names[(self.turn + i) % len(camera_names)]]
+                if queue:
+                    frame_analyses.append(queue.popleft())
+                    first = frame_analyses[0].getFrame()
+                    threshold = frame_analyses[0].getThreshold()
+                    while queue and (len(frame_analyses) < self.batch_size):
+                        frame = queue[0].getFrame()
+                        if (frame.image_x != first.image_x) or (frame.image_y != first.image_y):
+                            break
+                        if (queue[0].getThreshold() != threshold):
+                            break
+                        frame_analyses.append(queue.popleft())
+                    self.turn = (self.turn + i + 1) % len(camera_names)
+                    break
+
+            if (len(frame_analyses) == 0):
+                return
+
+            worker = self.idle_workers.popleft()
+            worker.setFrameAnalyses(frame_analyses)
+            self.threadpool.start(worker)
 
 
 #
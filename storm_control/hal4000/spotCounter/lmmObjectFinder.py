@@ -3,11 +3,23 @@
 Python interface to the LMMoment object finder. This object finder
 works by indentifying local maxima, then computing their first moment.
 
-Note that the maximum number of objects found per image is limited to 1000.
+findObjectsBatch() analyzes several frames in a single call to the C
+library (ctypes releases the GIL for the duration of the call). The
+results go into a LocsBuffer, which the caller can re-use for the next
+batch. The number of objects per frame is not limited, if a frame has
+more objects than the buffer can hold the buffer is enlarged and that
+frame is analyzed again.
+
+findObjectsTiled() splits a (large) frame into bands of rows which are
+analyzed in parallel by a pool of threads. Each band only finds the
+objects whose center is in the band, but uses the pixels in the
+adjacent bands, so the results are the same as analyzing the whole
+frame and there are no duplicate objects to remove.
 
 Hazen 09/13
 """
 
+import concurrent.futures
 import ctypes
 import numpy
 from numpy.ctypeslib import ndpointer
@@ -16,8 +28,61 @@ import sys
 
 lmmoment = False
 
+# Older versions of the library don't have numberAndLocObjectsBatch()
+# or numberAndLocObjectsRows().
+has_batch = False
+
 max_locs = 1000
 
+# The number of threads to use in findObjectsTiled().
+n_threads = min(os.cpu_count() or 1, 8)
+
+thread_pool = None
+
+
+class LocsBuffer(object):
+    """
+    Storage for the results of findObjectsBatch().
+    """
+    def __init__(self, n_frames = 1, max_locs = max_locs, **kwds):
+        super().__init__(**kwds)
+        self.counts = numpy.zeros(n_frames, dtype = numpy.int32)
+        self.max_locs = max_locs
+        self.x = numpy.zeros((n_frames, max_locs), dtype = numpy.float32)
+        self.y = numpy.zeros((n_frames, max_locs), dtype = numpy.float32)
+
+    def getLocalizations(self, index):
+        """
+        Return [x, y] for frame index, these are views into the buffer.
+        """
+        n = self.counts[index]
+        return [self.x[index,:n], self.y[index,:n]]
+
+    def grow(self, max_locs):
+        """
+        Increase the number of objects per frame that the buffer can
+        hold to max_locs, keeping the current contents.
+        """
+        if (max_locs > self.max_locs):
+            n_frames = self.counts.size
+            for name in ["x", "y"]:
+                old = getattr(self, name)
+                new = numpy.zeros((n_frames, max_locs), dtype = numpy.float32)
+                new[:,:self.max_locs] = old
+                setattr(self, name, new)
+            self.max_locs = max_locs
+        
+    def resize(self, n_frames):
+        """
+        Make sure the buffer can hold results for n_frames frames, the
+        buffer is only ever made larger and the contents are lost.
+        """
+        if (n_frames > self.counts.size):
+            self.counts = numpy.zeros(n_frames, dtype = numpy.int32)
+            self.x = numpy.zeros((n_frames, self.max_locs), dtype = numpy.float32)
+            self.y = numpy.zeros((n_frames, self.max_locs), dtype = numpy.float32)
+
+
 #
 # Called at program shutdown to free arrays allocated in C.
 #
@@ -29,7 +94,7 @@ def cleanUp():
 # initialization in C.
 #
 def initialize():
-    global lmmoment
+    global has_batch, lmmoment
 
     directory = os.path.dirname(__file__)
     if (directory == ""):
@@ -51,6 +116,29 @@ def initialize():
                                              ndpointer(dtype=numpy.float32),
                                              ndpointer(dtype=numpy.float32),
                                              ctypes.c_void_p]
+    try:
+        lmmoment.numberAndLocObjectsBatch.argtypes = [ctypes.c_void_p,
+                                                      ctypes.c_int,
+                                                      ctypes.c_int,
+                                                      ctypes.c_int,
+                                                      ctypes.c_int,
+                                                      ctypes.c_void_p,
+                                                      ctypes.c_void_p,
+                                                      ctypes.c_int,
+                                                      ndpointer(dtype=numpy.int32)]
+        lmmoment.numberAndLocObjectsBatch.restype = ctypes.c_int
+        lmmoment.numberAndLocObjectsRows.argtypes = [ndpointer(dtype=numpy.uint16),
+                                                     ctypes.c_int,
+                                                     ctypes.c_int,
+                                                     ctypes.c_int,
+                                                     ctypes.c_int,
+                                                     ctypes.c_int,
+                                                     ndpointer(dtype=numpy.float32),
+                                                     ndpointer(dtype=numpy.float32),
+                                                     ctypes.c_void_p]
+        has_batch = True
+    except AttributeError:
+        print("LMMoment library is out of date, please re-compile.")
     lmmoment.initialize()
 
 
@@ -58,17 +146,126 @@ def findObjects(frame, threshold):
     """
     Find the objects in the image.
     """
-    x = numpy.zeros((max_locs), dtype = numpy.float32)
-    y = numpy.zeros((max_locs), dtype = numpy.float32)
-    n = ctypes.c_int(max_locs)
-    lmmoment.numberAndLocObjects(numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16),
-                                 frame.image_y,
-                                 frame.image_x,
+    buffer = LocsBuffer()
+    findObjectsBatch([frame], threshold, buffer)
+    return [buffer.x[0], buffer.y[0], int(buffer.counts[0])]
+
+
+def findObjectsBatch(frames, threshold, buffer):
+    """
+    Find the objects in a list of frames, which must all be the same
+    size. The results are stored in buffer (a LocsBuffer). Returns
+    the number of objects in each frame.
+    """
+    images = []
+    for frame in frames:
+        images.append(numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16))
+    buffer.resize(len(images))
+
+    [size_x, size_y] = [frames[0].image_y, frames[0].image_x]
+    if has_batch:
+        runBatch(images, 0, size_x, size_y, threshold, buffer)
+    else:
+        for i, image in enumerate(images):
+            runSingle(image, i, size_x, size_y, threshold, buffer)
+
+    # Re-analyze any frames that filled the buffer with a larger buffer.
+    todo = [i for i in range(len(images)) if (buffer.counts[i] == buffer.max_locs)]
+    while (len(todo) > 0):
+        buffer.grow(2 * buffer.max_locs)
+        for i in todo:
+            runSingle(images[i], i, size_x, size_y, threshold, buffer)
+        todo = [i for i in todo if (buffer.counts[i] == buffer.max_locs)]
+
+    return buffer.counts[:len(images)]
+
+
+def findObjectsTiled(frame, threshold, buffer, n_tiles):
+    """
+    Find the objects in a frame by splitting it into n_tiles bands of
+    rows that are analyzed in parallel. buffer (a LocsBuffer) is used
+    for the results of each band.
+
+    Returns [x, y, n] like findObjects().
+    """
+    if not has_batch:
+        [x, y, n] = findObjects(frame, threshold)
+        return [x[:n], y[:n], n]
+
+    image = numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16)
+    rows = frame.image_y
+    n_tiles = max(1, min(n_tiles, rows))
+    edges = [(rows * i)//n_tiles for i in range(n_tiles + 1)]
+    buffer.resize(n_tiles)
+
+    def doTile(i):
+        n = ctypes.c_int(buffer.max_locs)
+        lmmoment.numberAndLocObjectsRows(image,
+                                         rows,
+                                         frame.image_x,
+                                         edges[i],
+                                         edges[i+1],
+                                         threshold,
+                                         buffer.x[i],
+                                         buffer.y[i],
+                                         ctypes.byref(n))
+        buffer.counts[i] = n.value
+
+    # Re-analyze any bands that filled the buffer with a larger buffer.
+    todo = list(range(n_tiles))
+    while (len(todo) > 0):
+        pool = getThreadPool()
+        for future in [pool.submit(doTile, i) for i in todo]:
+            future.result()
+        todo = [i for i in todo if (buffer.counts[i] == buffer.max_locs)]
+        if (len(todo) > 0):
+            buffer.grow(2 * buffer.max_locs)
+
+    x = numpy.concatenate([buffer.getLocalizations(i)[0] for i in range(n_tiles)])
+    y = numpy.concatenate([buffer.getLocalizations(i)[1] for i in range(n_tiles)])
+    return [x, y, x.size]
+
+
+def getThreadPool():
+    """
+    Return the thread pool used by findObjectsTiled().
+    """
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers = n_threads)
+    return thread_pool
+
+
+def runBatch(images, start, size_x, size_y, threshold, buffer):
+    """
+    Analyze images with a single call to the C library, storing the
+    results starting at frame 'start' in buffer.
+    """
+    pointers = (ctypes.c_void_p * len(images))(*[image.ctypes.data for image in images])
+    lmmoment.numberAndLocObjectsBatch(pointers,
+                                      len(images),
+                                      size_x,
+                                      size_y,
+                                      threshold,
+                                      buffer.x[start:].ctypes.data,
+                                      buffer.y[start:].ctypes.data,
+                                      buffer.max_locs,
+                                      buffer.counts[start:start + len(images)])
+
+    
+def runSingle(image, index, size_x, size_y, threshold, buffer):
+    """
+    Analyze a single image, storing the results as frame 'index' in buffer.
+    """
+    n = ctypes.c_int(buffer.max_locs)
+    lmmoment.numberAndLocObjects(image,
+                                 size_x,
+                                 size_y,
                                  threshold,
-                                 x,
-                                 y,
+                                 buffer.x[index],
+                                 buffer.y[index],
                                  ctypes.byref(n))
-    return [x, y, n.value]
+    buffer.counts[index] = n.value
 
 
 # testing
@@ -5,6 +5,11 @@ camera. It uses a fairly simple object finder. It's purpose is to
 provide the user with a rough idea of the quality of the data
 that they are taking.
 
+How frames are scheduled for analysis is set by the 'policy',
+'max_queue', 'decimation' and 'batch_size' configuration parameters, see
+findSpots.py. The dialog shows how many frames were analyzed,
+dropped or skipped and the analysis latency.
+
 Hazen 05/17
 """
 
@@ -37,6 +42,7 @@ class Analyzer(QtCore.QObject):
     def __init__(self,
                  camera_fn = None,
                  parameters = None,
+                 picture_zoom = None,
                  pixel_size = None,
                  shutters_info = None,
                  spot_counter = None,
@@ -52,7 +58,8 @@ class Analyzer(QtCore.QObject):
         self.spot_picture = displaySpots.SpotPicture(camera_fn = camera_fn,
                                                      pixel_size = pixel_size,
                                                      scale_bar_len = parameters.get("scale_bar_len"),
-                                                     shutters_info = shutters_info)
+                                                     shutters_info = shutters_info,
+                                                     zoom = picture_zoom)
 
         self.camera_fn.newFrame.connect(self.handleNewFrame)
         self.spot_counter.imageProcessed.connect(self.handleProcessedImage)
@@ -72,6 +79,9 @@ class Analyzer(QtCore.QObject):
 
     def getSpotPicture(self):
         return self.spot_picture
+
+    def getStatistics(self):
+        return self.spot_counter.getStatistics(self.camera_fn.getCameraName())
     
     def handleNewFrame(self, frame):
         self.spot_counter.newFrameToAnalyze(self.camera_fn.getCameraName(),
@@ -139,6 +149,15 @@ class SpotCounterView(halDialog.HalDialog):
 
         self.graph_layout = QtWidgets.QHBoxLayout(self.ui.graphFrame)
         self.graph_layout.setContentsMargins(0,0,0,0)
+
+        # Analysis statistics.
+        self.ui.statsLabel = QtWidgets.QLabel(self)
+        self.ui.horizontalLayout.insertWidget(1, self.ui.statsLabel)
+
+        self.stats_timer = QtCore.QTimer(self)
+        self.stats_timer.setInterval(1000)
+        self.stats_timer.timeout.connect(self.handleStatsTimer)
+        self.stats_timer.start()
         
         self.setEnabled(False)
 
@@ -167,6 +186,19 @@ class SpotCounterView(halDialog.HalDialog):
             analyzer.setMaxSpots(new_max)
         self.parameters.setv("max_spots", new_max)
 
+    def handleStatsTimer(self):
+        if self.isVisible() and (self.cur_analyzer is not None):
+            stats = self.cur_analyzer.getStatistics()
+            if stats is None:
+                self.ui.statsLabel.setText("")
+            else:
+                text = "{0:d}/{1:d} frames, {2:d} dropped, {3:d} skipped, latency {4:.1f}ms"
+                self.ui.statsLabel.setText(text.format(stats["analyzed"],
+                                                       stats["total"],
+                                                       stats["dropped"],
+                                                       stats["decimated"],
+                                                       stats["latency"]))
+
     def handleTotalCount(self, total_count):
         self.ui.countsLabel1.setText(str(total_count))
         self.ui.countsLabel2.setText(str(total_count))
@@ -208,17 +240,25 @@ class SpotCounter(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["changing parameters", "configuration", "configure1",
+                        "new parameters", "show", "start", "start film", "stop film"])
         self.analyzers = []
         self.basename = None
         self.feed_names = []
         self.number_fn_requested = 0
+        self.picture_zoom = None
         self.pixel_size = 0.1
         self.shutters_info = None
 
         configuration = module_params.get("configuration")
+        self.picture_zoom = configuration.get("picture_zoom", 2.0)
 
-        self.spot_counter = findSpots.SpotCounter(max_threads = configuration.get("max_threads"),
-                                                  max_size = configuration.get("max_size"))
+        self.spot_counter = findSpots.SpotCounter(batch_size = configuration.get("batch_size", 4),
+                                                  decimation = configuration.get("decimation", 1),
+                                                  max_queue = configuration.get("max_queue", 8),
+                                                  max_threads = configuration.get("max_threads"),
+                                                  max_size = configuration.get("max_size"),
+                                                  policy = configuration.get("policy", "latest"))
 
         self.view = SpotCounterView(module_name = self.module_name,
                                     configuration = configuration)
@@ -274,6 +314,7 @@ class SpotCounter(halModule.HalModule):
                 if fn.isCamera():
                     self.analyzers.append(Analyzer(camera_fn = fn,
                                                    parameters = self.parameters,
+                                                   picture_zoom = self.picture_zoom,
                                                    pixel_size = self.pixel_size,
                                                    shutters_info = self.shutters_info,
                                                    spot_counter = self.spot_counter))
@@ -67,6 +67,18 @@ class FindSum(TestActionTCP):
                                                  test_mode = self.test_mode)
 
         
+class GetMessageStatistics(TestActionTCP):
+    """
+    Query HAL for the message profiling statistics.
+    """
+    def __init__(self, reset = False, step = None, **kwds):
+        super().__init__(**kwds)
+        self.tcp_message = tcpMessage.TCPMessage(message_type = "Get Message Statistics",
+                                                 message_data = {"reset" : reset,
+                                                                 "step" : step},
+                                                 test_mode = self.test_mode)
+
+
 class GetMosaicSettings(TestActionTCP):
     """
     Query HAL for the current mosaic settings.
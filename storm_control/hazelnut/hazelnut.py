@@ -25,7 +25,7 @@ import qtdesigner.hazelnut_ui as hazelnutUi
 
 
 class DirObject(object):
-    movie_extensions = (".dax", ".inf", ".off", ".png", ".power", ".spe", ".tif", ".xml")
+    movie_extensions = (".dax", ".inf", ".lck", ".off", ".png", ".power", ".spe", ".tif", ".xml")
     """
     A class for doing several things.
     1. Source directory:
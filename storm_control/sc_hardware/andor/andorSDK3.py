@@ -106,6 +106,27 @@ def getFloatRange(handle, command):
 
     return [success_min and success_max, float_min.value, float_max.value]
 
+def getMetadataTimestamp(buffer_ptr, buffer_size):
+    """
+    Returns the timestamp (in clock ticks) from the metadata at the end
+    of a frame buffer, or None if there is no timestamp. The metadata is
+    a series of blocks, each of which is the block data followed by the
+    CID (4 bytes) and the length of the data plus the CID (4 bytes).
+    """
+    end = buffer_ptr + buffer_size
+    while (end > buffer_ptr + 8):
+        length = ctypes.c_uint32.from_address(end - 4).value
+        cid = ctypes.c_uint32.from_address(end - 8).value
+        start = end - 4 - length
+        if (cid == 1):
+            return ctypes.c_uint64.from_address(start).value
+
+        # The frame data (CID 0) is the first block.
+        if (cid == 0) or (length < 4):
+            break
+        end = start
+    return None
+
 def getInteger(handle, command):
     read_int = ctypes.c_longlong()
     if check(sdk3.AT_GetInt(handle, 
@@ -249,7 +270,9 @@ class AndorFrameData(object):
     
     def __init__(self, size = None, **kwds):
         super().__init__(**kwds)
-        
+
+        self.hw_frame_number = None
+        self.hw_timestamp = None
         self.np_array = numpy.ascontiguousarray(numpy.empty(size, dtype = numpy.uint16))
         self.size = size
 
@@ -298,14 +321,17 @@ class SDK3Camera(object):
                                      "SimplePreAmpGainControl",
                                      "TemperatureStatus",
                                      "TriggerMode"])
+        self.clock_frequency = None
         self.frame_bytes = 0
         self.frame_data = []
+        self.frame_period = None
         self.frame_data_cur = 0
         self.frame_x = 0
         self.frame_y = 0
         self.pixel_encoding = ""
         self.raw_data = []
         self.stride = 0
+        self.timestamp_zero = None
 
         check(sdk3.AT_InitialiseLibrary(), "AT_InitializeLibrary")
         check(sdk3_utility.AT_InitialiseUtilityLibrary(), "AT_InitialiseUtilityLibrary")
@@ -313,6 +339,24 @@ class SDK3Camera(object):
 
     def captureSetup(self):
 
+        #
+        # Add the frame timestamp to the buffers, if the camera supports this.
+        # This has to be done first as it changes the size of the buffers.
+        #
+        # The camera does not provide a frame counter, but if it is using
+        # it's internal trigger we can figure out the frame number from
+        # the timestamp.
+        #
+        self.clock_frequency = None
+        self.frame_period = None
+        self.timestamp_zero = None
+        if self.hasFeature("MetadataEnable") and self.hasFeature("MetadataTimestamp"):
+            setBoolean(self.camera_handle, "MetadataEnable", True)
+            setBoolean(self.camera_handle, "MetadataTimestamp", True)
+            self.clock_frequency = float(getInteger(self.camera_handle, "TimestampClockFrequency"))
+            if (getEnumeratedString(self.camera_handle, "TriggerMode") == "Internal"):
+                self.frame_period = 1.0/getFloat(self.camera_handle, "FrameRate")
+
         # Get current capture size.
         frame_x = self.getProperty("AOIWidth", "int")
         frame_y = self.getProperty("AOIHeight", "int")
@@ -367,6 +411,7 @@ class SDK3Camera(object):
                                                 ctypes.c_wchar_p("Mono16")),
                   "AT_ConvertBuffer")
 
+            self.setFrameStamps(self.frame_data[self.frame_data_cur], current_buffer.value, buffer_size.value)
             frames.append(self.frame_data[self.frame_data_cur])
 
             # Update current frame.
@@ -450,6 +495,26 @@ class SDK3Camera(object):
                 print("Unknown type", ptype, "for", pname)
         
 
+    def setFrameStamps(self, frame_data, buffer_ptr, buffer_size):
+        """
+        Set the frame number and timestamp (in seconds) using the frame
+        metadata. These are used by HAL to check for lost frames.
+        """
+        frame_data.hw_frame_number = None
+        frame_data.hw_timestamp = None
+        if self.clock_frequency is None:
+            return
+
+        ticks = getMetadataTimestamp(buffer_ptr, buffer_size)
+        if ticks is None:
+            return
+
+        if self.timestamp_zero is None:
+            self.timestamp_zero = ticks
+        frame_data.hw_timestamp = float(ticks - self.timestamp_zero)/self.clock_frequency
+        if self.frame_period is not None:
+            frame_data.hw_frame_number = int(round(frame_data.hw_timestamp/self.frame_period))
+
     def shutdown(self):
         check(sdk3.AT_Close(self.camera_handle), "AT_Close")
         check(sdk3.AT_FinaliseLibrary(), "AT_FinalizeLibrary")
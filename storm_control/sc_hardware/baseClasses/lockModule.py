@@ -52,6 +52,22 @@ class QPDFunctionalityMixin(LockFunctionalityMixin):
         
     def getType(self):
         return "qpd"
+
+    def haveSynchronousRead(self):
+        """
+        Return True/False if the QPD supports readOffset(). QPDs that do
+        can be polled by the focus lock engine thread.
+        """
+        return False
+
+    def readOffset(self):
+        """
+        Perform a reading & return the current QPD state (the same 
+        dictionary as the qpdUpdate signal) in the calling thread, 
+        or None if the QPD cannot be read. This does not emit the
+        qpdUpdate signal.
+        """
+        pass
     
 
 class QPDCameraFunctionalityMixin(QPDFunctionalityMixin):
@@ -124,6 +140,15 @@ class ZStageFunctionalityMixin(LockFunctionalityMixin):
         Typically only used while filming to z scans.
         """
         return False
+
+    def isThreadSafe(self):
+        """
+        Return True/False if the stage can be moved from the focus lock
+        engine thread while HAL's main thread is also using it. Stages
+        that don't say that they are thread safe can't be used with the
+        focus lock engine.
+        """
+        return False
     
     def recenter(self):
         self.goAbsolute(self.getCenterPosition())
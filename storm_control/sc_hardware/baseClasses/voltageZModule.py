@@ -29,6 +29,10 @@ class VoltageZFunctionality(hardwareModule.HardwareFunctionality, lockModule.ZSt
           we want?
 
     FIXME: The stage will appear to stop moving during filming.
+
+    Note: This is not thread safe (so it can't be used with the focus lock
+          engine) as the DAQ can start using the analog line for filming
+          between our amFilming() check and the output.
     """
     zStagePosition = QtCore.pyqtSignal(float)
 
@@ -37,25 +37,60 @@ class CoherentLaserFunctionality(amplitudeModule.AmplitudeFunctionalityBuffered)
 class CoherentModule(amplitudeModule.AmplitudeModule):
     """
     The functionality name is just the module name.
-    """    
+
+    The lasers are opened in initModule(), this is safe to do in
+    parallel with the other modules as each laser has its own serial
+    port. The functionality is created in the main thread at 'configure1'.
+    """
+    parallel_init = True
+    
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
         self.film_mode = False
         self.laser = None
         self.laser_functionality = None
+        self.power_range = None
 
         configuration = module_params.get("configuration")
+        self.serial_port = configuration.get("port")
         self.used_during_filming = configuration.get("used_during_filming")
 
     def cleanUp(self, qt_settings):
         if self.laser_functionality is not None:
             self.laser.shutDown()
 
+    def createLaser(self):
+        """
+        Override with laser specific creation.
+        """
+        pass
+
     def getFunctionality(self, message):
        if (message.getData()["name"] == self.module_name) and (self.laser_functionality is not None):
            message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
                                                              data = {"functionality" : self.laser_functionality}))
 
+    def initModule(self):
+        self.laser = self.createLaser()
+        if self.laser.getStatus():
+            self.power_range = self.laser.getPowerRange()
+        else:
+            self.laser = None
+
+    def processMessage(self, message):
+
+        if message.isType("configure1"):
+            if self.laser is not None:
+                [pmin, pmax] = self.power_range
+                self.laser_functionality = CoherentLaserFunctionality(device_mutex = self.device_mutex,
+                                                                      display_normalized = True,
+                                                                      laser = self.laser,
+                                                                      minimum = 0,
+                                                                      maximum = int(100.0 * pmax),
+                                                                      used_during_filming = self.used_during_filming)
+
+        super().processMessage(message)
+        
     def setExtControl(self, state):
         self.device_mutex.lock()
         self.laser.setExtControl(state)
@@ -78,46 +113,14 @@ class CoherentModule(amplitudeModule.AmplitudeModule):
 
 
 class CoherentCube(CoherentModule):
-    
-    def __init__(self, module_params = None, **kwds):
-        kwds["module_params"] = module_params
-        super().__init__(**kwds)
-
-        serial_port = module_params.get("configuration").get("port")
 
+    def createLaser(self):
         import storm_control.sc_hardware.coherent.cube as cube
-        self.laser = cube.Cube(port = serial_port)
-
-        if self.laser.getStatus():
-            [pmin, pmax] = self.laser.getPowerRange()
-            self.laser_functionality = CoherentLaserFunctionality(device_mutex = self.device_mutex,
-                                                                  display_normalized = True,
-                                                                  laser = self.laser,
-                                                                  minimum = 0,
-                                                                  maximum = int(100.0 * pmax),
-                                                                  used_during_filming = self.used_during_filming)
-        else:
-            self.laser = None
+        return cube.Cube(port = self.serial_port)
 
 
 class CoherentObis(CoherentModule):
-    
-    def __init__(self, module_params = None, **kwds):
-        kwds["module_params"] = module_params
-        super().__init__(**kwds)
-
-        serial_port = module_params.get("configuration").get("port")
 
+    def createLaser(self):
         import storm_control.sc_hardware.coherent.obis as obis
-        self.laser = obis.Obis(port = serial_port)
-
-        if self.laser.getStatus():
-            [pmin, pmax] = self.laser.getPowerRange()
-            self.laser_functionality = CoherentLaserFunctionality(device_mutex = self.device_mutex,
-                                                                  display_normalized = True,
-                                                                  laser = self.laser,
-                                                                  minimum = 0,
-                                                                  maximum = int(100.0 * pmax),
-                                                                  used_during_filming = self.used_during_filming)
-        else:
-            self.laser = None            
+        return obis.Obis(port = self.serial_port)
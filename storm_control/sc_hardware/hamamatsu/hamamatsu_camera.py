@@ -125,6 +125,15 @@ class DCAMBUF_ATTACH(ctypes.Structure):
             ("buffer", ctypes.POINTER(ctypes.c_void_p)),
             ("buffercount", ctypes.c_int32)]
 
+## DCAM_TIMESTAMP
+#
+# The dcam timestamp structure
+#
+class DCAM_TIMESTAMP(ctypes.Structure):
+    _fields_ = [("sec", ctypes.c_uint32),
+            ("microsec", ctypes.c_int32)]
+
+
 ## DCAMBUF_FRAME
 #
 # The dcam buffer frame structure
@@ -141,7 +150,7 @@ class DCAMBUF_FRAME(ctypes.Structure):
             ("height", ctypes.c_int32),
             ("left", ctypes.c_int32),
             ("top", ctypes.c_int32),
-            ("timestamp", ctypes.c_int32),
+            ("timestamp", DCAM_TIMESTAMP),
             ("framestamp", ctypes.c_int32),
             ("camerastamp", ctypes.c_int32)]
 
@@ -234,6 +243,8 @@ class HCamData(object):
         Create a data object of the appropriate size.
         """
         super().__init__(**kwds)
+        self.hw_frame_number = None
+        self.hw_timestamp = None
         self.np_array = numpy.ascontiguousarray(numpy.empty(int(size/2), dtype=numpy.uint16))
         self.size = size
 
@@ -275,6 +286,7 @@ class HamamatsuCamera(object):
         self.frame_bytes = 0
         self.frame_x = 0
         self.frame_y = 0
+        self.hcam_data = {}
         self.last_frame_number = 0
         self.properties = None
         self.max_backlog = 0
@@ -402,18 +414,18 @@ class HamamatsuCamera(object):
         frames = []
         for n in self.newFrames():
 
-            paramlock = DCAMBUF_FRAME(
-                    0, 0, 0, n, None, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-            paramlock.size = ctypes.sizeof(paramlock)	
-
             # Lock the frame in the camera buffer & get address.
-            self.checkStatus(dcam.dcambuf_lockframe(self.camera_handle,
-                                                ctypes.byref(paramlock)),
-                             "dcambuf_lockframe")
-
-            # Create storage for the frame & copy into this storage.
-            hc_data = HCamData(self.frame_bytes)
+            paramlock = self.lockFrame(n)
+
+            # Copy into the storage for this buffer. The storage is
+            # re-used, so the frame data is only valid until the camera
+            # wraps around to this buffer again. HAL copies the data into
+            # it's frame pool so this is not a problem there.
+            if not (n in self.hcam_data) or (self.hcam_data[n].size != self.frame_bytes):
+                self.hcam_data[n] = HCamData(self.frame_bytes)
+            hc_data = self.hcam_data[n]
             hc_data.copyData(paramlock.buf)
+            self.setFrameStamps(hc_data, paramlock)
 
             frames.append(hc_data)
 
@@ -588,6 +600,20 @@ class HamamatsuCamera(object):
         else:
             return False
 
+    def lockFrame(self, n):
+        """
+        Lock frame n in the camera buffer, this returns a DCAMBUF_FRAME
+        structure with the address of the frame data as well as the
+        frame's timestamp and framestamp (the camera's frame count).
+        """
+        paramlock = DCAMBUF_FRAME(
+                0, 0, 0, n, None, 0, 0, 0, 0, 0, 0, DCAM_TIMESTAMP(0, 0), 0, 0)
+        paramlock.size = ctypes.sizeof(paramlock)
+        self.checkStatus(dcam.dcambuf_lockframe(self.camera_handle,
+                                                ctypes.byref(paramlock)),
+                         "dcambuf_lockframe")
+        return paramlock
+
     def newFrames(self):
         """
         Return a list of the ids of all the new frames since the last check.
@@ -650,6 +676,14 @@ class HamamatsuCamera(object):
 
         return new_frames
 
+    def setFrameStamps(self, hc_data, paramlock):
+        """
+        Copy the frame number and timestamp (in seconds) from a locked
+        frame. These are used by HAL to check for lost frames.
+        """
+        hc_data.hw_frame_number = paramlock.framestamp
+        hc_data.hw_timestamp = paramlock.timestamp.sec + 1.0e-6 * paramlock.timestamp.microsec
+
     def setPropertyValue(self, property_name, property_value):
         """
         Set the value of a property.
@@ -772,6 +806,7 @@ class HamamatsuCamera(object):
         self.max_backlog = 0
 
         # Free image buffers.
+        self.hcam_data = {}
         self.number_image_buffers = 0
         self.checkStatus(dcam.dcambuf_release(self.camera_handle,
                                                 DCAMBUF_ATTACHKIND_FRAME),
@@ -836,6 +871,10 @@ class HamamatsuCameraMR(HamamatsuCamera):
         """
         frames = []
         for n in self.newFrames():
+
+            # The data is already in our memory, we only lock the frame
+            # to get it's framestamp and timestamp.
+            self.setFrameStamps(self.hcam_data[n], self.lockFrame(n))
             frames.append(self.hcam_data[n])
 
         return [frames, [self.frame_x, self.frame_y]]
@@ -21,6 +21,9 @@ class MCLZStageFunctionality(hardwareModule.HardwareFunctionality, lockModule.ZS
         self.maximum = self.getParameter("maximum")
         self.mcl_stage = mcl_stage
         self.minimum = self.getParameter("minimum")
+
+        # The stage is also moved by the focus lock engine thread.
+        self.mutex = QtCore.QMutex(QtCore.QMutex.Recursive)
         self.recenter()
 
     def goAbsolute(self, z_pos):
@@ -28,13 +31,30 @@ class MCLZStageFunctionality(hardwareModule.HardwareFunctionality, lockModule.ZS
             z_pos = self.minimum
         if (z_pos > self.maximum):
             z_pos = self.maximum
-        self.z_position = z_pos
-        self.mcl_stage.zMoveTo(self.z_position)
-        self.zStagePosition.emit(self.z_position)
+        self.mutex.lock()
+        try:
+            self.z_position = z_pos
+            self.mcl_stage.zMoveTo(self.z_position)
+        finally:
+            self.mutex.unlock()
+        self.zStagePosition.emit(z_pos)
 
     def goRelative(self, z_delta):
-        z_pos = self.z_position + z_delta
-        self.goAbsolute(z_pos)
+        self.mutex.lock()
+        try:
+            self.goAbsolute(self.z_position + z_delta)
+        finally:
+            self.mutex.unlock()
+
+    def isThreadSafe(self):
+        return True
+
+    def shutDown(self):
+        self.mutex.lock()
+        try:
+            self.mcl_stage.shutDown()
+        finally:
+            self.mutex.unlock()
 
 
 class MCLZStage(hardwareModule.HardwareModule):
@@ -59,7 +79,7 @@ class MCLZStage(hardwareModule.HardwareModule):
                                                             
     def cleanUp(self, qt_settings):
         if self.z_stage_functionality is not None:
-            self.mcl_stage.shutDown()
+            self.z_stage_functionality.shutDown()
         
     def processMessage(self, message):
         
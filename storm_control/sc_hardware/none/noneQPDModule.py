@@ -35,12 +35,10 @@ class NoneQPDFunctionality(hardwareModule.BufferedFunctionality, lockModule.QPDF
         self.mustRun(task = self.scan,
                      ret_signal = self.qpdUpdate)
 
-    def scan(self):
-        if self.first_scan:
-            self.first_scan = False
-        else:
-            time.sleep(0.1)
+    def haveSynchronousRead(self):
+        return True
 
+    def measureOffset(self):
         #
         # Determine current z offset. This is the offset of the z stage from
         # it's center position adjusted by xy stage tilt (if any).
@@ -77,6 +75,21 @@ class NoneQPDFunctionality(hardwareModule.BufferedFunctionality, lockModule.QPDF
                 "x" : 100.0 * z_offset,
                 "y" : 0.0}
 
+    def readOffset(self):
+        if not self.running:
+            return None
+        self.device_mutex.lock()
+        qpd_state = self.measureOffset()
+        self.device_mutex.unlock()
+        return qpd_state
+
+    def scan(self):
+        if self.first_scan:
+            self.first_scan = False
+        else:
+            time.sleep(0.1)
+        return self.measureOffset()
+
     def setFunctionality(self, name, functionality):
         if (name == "xy_stage"):
             self.xy_stage_fn = functionality
@@ -92,6 +105,7 @@ class NoneQPDModule(hardwareModule.HardwareModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["configure2", "get functionality"])
         self.qpd_functionality = None
 
         self.configuration = module_params.get("configuration")
@@ -20,6 +20,7 @@ class NoneZStageFunctionality(hardwareModule.HardwareFunctionality, lockModule.Z
         super().__init__(**kwds)
         self.maximum = self.getParameter("maximum")
         self.minimum = self.getParameter("minimum")
+        self.mutex = QtCore.QMutex(QtCore.QMutex.Recursive)
         self.z_position = 0.5 * (self.maximum - self.minimum)
 
     def goAbsolute(self, z_pos):
@@ -27,18 +28,27 @@ class NoneZStageFunctionality(hardwareModule.HardwareFunctionality, lockModule.Z
             z_pos = self.minimum
         if (z_pos > self.maximum):
             z_pos = self.maximum
+        self.mutex.lock()
         self.z_position = z_pos
-        self.zStagePosition.emit(self.z_position)
+        self.mutex.unlock()
+        self.zStagePosition.emit(z_pos)
 
     def goRelative(self, z_delta):
-        z_pos = self.z_position + z_delta
-        self.goAbsolute(z_pos)
+        self.mutex.lock()
+        try:
+            self.goAbsolute(self.z_position + z_delta)
+        finally:
+            self.mutex.unlock()
+
+    def isThreadSafe(self):
+        return True
 
 
 class NoneZStageModule(hardwareModule.HardwareModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscribe(["get functionality"])
         self.z_stage_functionality = None
 
         configuration = module_params.get("configuration")
@@ -161,6 +161,8 @@ class SCamData(object):
     """
     def __init__(self, size = None, **kwds):
         super().__init__(**kwds)
+        self.hw_frame_number = None
+        self.hw_timestamp = None
         self.size = size
         self.np_array = numpy.ascontiguousarray(numpy.empty(size, dtype = numpy.uint16))
 
@@ -179,7 +181,9 @@ class ShimImage(ctypes.Structure):
                 ("height", ctypes.c_size_t),
                 ("im_size", ctypes.c_size_t),
                 ("width", ctypes.c_size_t),
-                ("data", ctypes.c_void_p)]
+                ("data", ctypes.c_void_p),
+                ("frame_id", ctypes.c_uint64),
+                ("timestamp", ctypes.c_uint64)]
 
     
 class SpinCamera(object):
@@ -239,7 +243,9 @@ class SpinCamera(object):
                               ctypes.c_size_t(self.aoi_height),
                               ctypes.c_size_t(image_size),
                               ctypes.c_size_t(self.aoi_width),
-                              ctypes.c_void_p(s_cam_data.getDataPtr()))
+                              ctypes.c_void_p(s_cam_data.getDataPtr()),
+                              ctypes.c_uint64(0),
+                              ctypes.c_uint64(0))
 
             # Get the image.
             err_code = spinshimdll.getNextImage(self.im_event, ctypes.byref(image))
@@ -248,7 +254,9 @@ class SpinCamera(object):
             if (err_code != SPINSHIM_ERR_SUCCESS):
                 break
 
-            # Add to the list of images if we did.
+            # Add to the list of images if we did. The timestamp is in nanoseconds.
+            s_cam_data.hw_frame_number = image.frame_id
+            s_cam_data.hw_timestamp = 1.0e-9 * image.timestamp
             frames.append(s_cam_data)
 
         if (err_code != SPINSHIM_ERR_NO_NEW_IMAGES):
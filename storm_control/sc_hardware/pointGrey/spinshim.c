@@ -45,6 +45,9 @@ typedef struct {
   size_t width;      /* Image width in pixels. */
   
   void *data;        /* The raw image data. */
+
+  uint64_t frame_id;   /* The camera's frame number. */
+  uint64_t timestamp;  /* The camera's timestamp in nanoseconds. */
 } image;
 
   
@@ -230,6 +233,10 @@ int getNextImage(imageEvent *ie, image *im)
     return SPINSHIM_ERR_UNKNOWNFORMAT;
   }
 
+  /* Frame number and timestamp, HAL uses these to check for lost frames. */
+  im->frame_id = ie_im->frame_id;
+  im->timestamp = ie_im->timestamp;
+
   /* Set data to NULL as a mark that this image has been transferred out. */
   ie_im->data = NULL;
 
@@ -254,6 +261,7 @@ void onImageEvent(spinImage h_image, void *user_data)
   spinError err;
   spinImageStatus im_status;
   spinPixelFormatEnums pixel_format;
+  uint64_t frame_id, timestamp;
 
   image *im;
   imageEvent *ie;
@@ -273,6 +281,25 @@ void onImageEvent(spinImage h_image, void *user_data)
     return;
   }
   
+  /* 
+   * Get the frame number and timestamp first. Incomplete images are
+   * discarded, but HAL will see that they are missing because of the
+   * gap in the frame numbers.
+   */
+  frame_id = 0;
+  err = spinImageGetFrameID(h_image, &frame_id);
+  if (err != SPINNAKER_ERR_SUCCESS){
+    printf("spinshim: Unable to retrieve image frame id. Error code %d.\n", err);
+  }
+  im->frame_id = frame_id;
+
+  timestamp = 0;
+  err = spinImageGetTimeStamp(h_image, &timestamp);
+  if (err != SPINNAKER_ERR_SUCCESS){
+    printf("spinshim: Unable to retrieve image timestamp. Error code %d.\n", err);
+  }
+  im->timestamp = timestamp;
+
   /* Check that image is complete. */
   err = spinImageIsIncomplete(h_image, &is_incomplete);
   if (err != SPINNAKER_ERR_SUCCESS){
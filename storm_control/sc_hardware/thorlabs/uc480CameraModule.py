@@ -46,6 +46,14 @@ class UC480QPDCameraFunctionality(hardwareModule.BufferedFunctionality, lockModu
         if not self.scan_thread.isRunning():
             self.scan_thread.startScan()
 
+    def haveSynchronousRead(self):
+        return True
+
+    def readOffset(self):
+        if not self.running:
+            return None
+        return self.scan_thread.scan()
+
     def wait(self):
         super().wait()
         self.scan_thread.stopScan()
@@ -78,19 +86,26 @@ class UC480ScanThread(QtCore.QThread):
     def run(self):
         self.running = True
         while(self.running):
-            self.device_mutex.lock()
-            [power, offset] = self.camera.qpdScan(reps = self.reps)[:2]
-            [image, x_off1, y_off1, x_off2, y_off2, sigma] = self.camera.getImage()
-            self.device_mutex.unlock()
-            self.qpd_update_signal.emit({"is_good" : (power > 0),
-                                         "image" : image,
-                                         "offset" : offset * self.units_to_microns,
-                                         "sigma" : sigma,
-                                         "sum" : power,
-                                         "x_off1" : x_off1,
-                                         "y_off1" : y_off1,
-                                         "x_off2" : x_off2,
-                                         "y_off2" : y_off2})
+            self.qpd_update_signal.emit(self.scan())
+
+    def scan(self):
+        """
+        Measure the current offset, this is also used directly by 
+        the focus lock engine thread.
+        """
+        self.device_mutex.lock()
+        [power, offset] = self.camera.qpdScan(reps = self.reps)[:2]
+        [image, x_off1, y_off1, x_off2, y_off2, sigma] = self.camera.getImage()
+        self.device_mutex.unlock()
+        return {"is_good" : (power > 0),
+                "image" : image,
+                "offset" : offset * self.units_to_microns,
+                "sigma" : sigma,
+                "sum" : power,
+                "x_off1" : x_off1,
+                "y_off1" : y_off1,
+                "x_off2" : x_off2,
+                "y_off2" : y_off2}
 
     def startScan(self):
         self.start(QtCore.QThread.NormalPriority)
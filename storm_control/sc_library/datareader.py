@@ -16,8 +16,14 @@ Hazen 07/15
 
 import numpy
 import os
-from PIL import Image
 import re
+import tifffile
+
+# HDF5 support is optional.
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 import storm_control.sc_library.parameters as parameters
 
@@ -117,7 +123,10 @@ def reader(filename):
     Returns the appropriate object based on the file type as
     saved in the corresponding XML file.
     """
-    no_ext_name = os.path.splitext(filename)[0]
+    if filename.endswith(".big.tif"):
+        no_ext_name = filename[:-len(".big.tif")]
+    else:
+        no_ext_name = os.path.splitext(filename)[0]
 
     # Look for XML file.
     if os.path.exists(no_ext_name + ".xml"):
@@ -144,12 +153,15 @@ def reader(filename):
     elif (file_type == ".spe"):
         return SpeReader(filename = filename,
                          xml = xml)
-    elif (file_type == ".tif"): 
+    elif (file_type == ".tif") or (file_type == ".big.tif"):
         return TifReader(filename = filename,
                          xml = xml)
+    elif (file_type == ".h5") and (h5py is not None):
+        return HDF5Reader(filename = filename,
+                          xml = xml)
     else:
         print(file_type, "is not a recognized file type")
-    raise IOError("only .dax, .spe and .tif are supported (case sensitive..)")
+    raise IOError("only .dax, .h5, .spe and .tif are supported (case sensitive..)")
 
 
 class DataReader(object):
@@ -165,6 +177,11 @@ class DataReader(object):
 
      2. loadAFrame(self, frame_number)
         Load the requested frame and return it as numpy array.
+
+    Subclasses can also implement:
+     1. loadFrames(self, start, stop, step)
+        Load the requested frames and return them as a
+        (frames, y, x) numpy array.
     """
     def __init__(self, filename = None, xml = None, **kwds):
         super().__init__(**kwds)
@@ -213,10 +230,30 @@ class DataReader(object):
     def filmSize(self):
         return [self.image_width, self.image_height, self.number_frames]
 
+    # Returns a range of frames as a (frames, y, x) numpy array.
+    def loadFrames(self, start = 0, stop = None, step = 1):
+        frames = self.frameRange(start, stop, step)
+        return numpy.array([self.loadAFrame(i) for i in frames])
+
+    # Check the requested range of frames and return it as a range object.
+    def frameRange(self, start, stop, step):
+        if stop is None:
+            stop = self.number_frames
+        if (start < 0) or (stop > self.number_frames) or (stop < start):
+            raise IOError("frame range " + str(start) + " - " + str(stop) + " is not valid for a film with " + str(self.number_frames) + " frames")
+        if (step < 1):
+            raise IOError("step must be greater than or equal to 1")
+        return range(start, stop, step)
+
 
 class DaxReader(DataReader):
     """
     Dax reader class. This is a Zhuang lab custom format.
+
+    The file is memory mapped, the frames that are returned are views
+    into the file and are not loaded until they are actually used. The
+    memory map is 'copy on write', so changing the frames in memory
+    will not change the file.
     """
     def __init__(self, **kwds):
         super().__init__(**kwds)
@@ -230,20 +267,115 @@ class DaxReader(DataReader):
         # we need to make sure this is int or this will cause trouble in Python3.
         #
         self.number_frames = int(self.xml.get("acquisition.number_frames"))
-        
-        # open the dax file
-        self.fileptr = open(self.filename, "rb")
+
+        #
+        # Memory map the dax file. If the film was not completely saved the
+        # file could be shorter than expected, so we only map what exists.
+        #
+        # The frames are stored as [width, height] so self.movie is the
+        # transpose of the file data, i.e. [frames, height, width].
+        #
+        if self.bigendian:
+            dtype = numpy.dtype(">i2")
+        else:
+            dtype = numpy.dtype("<i2")
+        frame_size = self.image_height * self.image_width
+        n_frames = min(self.number_frames, int(os.path.getsize(self.filename)/(2 * frame_size)))
+        if (n_frames < self.number_frames):
+            print("Warning!", self.filename, "only contains", n_frames, "of", self.number_frames, "frames.")
+            self.number_frames = n_frames
+
+        if (n_frames > 0):
+            movie = numpy.asarray(numpy.memmap(self.filename,
+                                               dtype = dtype,
+                                               mode = "c",
+                                               shape = (n_frames, self.image_width, self.image_height)))
+        else:
+            movie = numpy.zeros((0, self.image_width, self.image_height), dtype = dtype)
+        self.movie = numpy.transpose(movie, (0, 2, 1))
+
+    def closeFilePtr(self):
+        """
+        Any arrays from getMovie() or loadFrames() that are still in
+        use will keep the file open until they are deleted.
+        """
+        self.movie = None
+
+    def getMovie(self):
+        """
+        Return the whole movie as a [frames, y, x] numpy array.
+        """
+        return self.movie
 
     # load a frame & return it as a numpy array
     def loadAFrame(self, frame_number):
-        if self.fileptr:
+        """
+        This is a copy, not a view, so callers can keep the frame
+        after the file is closed (big endian data is also converted).
+        """
+        if self.movie is not None:
             self.checkFrameNumber(frame_number)
-            self.fileptr.seek(frame_number * self.image_height * self.image_width * 2)
-            image_data = numpy.fromfile(self.fileptr, dtype='int16', count = self.image_height * self.image_width)
-            image_data = numpy.transpose(numpy.reshape(image_data, [self.image_width, self.image_height]))
-            if self.bigendian:
-                image_data.byteswap(True)
-            return image_data
+            return self.movie[frame_number].astype(numpy.int16)
+
+    def loadFrames(self, start = 0, stop = None, step = 1, roi = None):
+        """
+        Return frames start to stop (exclusive), taking every step frame.
+        roi is an optional [y_start, y_end, x_start, x_end] sub-region in
+        the coordinates of the frames returned by loadAFrame().
+
+        Unlike loadAFrame() this is always a view, so big endian data is
+        not converted and the file stays open while it is in use.
+        """
+        if self.movie is not None:
+            frames = self.frameRange(start, stop, step)
+            movie = self.movie[frames.start:frames.stop:frames.step]
+            if roi is not None:
+                movie = movie[:, roi[0]:roi[1], roi[2]:roi[3]]
+            return movie
+
+
+class HDF5Reader(DataReader):
+    """
+    HDF5 reader class, for the files created by imagewriters.HDF5File.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.fileptr = h5py.File(self.filename, "r")
+        self.movie = self.fileptr["movie"]
+
+        [self.number_frames, self.image_width, self.image_height] = self.movie.shape
+
+    def closeFilePtr(self):
+        if self.fileptr:
+            self.fileptr.close()
+            self.fileptr = False
+        self.movie = None
+
+    def loadAFrame(self, frame_number, cast_to_int16 = True):
+        self.checkFrameNumber(frame_number)
+        image_data = numpy.transpose(self.movie[frame_number])
+        if cast_to_int16:
+            image_data = image_data.astype(numpy.int16)
+        return image_data
+
+    def loadFrames(self, start = 0, stop = None, step = 1, cast_to_int16 = False):
+        """
+        Return frames start to stop (exclusive), taking every step frame,
+        as a [frames, y, x] array.
+        """
+        frames = self.frameRange(start, stop, step)
+        movie = numpy.transpose(self.movie[frames.start:frames.stop:frames.step], (0, 2, 1))
+        if cast_to_int16:
+            movie = movie.astype(numpy.int16)
+        return movie
+
+    def loadMetadata(self):
+        """
+        Return the per-frame meta-data (frame number, time stamp and stage
+        position) as a numpy structured array.
+        """
+        return self.fileptr["frame_metadata"][()]
 
 
 class SpeReader(DataReader):
@@ -297,31 +429,112 @@ class SpeReader(DataReader):
 
 class TifReader(DataReader):
     """
-    TIF reader class.
+    TIF (and big TIF) reader class.
+
+    The location of the image data for each page is found when the file
+    is opened. If the pages are not compressed the file is memory mapped
+    and the frames are views into the file, otherwise the pages are read
+    with tifffile.
     """
     def __init__(self, **kwds):
         super().__init__(**kwds)
-                
-        self.fileptr = False
-        self.im = Image.open(filename)
-        self.isize = self.im.size
+
+        self.movie = None
+        self.mmap = None
+        self.tif = tifffile.TiffFile(self.filename)
+
+        pages = self.tif.pages
+        if hasattr(pages, "useframes"):
+            pages.useframes = True
+        self.number_frames = len(pages)
+
+        keyframe = getattr(pages[0], "keyframe", pages[0])
+        self.page_shape = keyframe.shape
+        assert (len(self.page_shape) == 2), "not a monochrome tif image."
+        self.dtype = numpy.dtype(keyframe.dtype).newbyteorder(self.tif.byteorder)
+        self.frame_bytes = self.page_shape[0] * self.page_shape[1] * self.dtype.itemsize
 
         # FIXME: Should check that these match the XML file.
-        self.image_width = self.isize[1]
-        self.image_height = self.isize[0]
+        self.image_width = self.page_shape[0]
+        self.image_height = self.page_shape[1]
+
+        # Index the pages.
+        self.offsets = []
+        for page in pages:
+            self.offsets.append(self.pageOffset(page, keyframe))
+
+        if not (None in self.offsets):
+            self.mmap = numpy.asarray(numpy.memmap(self.filename, dtype = numpy.uint8, mode = "c"))
+
+            # If the pages are evenly spaced in the file (as they are in files
+            # from HAL) then we can also create a view of the whole movie.
+            if (self.number_frames == 1):
+                self.movie = self.loadPage(0)[None,:,:]
+            else:
+                stride = self.offsets[1] - self.offsets[0]
+                if all((self.offsets[i+1] - self.offsets[i]) == stride for i in range(self.number_frames - 1)):
+                    start = self.offsets[0]
+                    size = self.dtype.itemsize * int((self.mmap.size - start)/self.dtype.itemsize)
+                    data = self.mmap[start:start+size].view(self.dtype)
+                    self.movie = numpy.lib.stride_tricks.as_strided(data,
+                                                                    shape = (self.number_frames,) + self.page_shape,
+                                                                    strides = (stride, self.page_shape[1] * self.dtype.itemsize, self.dtype.itemsize),
+                                                                    writeable = False)
 
-        self.number_frames = self.xml.get("acquisition.number_frames")
+    def closeFilePtr(self):
+        if self.tif is not None:
+            self.tif.close()
+            self.tif = None
+        self.mmap = None
+        self.movie = None
 
     def loadAFrame(self, frame_number, cast_to_int16 = True):
         self.checkFrameNumber(frame_number)
-        self.im.seek(frame_number)
-        image_data = numpy.array(list(self.im.getdata()))
-        assert len(image_data.shape) == 1, "not a monochrome tif image."
+        image_data = numpy.transpose(self.loadPage(frame_number))
         if cast_to_int16:
             image_data = image_data.astype(numpy.int16)
-        image_data = numpy.transpose(numpy.reshape(image_data, (self.image_width, self.image_height)))
         return image_data
 
+    def loadFrames(self, start = 0, stop = None, step = 1, cast_to_int16 = False):
+        """
+        Return frames start to stop (exclusive), taking every step frame,
+        as a [frames, y, x] array. If possible this is a (read only) view.
+        """
+        frames = self.frameRange(start, stop, step)
+        if self.movie is not None:
+            movie = numpy.transpose(self.movie[frames.start:frames.stop:frames.step], (0, 2, 1))
+        else:
+            movie = numpy.array([numpy.transpose(self.loadPage(i)) for i in frames])
+        if cast_to_int16:
+            movie = movie.astype(numpy.int16)
+        return movie
+
+    def loadPage(self, page_number):
+        """
+        Return a page of the tif file, this is not transposed.
+        """
+        if self.mmap is not None:
+            offset = self.offsets[page_number]
+            return self.mmap[offset:offset+self.frame_bytes].view(self.dtype).reshape(self.page_shape)
+        else:
+            return self.tif.pages[page_number].asarray()
+
+    def pageOffset(self, page, keyframe):
+        """
+        Return the offset of the image data of a page in the file, or
+        None if the data is compressed, tiled or not contiguous.
+        """
+        if (keyframe.compression != 1) or keyframe.is_tiled:
+            return None
+        offsets = page.dataoffsets
+        counts = page.databytecounts
+        for i in range(len(offsets) - 1):
+            if ((offsets[i] + counts[i]) != offsets[i+1]):
+                return None
+        if (sum(counts) < self.frame_bytes):
+            return None
+        return offsets[0]
+
 
 #
 # The MIT License
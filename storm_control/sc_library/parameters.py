@@ -3,21 +3,55 @@
 Handles parsing settings xml files and getting/setting 
 the resulting settings.
 
+StormXMLObject.copy() is a copy-on-write copy. The copy shares the
+parameters of the original until either of them (or anything that
+they contain) changes. Then only the sections that changed and the
+sections that contain them are duplicated. To make this work the
+sections and the parameters keep (weak) references to the sections
+that contain them.
+
+Parameters are shared between threads (cameras update theirs in a
+worker thread for example) so the copy-on-write book keeping is
+protected by a (module level) lock. Adding or removing parameters
+from the same section in two threads at once is still not safe.
+
 Hazen 06/15
 """
 
 import copy
 import os
+import threading
 import traceback
+import weakref
 import xml
 
 from xml.dom import minidom
 from xml.etree import ElementTree
 
 
+# Protects the copy-on-write references (_parents_, _snapshots_ and
+# _source_). This is re-entrant as releasing a section also releases
+# the sections that contain it.
+cow_lock = threading.RLock()
+
+
 #
 # Functions.
 #
+def addReference(references, obj):
+    """
+    Add a weak reference to obj to the list references (which can
+    be None), returns the list. Dead references are removed from
+    time to time so that the list doesn't keep on growing.
+    """
+    if references is None:
+        return [weakref.ref(obj)]
+    if ((len(references) % 32) == 0):
+        references = [ref for ref in references if ref() is not None]
+    references.append(weakref.ref(obj))
+    return references
+
+
 def config(config_file):
     """
     Parse a configuration file for a setup.
@@ -173,6 +207,20 @@ def fileType(xml_file):
         return ["unknown", traceback.format_exc()]
 
     
+def getReferences(references):
+    """
+    Returns a list of the (live) objects in a list of weak references.
+    """
+    if references is None:
+        return []
+    objs = []
+    for ref in references:
+        obj = ref()
+        if obj is not None:
+            objs.append(obj)
+    return objs
+
+
 def halParameters(parameters_file):
     """
     Parses a parameters file to create a parameters object specifically for HAL.
@@ -190,6 +238,13 @@ def halParameters(parameters_file):
     return xml_object
 
 
+def isImmutable(value):
+    """
+    Returns True if value can't be changed in place.
+    """
+    return (type(value) in immutable_types) or isinstance(value, type)
+
+
 def parameters(parameters_file, recurse = False, add_filename_param = True):
     """
     Parses a parameters file to create a parameters object.
@@ -209,6 +264,9 @@ def parameters(parameters_file, recurse = False, add_filename_param = True):
 #
 # Classes.
 # 
+immutable_types = (bool, bytes, complex, float, int, str, type(None))
+
+
 class ParametersException(Exception):
     """
     This is thrown when there is a problem with the parameters.
@@ -223,6 +281,8 @@ class Parameter(object):
     """
     Base Parameter object.
     """
+    _parents_ = None
+    
     def __init__(self,
                  description = "",
                  name = "",
@@ -244,8 +304,34 @@ class Parameter(object):
         
         self.setv(value)
 
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __setattr__(self, name, value):
+        # Lazy copies of the sections that contain this parameter
+        # need their own copy of it before it changes. This holds the
+        # lock until the change is made so that a copy made in another
+        # thread can't start sharing the parameter in between.
+        if self._parents_ is not None:
+            with cow_lock:
+                for parent in getReferences(self._parents_):
+                    parent._release_()
+                super().__setattr__(name, value)
+        else:
+            super().__setattr__(name, value)
+
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        This is faster than copy.deepcopy() as only the attributes
+        that could be changed in place (lists, etc.) are deep copied.
+        """
+        new = self.__class__.__new__(self.__class__)
+        for key, value in self.__dict__.items():
+            if (key != "_parents_"):
+                if not isImmutable(value):
+                    value = copy.deepcopy(value)
+                new.__dict__[key] = value
+        return new
     
     def getDescription(self):
         return self.description
@@ -531,6 +617,9 @@ class StormXMLObject(object):
     def __init__(self, nodes = None, recurse = False, validate = True, **kwds):
         super().__init__(**kwds)
 
+        self._parents_ = None
+        self._snapshots_ = None
+        self._source_ = None
         self._validate_ = validate
         self.parameters = {}
 
@@ -632,12 +721,95 @@ class StormXMLObject(object):
 
             # This handles sub-nodes.
             elif recurse and (len(node) > 0):
-                self.parameters[node.tag] = StormXMLObject(node, True)
+                self._insert_(node.tag, StormXMLObject(node, True))
 
             # If we were able to make a parameter object add it to the record.
             if param is not None:
                 self.addParameter(node.tag, param)
 
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def _insert_(self, pname, pvalue):
+        """
+        Add a Parameter or StormXMLObject, this object must have its
+        own parameters.
+        """
+        with cow_lock:
+            pvalue.__dict__["_parents_"] = addReference(pvalue.__dict__.get("_parents_"), self)
+        self.parameters[pname] = pvalue
+
+    def _items_(self):
+        """
+        Returns the dictionary of parameters for reading only.
+
+        This doesn't lock, _own_() sets self.parameters before it
+        clears self._source_ so we have to get them in this order.
+        """
+        source = self._source_
+        parameters = self.parameters
+        if parameters is None:
+            return source.parameters
+        return parameters
+
+    def _lookup_(self, pname):
+        """
+        Returns the property specified by pname without getting our
+        own parameters, so the property must not be changed.
+        """
+        prop = self
+        for name in pname.split("."):
+            if not isinstance(prop, StormXMLObject) or not (name in prop._items_()):
+                raise ParametersExceptionGet("Requested property " + pname + " not found")
+            prop = prop._items_()[name]
+        return prop
+
+    def _modify_(self):
+        """
+        Call this before changing the parameters, returns them.
+        """
+        self._release_()
+        return self._own_()
+
+    def _own_(self):
+        """
+        If this object is a copy that is still sharing the parameters of
+        the original, make our own copy of them. The sub-sections are also
+        copy-on-write copies so this only duplicates this level. Returns
+        the parameters.
+        """
+        with cow_lock:
+            if self.parameters is None:
+
+                # Readers could see a partially filled dictionary if
+                # we added the parameters to self.parameters directly.
+                parameters = {}
+                for pname, pvalue in self._source_.parameters.items():
+                    new_pvalue = pvalue.copy()
+                    new_pvalue.__dict__["_parents_"] = addReference(None, self)
+                    parameters[pname] = new_pvalue
+                self.parameters = parameters
+                self._source_ = None
+            return self.parameters
+
+    def _release_(self):
+        """
+        This is called before this object or anything that it contains
+        changes. Copies of it, or of the objects that contain it, that
+        are still sharing the parameters get their own parameters.
+
+        The parents are done first as this will create new copies of
+        this object.
+        """
+        with cow_lock:
+            for parent in getReferences(self._parents_):
+                parent._release_()
+            if self._snapshots_ is not None:
+                snapshots = getReferences(self._snapshots_)
+                self._snapshots_ = None
+                for snapshot in snapshots:
+                    snapshot._own_()
+
     def add(self, pname, pvalue = None):
         """
         Add a new Parameter to the parameters.
@@ -668,13 +840,14 @@ class StormXMLObject(object):
         """
         Handles adding Parameters.
         """
-        if pname in self.parameters:
+        if pname in self._items_():
             raise ParametersException("Parameter " + pname + " already exists.")
         else:
+            self._modify_()
             if isinstance(pvalue, Parameter):
-                self.parameters[pname] = pvalue
+                self._insert_(pname, pvalue)
             else:
-                self.parameters[pname] = ParameterSimple(pname, pvalue)
+                self._insert_(pname, ParameterSimple(pname, pvalue))
 
     def addSubSection(self, sname, svalue = None, overwrite = False):
         """
@@ -688,31 +861,48 @@ class StormXMLObject(object):
         """
         snames = sname.split(".")
         if (len(snames) > 1):
-            if not snames[0] in self.parameters:
-                cur_section = self.parameters[snames[0]] = StormXMLObject()
-            else:
-                cur_section = self.parameters[snames[0]]
+            if not snames[0] in self._items_():
+                self._modify_()
+                self._insert_(snames[0], StormXMLObject())
+            cur_section = self._own_()[snames[0]]
             return cur_section.addSubSection(".".join(snames[1:]),
                                              svalue = svalue,
                                              overwrite = overwrite)
         else:
-            if not sname in self.parameters:
+            if not sname in self._items_():
+                self._modify_()
                 if isinstance(svalue, StormXMLObject):
-                    self.parameters[sname] = svalue
+                    self._insert_(sname, svalue)
                 else:
-                    self.parameters[sname] = StormXMLObject()
+                    self._insert_(sname, StormXMLObject())
             else:
                 if not overwrite:
                     raise ParametersException("Section " + sname + " already exists")
                 if isinstance(svalue, StormXMLObject):
-                    self.parameters[sname] = svalue
+                    self._modify_()
+                    self._insert_(sname, svalue)
                 else:
                     raise ParametersException("Object is a " + type(svalue) + " not a StormXMLObject")
 
-            return self.parameters[sname]
+            return self._own_()[sname]
 
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        Returns a copy-on-write copy of this object. A copy of a copy
+        shares the parameters of the original, so reading from a copy
+        never goes through more than one other object.
+        """
+        new = StormXMLObject(validate = self._validate_)
+        with cow_lock:
+            if self._source_ is None:
+                source = self
+            else:
+                source = self._source_
+
+            new.parameters = None
+            new._source_ = source
+            source._snapshots_ = addReference(source._snapshots_, new)
+        return new
 
     def delete(self, name):
         """
@@ -723,31 +913,40 @@ class StormXMLObject(object):
             if (len(names) > 1):
                 self.get(".".join(names[:-1])).delete(names[-1])
             else:
-                del self.parameters[name]
+                del self._modify_()[name]
 
     def get(self, pname, default = None):
         """
         Returns either the value of the Parameter object specified by pname or
         the corresponding StormXMLObject.
         """
-        try:
-            prop = self.getp(pname)
-        except ParametersException:
-            if default is not None:
-                return default
-            else:
-                raise ParametersExceptionGet("Requested property " + pname + " not found and no default was specified.")
-        else:
-            if isinstance(prop, StormXMLObject):
-                return prop
+        # The lookup could otherwise be part way through the parameters
+        # of our source when another thread gives us our own copy of them
+        # and then changes them.
+        with cow_lock:
+            try:
+                prop = self._lookup_(pname)
+            except ParametersException:
+                if default is not None:
+                    return default
+                else:
+                    raise ParametersExceptionGet("Requested property " + pname + " not found and no default was specified.")
             else:
-                return prop.getv()
+                if isinstance(prop, Parameter) and isImmutable(prop.getv()):
+                    return prop.getv()
+
+                # The caller could change a sub-section or a list, etc.
+                prop = self.getp(pname)
+                if isinstance(prop, StormXMLObject):
+                    return prop
+                else:
+                    return prop.getv()
 
     def getAttrs(self):
         """
         Return a list of the property names.
         """
-        return self.parameters.keys()
+        return self._items_().keys()
 
     def getOrder(self):
         """
@@ -766,8 +965,14 @@ class StormXMLObject(object):
             #print pnames, type(xml_object)
             return xml_object.getp(".".join(pnames[1:]))
 
-        if pname in self.parameters:
-            return self.parameters[pname]
+        params = self._own_()
+        if pname in params:
+            prop = params[pname]
+
+            # Values like lists could be changed in place.
+            if isinstance(prop, Parameter) and not isImmutable(prop.getv()):
+                self._release_()
+            return prop
         else:
             raise ParametersExceptionGet("Requested property " + pname + " not found")
 
@@ -775,21 +980,21 @@ class StormXMLObject(object):
         """
         Return all the properties.
         """
-        return self.parameters.values()
+        return self._own_().values()
 
     def getSortedAttrs(self):
         """
         Return attributes sorted by order, then by name.
         """
-        attrs = self.parameters.keys()
-        return sorted(attrs, key = lambda x: (self.parameters[x].getOrder(), x))
+        params = self._items_()
+        return sorted(params.keys(), key = lambda x: (params[x].getOrder(), x))
 
     def has(self, pname):
         """
         Return true if this object has a particular Parameter.
         """
         try:
-            prop = self.getp(pname)
+            prop = self._lookup_(pname)
         except ParametersExceptionGet:
             return False
         return True
@@ -867,8 +1072,9 @@ class StormXMLObject(object):
         """
         if xml is None:
             xml = ElementTree.Element(name)
-        for key in sorted(self.parameters):
-            value = self.parameters[key]
+        params = self._items_()
+        for key in sorted(params):
+            value = params[key]
             if isinstance(value, StormXMLObject):
                 child = ElementTree.SubElement(xml, key)
                 child.set("validate", str(value._validate_))
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
+import threading
+
 import storm_control.sc_library.halExceptions as halExceptions
 
+import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.testing.testActions as testActions
 import storm_control.hal4000.testing.testing as testing
 
@@ -25,3 +28,80 @@ class LockConfigTest1(testing.Testing):
 
         self.test_actions = [LockConfigTest1Action(p_name = "default")]
 
+
+
+#
+# Check that messages only go to the modules that handle them.
+#
+class RoutingTest1(testing.Testing):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.subscribe(["configure1", "start"])
+
+    def handleNoop(self, message):
+
+        # Nobody handles 'noop' so it should be processed immediately.
+        assert (message.getRefCount() == 0)
+        self.handleActionDone()
+
+    def processMessage(self, message):
+
+        if message.isType("configure1"):
+            self.all_modules = message.getData()["all_modules"]
+
+        elif message.isType("start"):
+            core = self.all_modules["core"]
+
+            # The main window controller handles 'add to menu', this module doesn't.
+            subscribers = core.getSubscribers("add to menu")
+            assert (self.all_modules["hal"] in subscribers)
+            assert not (self in subscribers)
+
+            # Modules that didn't subscribe get everything.
+            assert (self.all_modules["settings"] in subscribers)
+            assert (self.all_modules["settings"] in core.getSubscribers("noop"))
+            assert not (self.all_modules["timing"] in core.getSubscribers("noop"))
+
+            # Pretend that all the modules subscribed, then check that a
+            # message that no module handles is still finalized.
+            core.subscribers_all = []
+            message = halMessage.HalMessage(m_type = "noop")
+            message.finalizer = lambda : self.handleNoop(message)
+            self.sendMessage(message)
+
+
+#
+# Check that modules that want to are initialized in a separate thread
+# and that the startup times include the module.
+#
+class StartupTest1(testing.Testing):
+    parallel_init = True
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.subscribe(["configure1", "start"])
+        self.init_thread = None
+        self.main_thread = threading.get_ident()
+
+    def initModule(self):
+        self.init_thread = threading.get_ident()
+
+    def processMessage(self, message):
+
+        if message.isType("configure1"):
+            self.all_modules = message.getData()["all_modules"]
+
+        elif message.isType("start"):
+            assert (self.init_thread is not None)
+            assert (self.init_thread != self.main_thread)
+
+            times = self.all_modules["core"].getStartupTimes()
+            assert (times["init"] > 0.0)
+            assert (times["load"] >= times["import"])
+            for module_name in self.all_modules:
+                if (module_name != "core"):
+                    assert (times["modules"][module_name]["construct"] > 0.0)
+            assert (times["modules"][self.module_name]["init"] > 0.0)
+
+            self.handleActionDone()
@@ -238,6 +238,31 @@ class FindSum4(testing.TestingTCP):
                                             test_mode = True)]
 
 
+#
+# Test "Get Message Statistics" message.
+#
+class GetMessageStatisticsAction1(testActionsTCP.GetMessageStatistics):
+
+    def checkMessage(self, tcp_message):
+        assert tcp_message.getResponse("enabled")
+        stats = tcp_message.getResponse("statistics")
+        assert (len(stats) > 0)
+        for h_stats in stats:
+            assert (h_stats["step"] == "process")
+            assert (h_stats["count"] > 0)
+            assert (h_stats["max"] >= h_stats["p50"])
+
+        # The 'start' message went to the settings module.
+        assert ("start", "settings") in [(x["m_type"], x["module"]) for x in stats]
+
+class GetMessageStatistics1(testing.TestingTCP):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+
+        self.test_actions = [GetMessageStatisticsAction1(step = "process")]
+
+
 #
 # Test "Get Mosaic Settings" message.
 #
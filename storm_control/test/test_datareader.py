@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Tests of the movie readers.
+"""
+import numpy
+import os
+import tifffile
+
+import storm_control.test as test
+
+import storm_control.sc_library.datareader as datareader
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+
+def makeXML(basename, filetype, x_pixels, y_pixels, number_frames):
+    xml = params.StormXMLObject()
+    acq = xml.addSubSection("acquisition")
+    acq.add(params.ParameterInt(name = "number_frames", value = number_frames))
+    cam = xml.addSubSection("camera1")
+    cam.add(params.ParameterInt(name = "x_pixels", value = x_pixels))
+    cam.add(params.ParameterInt(name = "y_pixels", value = y_pixels))
+    film = xml.addSubSection("film")
+    film.add(params.ParameterString(name = "filetype", value = filetype))
+    xml.saveToFile(basename + ".xml")
+
+
+def test_dax_reader_1():
+
+    # Create a movie.
+    [x_pixels, y_pixels, n_frames] = [12, 8, 5]
+    basename = os.path.join(test.dataDirectory(), "test_dax_reader")
+    data = numpy.arange(n_frames * x_pixels * y_pixels).astype(numpy.int16)
+    data.tofile(basename + ".dax")
+    makeXML(basename, ".dax", x_pixels, y_pixels, n_frames)
+
+    movie = datareader.reader(basename + ".dax")
+    assert (movie.filmSize() == [x_pixels, y_pixels, n_frames])
+
+    # Check that the frames are the same as with the original reader.
+    frame_size = x_pixels * y_pixels
+    for i in range(n_frames):
+        expected = numpy.transpose(numpy.reshape(data[i*frame_size:(i+1)*frame_size], [x_pixels, y_pixels]))
+        assert numpy.array_equal(movie.loadAFrame(i), expected)
+
+    # Batch and sub-region access.
+    frames = movie.loadFrames(1, 5, 2, roi = [2, 5, 3, 7])
+    assert (frames.shape == (2, 3, 4))
+    assert numpy.array_equal(frames[1], movie.loadAFrame(3)[2:5, 3:7])
+
+    # Changing a frame does not change the file.
+    frame = movie.loadAFrame(0)
+    assert not numpy.may_share_memory(frame, movie.getMovie())
+    frame[0, 0] = -1
+    movie.closeFilePtr()
+    assert (numpy.fromfile(basename + ".dax", dtype = numpy.int16)[0] == 0)
+
+
+def test_dax_reader_2():
+
+    # A movie that is shorter than the XML says it is.
+    [x_pixels, y_pixels] = [4, 4]
+    basename = os.path.join(test.dataDirectory(), "test_dax_reader")
+    numpy.zeros(3 * x_pixels * y_pixels, dtype = numpy.int16).tofile(basename + ".dax")
+    makeXML(basename, ".dax", x_pixels, y_pixels, 10)
+
+    movie = datareader.reader(basename + ".dax")
+    assert (movie.filmSize() == [x_pixels, y_pixels, 3])
+    assert (movie.loadFrames().shape == (3, 4, 4))
+
+
+def tifReaderTest(filetype):
+    """
+    Save a movie with imagewriters.TIFFile and read it back.
+    """
+    [x_pixels, y_pixels, n_frames] = [12, 8, 5]
+    basename = os.path.join(test.dataDirectory(), "test_tif_reader")
+
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+    film_settings = filmSettings.FilmSettings(basename = basename,
+                                              filetype = filetype,
+                                              film_length = n_frames)
+    film_settings.setPixelSize(0.1)
+    writer = imagewriters.createFileWriter(camera.getCameraFunctionality(), film_settings)
+
+    pool = framePool.FramePool(max_frames = 2)
+    images = []
+    for i in range(n_frames):
+        frame = pool.getFrame(i, x_pixels, y_pixels, "camera1")
+        frame.np_data[:] = numpy.arange(x_pixels * y_pixels) + i
+        images.append(frame.np_data.copy().reshape(y_pixels, x_pixels))
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+    makeXML(basename, filetype, x_pixels, y_pixels, n_frames)
+
+    movie = datareader.reader(basename + filetype)
+    assert (movie.filmSize() == [y_pixels, x_pixels, n_frames])
+    for i in [3, 0, 4]:
+        assert numpy.array_equal(movie.loadAFrame(i), numpy.transpose(images[i]))
+
+    frames = movie.loadFrames(0, 5, 2)
+    assert (frames.shape == (3, x_pixels, y_pixels))
+    assert numpy.array_equal(frames[1], numpy.transpose(images[2]))
+    movie.closeFilePtr()
+
+
+def test_tif_reader_1():
+    tifReaderTest(".tif")
+
+
+def test_tif_reader_2():
+    tifReaderTest(".big.tif")
+
+
+def test_tif_reader_3():
+
+    # Compressed tif files can't be memory mapped.
+    basename = os.path.join(test.dataDirectory(), "test_tif_reader")
+    images = []
+    with tifffile.TiffWriter(basename + ".tif") as tf:
+        for i in range(3):
+            images.append((numpy.arange(8*12) + i).astype(numpy.uint16).reshape(8, 12))
+            tf.write(images[-1], compression = "zlib")
+    makeXML(basename, ".tif", 12, 8, 3)
+
+    movie = datareader.reader(basename + ".tif")
+    assert (movie.filmSize() == [8, 12, 3])
+    assert numpy.array_equal(movie.loadAFrame(2), numpy.transpose(images[2]))
+    assert numpy.array_equal(movie.loadFrames(1, 3)[0], numpy.transpose(images[1]))
+    movie.closeFilePtr()
+
+
+def test_hdf5_reader_1():
+
+    # Save a movie with imagewriters.HDF5File and read it back.
+    if datareader.h5py is None:
+        return
+    
+    [x_pixels, y_pixels, n_frames] = [12, 8, 5]
+    basename = os.path.join(test.dataDirectory(), "test_hdf5_reader")
+
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+    film_settings = filmSettings.FilmSettings(basename = basename,
+                                              filetype = ".h5",
+                                              film_length = n_frames)
+    film_settings.setPixelSize(0.1)
+    writer = imagewriters.createFileWriter(camera.getCameraFunctionality(), film_settings, chunk_frames = 2)
+
+    pool = framePool.FramePool(max_frames = 2)
+    images = []
+    for i in range(n_frames):
+        frame = pool.getFrame(i, x_pixels, y_pixels, "camera1")
+        frame.np_data[:] = numpy.arange(x_pixels * y_pixels) + i
+        images.append(frame.np_data.copy().reshape(y_pixels, x_pixels))
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+    makeXML(basename, ".h5", x_pixels, y_pixels, n_frames)
+
+    movie = datareader.reader(basename + ".h5")
+    assert (movie.filmSize() == [y_pixels, x_pixels, n_frames])
+    for i in [3, 0, 4]:
+        assert numpy.array_equal(movie.loadAFrame(i), numpy.transpose(images[i]))
+
+    frames = movie.loadFrames(0, 5, 2)
+    assert (frames.shape == (3, x_pixels, y_pixels))
+    assert numpy.array_equal(frames[1], numpy.transpose(images[2]))
+
+    metadata = movie.loadMetadata()
+    assert numpy.array_equal(metadata["frame_number"], numpy.arange(n_frames))
+    assert numpy.all(numpy.isnan(metadata["stage_x"]))
+    movie.closeFilePtr()
+
+
+if (__name__ == "__main__"):
+    test_dax_reader_1()
+    test_dax_reader_2()
+    test_tif_reader_1()
+    test_tif_reader_2()
+    test_tif_reader_3()
+    test_hdf5_reader_1()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Tests of the camera frame pool.
+"""
+from PyQt5 import QtCore
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+
+
+class CameraThread(QtCore.QThread):
+    """
+    Feeds frames to a camera from a thread other than the main thread.
+    """
+    def __init__(self, camera = None, n_frames = None, **kwds):
+        super().__init__(**kwds)
+        self.camera = camera
+        self.n_frames = n_frames
+
+    def run(self):
+        pool = self.camera.getFramePool()
+        for i in range(self.n_frames):
+            self.camera.handleNewData([pool.getFrame(i, 8, 4, "camera1")])
+
+
+class FrameConsumer(QtCore.QObject):
+    """
+    A consumer in the main thread that keeps every frame.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.errors = []
+        self.frames = []
+
+    def handleNewFrame(self, new_frame):
+        try:
+            new_frame.acquire()
+        except framePool.FramePoolException as exception:
+            self.errors.append(exception)
+        else:
+            self.frames.append(new_frame)
+
+
+def test_frame_pool_1():
+
+    # Frames are recycled once they are released.
+    pool = framePool.FramePool(max_frames = 2)
+    f1 = pool.getFrame(0, 8, 4, "camera1")
+    f2 = pool.getFrame(1, 8, 4, "camera1")
+    assert f1.isPooled() and f2.isPooled()
+    assert (pool.getNumberFree() == 0)
+
+    f1.release()
+    assert (pool.getNumberFree() == 1)
+
+    f3 = pool.getFrame(2, 8, 4, "camera1")
+    assert (f3.np_data.ctypes.data == f1.np_data.ctypes.data)
+    assert (pool.getStatistics()["exhausted"] == 0)
+
+
+def test_frame_pool_2():
+
+    # Acquired frames are not recycled until all references are released.
+    pool = framePool.FramePool(max_frames = 1)
+    f1 = pool.getFrame(0, 8, 4, "camera1")
+    f1.acquire()
+    f1.release()
+    assert (pool.getNumberFree() == 0)
+
+    # The pool is exhausted, so this frame is not pooled.
+    f2 = pool.getFrame(1, 8, 4, "camera1")
+    assert not f2.isPooled()
+    assert (f2.np_data.size == 32)
+    assert (pool.getStatistics()["exhausted"] == 1)
+
+    f1.release()
+    assert (pool.getNumberFree() == 1)
+
+
+def test_frame_pool_3():
+
+    # Feed frames that share data keep the camera frame alive.
+    pool = framePool.FramePool(max_frames = 1)
+    f1 = pool.getFrame(0, 8, 4, "camera1")
+    f2 = frame.Frame(f1.np_data, 0, 8, 4, "feed1", parent = f1)
+    f1.release()
+    assert (pool.getNumberFree() == 0)
+
+    f2.release()
+    assert (pool.getNumberFree() == 1)
+
+
+def test_frame_pool_4():
+
+    # Changing the frame size re-allocates the pool, old frames are ignored.
+    pool = framePool.FramePool(max_frames = 4, max_memory = 1)
+    f1 = pool.getFrame(0, 8, 4, "camera1")
+    f2 = pool.getFrame(0, 512, 512, "camera1")
+    assert (pool.getSize() == 2)
+    assert (f2.np_data.size == 512 * 512)
+
+    f1.release()
+    assert (pool.getNumberFree() == 1)
+
+    f2.release()
+    assert (pool.getNumberFree() == 2)
+
+
+def test_frame_pool_5():
+
+    # Releasing a frame too many times is an error.
+    pool = framePool.FramePool(max_frames = 1)
+    f1 = pool.getFrame(0, 8, 4, "camera1")
+    f1.release()
+    try:
+        f1.release()
+    except framePool.FramePoolException:
+        pass
+    else:
+        assert False
+
+
+def test_frame_pool_6():
+
+    # Frames emitted from a camera thread can be acquired by consumers in
+    # the main thread with queued connections.
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication([])
+
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1",
+                                                 config = params.StormXMLObject())
+    pool = camera.getFramePool()
+    consumer = FrameConsumer()
+    camera.getCameraFunctionality().newFrame.connect(consumer.handleNewFrame)
+
+    n_frames = 50
+    camera_thread = CameraThread(camera = camera, n_frames = n_frames)
+    camera_thread.start()
+    camera_thread.wait()
+
+    # Deliver the queued newFrame and releaseFrames signals.
+    for i in range(10):
+        app.processEvents()
+
+    assert (len(consumer.errors) == 0)
+    assert (len(consumer.frames) == n_frames)
+
+    # Every frame is still held by the consumer, so all the buffers are different.
+    pooled = list(filter(lambda x: x.isPooled(), consumer.frames))
+    assert (len(set(map(lambda x: x.np_data.ctypes.data, pooled))) == len(pooled))
+
+    for a_frame in consumer.frames:
+        a_frame.release()
+    assert (len(set(pool.free)) == len(pool.free))
+    assert (pool.getNumberFree() == pool.getSize())
+
+
+if (__name__ == "__main__"):
+    test_frame_pool_1()
+    test_frame_pool_2()
+    test_frame_pool_3()
+    test_frame_pool_4()
+    test_frame_pool_5()
+    test_frame_pool_6()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Tests of rendering frames for display.
+"""
+import numpy
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.display.frameRenderer as frameRenderer
+import storm_control.hal4000.display.intensityHistogram as intensityHistogram
+import storm_control.hal4000.qtWidgets.qtCameraGraphicsScene as qtCameraGraphicsScene
+
+
+def renderSettings(**kwds):
+    settings = {"click_pos" : [3, 2],
+                "color_table" : [i for i in range(256)],
+                "display_range" : [0, 255],
+                "downsample" : [1, 1],
+                "downsample_mode" : "max",
+                "histogram" : None,
+                "max_intensity" : 255,
+                "saturated_value" : None,
+                "scale" : [1, 1]}
+    settings.update(kwds)
+    return settings
+
+
+def test_render_frame_1():
+
+    # A frame is converted to a 8 bit QImage.
+    pool = framePool.FramePool(max_frames = 1)
+    frame = pool.getFrame(0, 8, 4, "camera1")
+    frame.np_data[:] = numpy.arange(32) * 4
+
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings())
+    assert (rendered.image_min == 0)
+    assert (rendered.image_max == 124)
+    assert (rendered.intensity_info == 76)
+    assert (rendered.q_image.width() == 8)
+    assert (rendered.q_image.pixelIndex(3, 2) == 76)
+
+    # Binned frames are up-sampled.
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(scale = [2, 2]))
+    assert (rendered.image_size == [16, 8])
+
+
+def test_render_frame_2():
+
+    # Frames are downsampled for display when the view is zoomed out.
+    pool = framePool.FramePool(max_frames = 1)
+    frame = pool.getFrame(0, 8, 4, "camera1")
+    frame.np_data[:] = 10
+    frame.np_data[9] = 200
+    frame.np_data[30] = 2
+
+    # The maximum keeps single bright pixels, the image range and the
+    # intensity at the clicked pixel are from the full frame.
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(downsample = [2, 2]))
+    assert (rendered.image_min == 2)
+    assert (rendered.image_max == 200)
+    assert (rendered.intensity_info == 10)
+    assert (rendered.q_image.width() == 4)
+    assert (rendered.q_image.height() == 2)
+    assert (rendered.q_image.pixelIndex(0, 0) == 200)
+    assert (rendered.image_size == [8, 4])
+
+    # The mean.
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(downsample = [2, 2],
+                                                                       downsample_mode = "mean"))
+    assert (rendered.q_image.pixelIndex(0, 0) == (200 + 3 * 10)//4)
+    assert (rendered.q_image.pixelIndex(3, 1) == (2 + 3 * 10)//4)
+    assert (rendered.q_image.pixelIndex(1, 1) == 10)
+
+    # Partial bins at the edges use the pixels that they contain, each
+    # bin covers the same area of the chip.
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(downsample = [3, 3]))
+    assert (rendered.q_image.width() == 3)
+    assert (rendered.q_image.height() == 2)
+    assert (rendered.q_image.pixelIndex(2, 1) == 10)
+    assert (rendered.image_size == [9, 6])
+
+    rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(downsample = [3, 3],
+                                                                       downsample_mode = "mean"))
+    assert (rendered.q_image.pixelIndex(2, 1) == (2 + 10)//2)
+    assert (rendered.q_image.pixelIndex(0, 0) == (200 + 8 * 10)//9)
+
+
+def test_render_frame_3():
+
+    # The histogram of the frame is added to the running histogram, with
+    # and without downsampling.
+    pool = framePool.FramePool(max_frames = 1)
+    frame = pool.getFrame(0, 100, 100, "camera1")
+    frame.np_data[:] = 20
+    frame.np_data[:50] = 200
+
+    for downsample in [[1, 1], [2, 2]]:
+        histogram = intensityHistogram.IntensityHistogram(decay = 0.0)
+        rendered = qtCameraGraphicsScene.renderFrame(frame, renderSettings(downsample = downsample,
+                                                                           histogram = histogram))
+        assert (rendered.image_min == 20)
+        assert (rendered.image_max == 200)
+        assert (rendered.binned_histogram.size == 128)
+        assert (histogram.getNFrames() == 1)
+
+        # The percentiles ignore the few bright pixels.
+        assert (histogram.getPercentiles(0.0, 100.0) == [20, 200])
+        assert (histogram.getPercentiles(1.0, 99.0) == [20, 20])
+
+    # The counts decay.
+    histogram = intensityHistogram.IntensityHistogram(decay = 0.5)
+    counts = numpy.zeros(65536)
+    counts[10] = 4
+    histogram.addHistogram(counts)
+    counts[:] = 0
+    counts[30] = 4
+    histogram.addHistogram(counts)
+    assert (histogram.getPercentiles(0.0, 100.0) == [10, 30])
+    assert (histogram.getPercentiles(50.0, 100.0) == [30, 30])
+
+    histogram.reset()
+    assert (histogram.getPercentiles(0.0, 100.0) is None)
+
+
+def test_frame_renderer_1():
+
+    # Only the most recent frame is rendered if the renderer is busy.
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+
+    images = []
+    renderer = frameRenderer.FrameRenderer()
+    renderer.imageReady.connect(lambda x : images.append(x))
+
+    pool = framePool.FramePool(max_frames = 5)
+    for i in range(5):
+        frame = pool.getFrame(i, 512, 512, "camera1")
+        frame.np_data[:] = i
+        renderer.render(frame, renderSettings())
+        frame.release()
+
+    start_time = time.time()
+    while renderer.isBusy() and ((time.time() - start_time) < 5.0):
+        app.processEvents()
+        time.sleep(0.001)
+    app.processEvents()
+
+    stats = renderer.getStatistics()
+    assert (stats["rendered"] + stats["dropped"] == 5)
+    assert (stats["rendered"] == len(images))
+    assert (images[-1].frame_number == 4)
+    assert (pool.getNumberFree() == 5)
+    renderer.cleanUp()
+
+
+if (__name__ == "__main__"):
+    test_render_frame_1()
+    test_render_frame_2()
+    test_render_frame_3()
+    test_frame_renderer_1()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Tests of frame drop detection.
+"""
+import os
+import time
+
+from PyQt5 import QtCore
+
+import storm_control.test as test
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.camera.frameSequence as frameSequence
+import storm_control.hal4000.camera.syntheticCameraControl as syntheticCameraControl
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+
+def test_frame_sequence_1():
+
+    # Gaps in the frame numbers are detected.
+    fseq = frameSequence.FrameSequence()
+    for i in [3, 4, 6, 7, 8, 12, 13]:
+        fseq.addFrame(i, 0.01 * i)
+
+    stats = fseq.getStatistics()
+    assert stats["checked"]
+    assert (stats["frames"] == 7)
+    assert (stats["frames_lost"] == 4)
+    assert (stats["gaps"] == 2)
+    assert (stats["max_gap"] == 3)
+    assert (abs(fseq.getFrameRate() - 100.0) < 1.0e-6)
+
+    acq_params = fseq.getParameters("camera1")
+    assert ([p.getName() for p in acq_params] == ["camera1_frames_lost",
+                                                  "camera1_frame_gaps",
+                                                  "camera1_max_frame_gap",
+                                                  "camera1_hw_frame_rate"])
+
+    # Nothing to report without frame numbers.
+    fseq.reset()
+    fseq.addFrame(None)
+    assert not fseq.getStatistics()["checked"]
+    assert (len(fseq.getParameters("camera1")) == 0)
+
+
+def test_frame_sequence_2():
+
+    # The writers check the sequence of the frames that they saved.
+    config = params.StormXMLObject()
+    camera = syntheticCameraControl.SyntheticCameraControl(camera_name = "camera1", config = config)
+    cam_fn = camera.getCameraFunctionality()
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), "test_frame_sequence"),
+                                              filetype = ".dax",
+                                              film_length = 10)
+    writer = imagewriters.createFileWriter(cam_fn, film_settings)
+
+    pool = framePool.FramePool(max_frames = 2)
+    for i, hw_frame_number in enumerate([0, 1, 2, 5, 6]):
+        frame = pool.getFrame(i, 20, 10, "camera1")
+        frame.hw_frame_number = hw_frame_number
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+
+    assert (writer.getFramesLost() == 2)
+    os.remove(writer.filename)
+
+
+def test_frame_sequence_3():
+
+    # Lost camera frames are detected.
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication([])
+
+    config = params.StormXMLObject()
+    config.add(params.ParameterInt(name = "seed", value = 1))
+    config.add(params.ParameterFloat(name = "frame_loss", value = 0.2))
+    camera = syntheticCameraControl.SyntheticCameraControl(camera_name = "camera1", config = config)
+
+    p = camera.getParameters().copy()
+    p.setv("x_end", 32)
+    p.setv("y_end", 32)
+    p.setv("exposure_time", 0.001)
+    camera.newParameters(p)
+
+    hw_frame_numbers = []
+    camera.getCameraFunctionality().newFrame.connect(lambda x : hw_frame_numbers.append(x.hw_frame_number))
+    camera.startCamera()
+    start_time = time.time()
+    while (len(hw_frame_numbers) < 100) and ((time.time() - start_time) < 10.0):
+        app.processEvents()
+        time.sleep(0.001)
+    camera.stopCamera()
+
+    stats = camera.getFrameSequence().getStatistics()
+    assert (stats["frames"] == len(hw_frame_numbers))
+    assert (stats["frames_lost"] == (hw_frame_numbers[-1] - hw_frame_numbers[0] + 1 - len(hw_frame_numbers)))
+    assert (stats["frames_lost"] > 0)
+
+
+if (__name__ == "__main__"):
+    test_frame_sequence_1()
+    test_frame_sequence_2()
+    test_frame_sequence_3()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""
+Check that the HAL benchmark runs.
+"""
+import storm_control.test as test
+
+import storm_control.hal4000.benchmarks.halBenchmark as halBenchmark
+
+
+def test_hal_benchmark():
+
+    results = halBenchmark.runHal(config_file = test.halXmlFilePathAndName("none_tcp_config.xml"),
+                                  cameras = 1,
+                                  camera_class = "synthetic",
+                                  cases = [{"cameras" : 1,
+                                            "exposure_time" : 0.01,
+                                            "frames" : 20,
+                                            "roi" : 64}],
+                                  directory = test.dataDirectory())
+
+    assert (len(results) == 1)
+    assert not ("error" in results[0])
+    assert (results[0]["frames"] == 20)
+    assert (results[0]["dropped"] == 0)
+    assert (results[0]["fps"] > 0.0)
+
+
+if (__name__ == "__main__"):
+    test_hal_benchmark()
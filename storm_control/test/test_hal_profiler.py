@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Tests of the HAL message profiler.
+"""
+import storm_control.hal4000.halLib.halProfiler as halProfiler
+
+
+def test_histogram_1():
+    histogram = halProfiler.MessageHistogram()
+    for i in range(100):
+        histogram.addTime(1.0e-3)
+    histogram.addTime(0.5)
+    histogram.addTime(1.0e-8)
+
+    stats = histogram.getStatistics()
+    assert (stats["count"] == 102)
+    assert (abs(stats["max"] - 500.0) < 1.0e-6)
+    assert (abs(stats["total"] - 600.00001) < 1.0e-6)
+
+    # Percentiles are the upper edge of the bin, within a factor of 10^(1/5).
+    assert (stats["p50"] >= 1.0) and (stats["p50"] < 1.6)
+    assert (stats["p99"] < 1.6)
+    assert (len(histogram.getCounts()) == 3)
+
+    # Really long times go in the last bin.
+    histogram.addTime(1.0e3)
+    assert (histogram.counts[-1] == 1)
+
+
+def test_profiler_1():
+    profiler = halProfiler.HalProfiler()
+    profiler.addTime("process", "start", "camera1", 2.0e-3)
+    profiler.addTime("process", "start", "camera1", 4.0e-3)
+    profiler.addTime("process", "start", "display", 1.0e-3)
+    profiler.addTime("queue", "start", "core", 1.0e-3)
+
+    stats = profiler.getStatistics()
+    assert (len(stats) == 3)
+    assert (stats[0]["module"] == "core")
+    assert (stats[1]["module"] == "camera1")
+    assert (abs(stats[1]["mean"] - 3.0) < 1.0e-6)
+
+    assert (len(profiler.getStatistics(step = "process")) == 2)
+    assert (profiler.getHistogram("process", "start", "display").getCount() == 1)
+
+    profiler.reset()
+    assert (len(profiler.getStatistics()) == 0)
+
+
+if (__name__ == "__main__"):
+    test_histogram_1()
+    test_profiler_1()
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+
+from storm_control.test.hal.standardHalTest import halTest
+
+def test_hal_routing1():
+    halTest(config_xml = "none_classic_config.xml",
+            class_name = "RoutingTest1",
+            test_module = "storm_control.test.hal.config_tests")
+
+if (__name__ == "__main__"):
+    test_hal_routing1()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""
+Check that the HAL startup benchmark runs.
+"""
+import os
+
+import storm_control.test as test
+
+import storm_control.hal4000.benchmarks.startupBenchmark as startupBenchmark
+
+
+def test_hal_startup():
+
+    times = startupBenchmark.runHal(config_file = test.halXmlFilePathAndName("none_tcp_config.xml"),
+                                    message_time_budget = 5,
+                                    report_file = os.path.join(test.dataDirectory(), "startup_report.json"))
+
+    assert (times["load"] > 0.0)
+    assert (times["configure"] > 0.0)
+    assert ("hal" in times["modules"])
+
+
+if (__name__ == "__main__"):
+    test_hal_startup()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Tests of the image writers.
+"""
+import gzip
+import numpy
+import os
+import threading
+import tifffile
+
+import storm_control.test as test
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.compressionPool as compressionPool
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+
+class FakeStageFunctionality(object):
+    """
+    A stage that moves 1um in x every time its position is checked.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.x = 0.0
+
+    def getCurrentPosition(self):
+        self.x += 1.0
+        return {"x" : self.x, "y" : 2.0}
+
+
+class FakeWriter(object):
+    """
+    Records the frame numbers and waits until it is
+    told that it can save the frames.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.filename = "fake.dax"
+        self.frame_numbers = []
+        self.go = threading.Event()
+
+    def writeFrame(self, frame):
+        self.go.wait()
+        self.frame_numbers.append(frame.frame_number)
+
+
+def test_writer_thread_1():
+
+    # All frames are saved, in order, and returned to the pool.
+    pool = framePool.FramePool(max_frames = 10)
+    writer = FakeWriter()
+    writer.go.set()
+    wt = imagewriters.WriterThread(writer = writer, queue_depth = 2)
+    wt.start()
+    for i in range(10):
+        frame = pool.getFrame(i, 8, 4, "camera1")
+        assert wt.addFrame(frame)
+        frame.release()
+    wt.stopThread()
+
+    assert (writer.frame_numbers == list(range(10)))
+    assert (wt.getDropped() == 0)
+    assert (pool.getNumberFree() == 10)
+
+
+def test_writer_thread_2():
+
+    # Frames are dropped when the queue is full.
+    pool = framePool.FramePool(max_frames = 10)
+    writer = FakeWriter()
+    wt = imagewriters.WriterThread(writer = writer, queue_depth = 2, queue_policy = "drop")
+    wt.start()
+    n_added = 0
+    for i in range(5):
+        frame = pool.getFrame(i, 8, 4, "camera1")
+        if wt.addFrame(frame):
+            n_added += 1
+        frame.release()
+    assert (n_added == 2)
+    assert (wt.getFramesBehind() == 2)
+
+    writer.go.set()
+    wt.stopThread()
+
+    assert (writer.frame_numbers == [0, 1])
+    assert (wt.getDropped() == 3)
+    assert (wt.getMaxBehind() == 2)
+    assert (pool.getNumberFree() == 10)
+
+
+def daxWriterTest(n_frames, **kwds):
+    """
+    Save frames that are not a multiple of the block size and check
+    that we get back what we saved.
+    """
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+    cam_fn = camera.getCameraFunctionality()
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), "test_dax_writer"),
+                                              filetype = ".dax",
+                                              film_length = 10)
+    writer = imagewriters.createFileWriter(cam_fn, film_settings, **kwds)
+
+    pool = framePool.FramePool(max_frames = 2)
+    for i in range(n_frames):
+        frame = pool.getFrame(i, 20, 10, "camera1")
+        frame.np_data[:] = numpy.arange(200) + i
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+
+    data = numpy.fromfile(writer.filename, dtype = numpy.uint16)
+    assert (data.size == n_frames * 200)
+    for i in range(n_frames):
+        assert numpy.array_equal(data[i*200:(i+1)*200], numpy.arange(200) + i)
+
+    os.remove(writer.filename)
+    os.remove(writer.basename + ".inf")
+
+
+def test_dax_writer_1():
+    daxWriterTest(7, write_batch = 1)
+
+
+def test_dax_writer_2():
+    daxWriterTest(7, write_batch = 3, queue_depth = 2)
+
+
+def test_dax_writer_3():
+    daxWriterTest(12, direct_io = True, write_batch = 3)
+
+
+def test_dax_writer_4():
+
+    # The file is closed even if saving failed in the writer thread.
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), "test_dax_writer"),
+                                              filetype = ".dax",
+                                              film_length = 10)
+    writer = imagewriters.createFileWriter(camera.getCameraFunctionality(), film_settings, queue_depth = 2)
+
+    def writeFrame(frame):
+        raise IOError("disk full")
+    writer.writeFrame = writeFrame
+
+    pool = framePool.FramePool(max_frames = 2)
+    for i in range(3):
+        frame = pool.getFrame(i, 20, 10, "camera1")
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    try:
+        writer.closeWriter()
+    except imagewriters.ImageWriterException:
+        pass
+    else:
+        assert False
+
+    try:
+        os.fstat(writer.fd)
+    except OSError:
+        pass
+    else:
+        assert False
+    assert (pool.getNumberFree() == 2)
+
+    os.remove(writer.filename)
+
+
+def test_compression_pool_1():
+
+    # Shuffling is reversible and the jobs are returned in order.
+    data = numpy.arange(1000, dtype = numpy.uint16)
+    assert numpy.array_equal(compressionPool.unshuffle(compressionPool.shuffle(data), numpy.uint16), data)
+
+    pool = compressionPool.CompressionPool(level = 1, max_pending = 2, n_threads = 2)
+    for i in range(5):
+        pool.submit(data + i, tag = i)
+    jobs = pool.completed(wait = True)
+    assert ([job.tag for job in jobs] == list(range(5)))
+    assert (pool.getCompressionRatio() > 1.0)
+
+
+def compressedWriterTest(filetype, n_frames, **kwds):
+    """
+    Save compressed frames and check that we get back what we saved.
+    """
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+    cam_fn = camera.getCameraFunctionality()
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), "test_compressed_writer"),
+                                              filetype = filetype,
+                                              film_length = 10)
+    film_settings.setPixelSize(0.1)
+    writer = imagewriters.createFileWriter(cam_fn, film_settings, compressed = True, **kwds)
+
+    pool = framePool.FramePool(max_frames = 2)
+    images = []
+    for i in range(n_frames):
+        frame = pool.getFrame(i, 20, 10, "camera1")
+        frame.np_data[:] = numpy.arange(200) * (i + 1)
+        images.append(frame.np_data.copy().reshape(10, 20))
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+
+    assert (pool.getNumberFree() == 2)
+    assert (writer.getCompression()[0] > 1.0)
+    return [writer, images]
+
+
+def test_compressed_writer_1():
+
+    # .dax files are saved in gzip format.
+    [writer, images] = compressedWriterTest(".dax", 7, compression_threads = 3, queue_depth = 2)
+    assert writer.filename.endswith(".dax.gz")
+    with gzip.open(writer.filename) as fp:
+        data = numpy.frombuffer(fp.read(), dtype = numpy.uint16)
+    assert numpy.array_equal(data, numpy.concatenate(images).reshape(-1))
+    os.remove(writer.filename)
+
+
+def test_compressed_writer_2():
+
+    # .tif files are saved with deflate compression.
+    [writer, images] = compressedWriterTest(".tif", 5)
+    with tifffile.TiffFile(writer.filename) as tf:
+        assert (len(tf.pages) == 5)
+        for i in range(5):
+            assert numpy.array_equal(tf.pages[i].asarray(), images[i])
+    os.remove(writer.filename)
+
+
+def hdf5WriterTest(n_frames, **kwds):
+    """
+    Save frames to a HDF5 file and check that we get back what
+    we saved using h5py.
+    """
+    if imagewriters.h5py is None:
+        return
+    h5py = imagewriters.h5py
+
+    config = params.StormXMLObject()
+    config.add(params.ParameterFloat(name = "roll", value = 1.0))
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+    cam_fn = camera.getCameraFunctionality()
+
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), "test_hdf5_writer"),
+                                              filetype = ".h5",
+                                              film_length = 10)
+    film_settings.setPixelSize(0.1)
+    writer = imagewriters.createFileWriter(cam_fn,
+                                           film_settings,
+                                           chunk_frames = 4,
+                                           stage_functionality = FakeStageFunctionality(),
+                                           **kwds)
+
+    pool = framePool.FramePool(max_frames = 2)
+    for i in range(n_frames):
+        frame = pool.getFrame(i, 20, 10, "camera1")
+        frame.np_data[:] = numpy.arange(200) * (i + 1)
+        writer.saveFrame(frame)
+        frame.release()
+    writer.handleStopped()
+    writer.closeWriter()
+
+    with h5py.File(writer.filename, "r") as h5:
+        movie = h5["movie"]
+        assert (movie.shape == (n_frames, 10, 20))
+        for i in range(n_frames):
+            assert numpy.array_equal(movie[i], (numpy.arange(200) * (i + 1)).reshape(10, 20))
+
+        metadata = h5["frame_metadata"][()]
+        assert numpy.array_equal(metadata["frame_number"], numpy.arange(n_frames))
+        assert numpy.array_equal(metadata["stage_x"], numpy.arange(n_frames) + 1.0)
+        assert numpy.all(numpy.diff(metadata["timestamp"]) >= 0.0)
+        assert numpy.all(metadata["hw_frame_number"] == -1)
+
+    os.remove(writer.filename)
+
+
+def test_hdf5_writer_1():
+    hdf5WriterTest(10, compression_level = 1, queue_depth = 2)
+
+
+def test_hdf5_writer_2():
+    hdf5WriterTest(3, compression_level = 0)
+
+
+if (__name__ == "__main__"):
+    test_writer_thread_1()
+    test_writer_thread_2()
+    test_dax_writer_1()
+    test_dax_writer_2()
+    test_dax_writer_3()
+    test_dax_writer_4()
+    test_compression_pool_1()
+    test_compressed_writer_1()
+    test_compressed_writer_2()
+    test_hdf5_writer_1()
+    test_hdf5_writer_2()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Tests of the focus lock controllers and telemetry.
+"""
+import numpy
+import os
+
+import storm_control.sc_library.parameters as params
+import storm_control.test as test
+
+import storm_control.hal4000.focusLock.lockControllers as lockControllers
+import storm_control.hal4000.focusLock.lockModes as lockModes
+import storm_control.hal4000.focusLock.lockTelemetry as lockTelemetry
+
+
+def lockParameters(**kwds):
+    parameters = params.StormXMLObject()
+    lockModes.FindSumMixin.addParameters(parameters)
+    lockModes.LockedMixin.addParameters(parameters)
+    lockModes.ScanMixin.addParameters(parameters)
+    for key in kwds:
+        parameters.setv("locked." + key, kwds[key])
+    return parameters
+
+
+def simulate(controller, n_updates, drift = 0.0, dt = 0.01):
+    """
+    Lock a stage whose offset drifts by drift microns per update,
+    returns the errors.
+    """
+    z_sample = 0.0
+    z_stage = 0.0
+    errors = []
+    for i in range(n_updates):
+        z_sample += drift
+        error = z_stage - z_sample
+        errors.append(error)
+        z_stage += controller.update(error, i * dt)
+    return numpy.array(errors)
+
+
+class ZStageFunctionality(object):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.z_position = 0.0
+
+    def getCurrentPosition(self):
+        return self.z_position
+
+    def goRelative(self, z_delta):
+        self.z_position += z_delta
+
+    def recenter(self):
+        self.z_position = 0.0
+
+
+def test_proportional_1():
+
+    # This is what the focus lock has always done.
+    controller = lockControllers.createController(lockParameters().get("locked"))
+    assert isinstance(controller, lockControllers.ProportionalController)
+    assert (abs(controller.update(0.1, 0.0) + 0.09) < 1.0e-9)
+
+    # A drift gives a steady state error.
+    errors = simulate(controller, 100, drift = 0.01)
+    assert (abs(errors[-1]) > 0.005)
+
+
+def test_pid_1():
+
+    # The integral term removes the steady state error.
+    controller = lockControllers.createController(lockParameters(controller = "pid",
+                                                                 ki = 20.0).get("locked"))
+    assert isinstance(controller, lockControllers.PIDController)
+    errors = simulate(controller, 200, drift = 0.01)
+    assert (abs(errors[-1]) < 1.0e-4)
+
+
+def test_pid_2():
+
+    # The correction is limited and the integral doesn't wind up.
+    controller = lockControllers.PIDController(ki = 10.0, max_correction = 0.1)
+    for i in range(100):
+        assert (abs(controller.update(5.0, i * 0.01)) <= 0.1)
+    assert (abs(controller.ki * controller.integral) <= 0.1 + 1.0e-9)
+
+    # So it recovers quickly once the error changes sign.
+    assert (controller.update(-1.0, 1.0) > 0.0)
+
+
+def test_telemetry_1():
+
+    # Records are saved in a compact binary file.
+    filename = os.path.join(test.dataDirectory(), "test_lock_telemetry.lck")
+    telemetry = lockTelemetry.LockTelemetry(buffer_size = 4)
+    telemetry.startRecording(filename)
+    telemetry.addEvent(lockTelemetry.FLAG_LOCK_STARTED)
+    for i in range(10):
+        telemetry.record(0.1/(i+1), -0.05, (i >= 3))
+    telemetry.record(float("nan"), 0.0, False)
+    telemetry.stopRecording()
+
+    assert (os.path.getsize(filename) == 11 * lockTelemetry.record_dtype.itemsize)
+    data = lockTelemetry.loadTelemetry(filename)
+    assert (data.size == 11)
+    assert (abs(data["error"][1] - 0.05) < 1.0e-6)
+    assert (data["flags"][0] == lockTelemetry.FLAG_LOCK_STARTED)
+    assert (data["flags"][3] == lockTelemetry.FLAG_GOOD_LOCK)
+    assert (data["flags"][10] == lockTelemetry.FLAG_LOW_SUM)
+    assert (data["settling"][3] > 0.0)
+    assert (numpy.count_nonzero(data["settling"]) == 1)
+    assert (len(telemetry.getSettlingTimes()) == 1)
+    assert numpy.all(numpy.diff(data["time"]) >= 0.0)
+    os.remove(filename)
+
+
+def test_feed_forward_1():
+
+    # A stage move is corrected before the QPD sees it.
+    parameters = lockParameters(ff_tilt_x = 1.0e-3)
+    lock_mode = lockModes.AlwaysOnLockMode(parameters = parameters)
+    lock_mode.newParameters(parameters)
+    z_stage = ZStageFunctionality()
+    lock_mode.setZStageFunctionality(z_stage)
+    lock_mode.setTelemetry(lockTelemetry.LockTelemetry())
+
+    # Nothing happens if we are not locked.
+    lock_mode.handleStageMove(100.0, 0.0)
+    assert (z_stage.getCurrentPosition() == 0.0)
+
+    lock_mode.startLock(target = 0.0)
+    lock_mode.handleStageMove(100.0, 50.0)
+    assert (abs(z_stage.getCurrentPosition() - 0.1) < 1.0e-9)
+
+
+if (__name__ == "__main__"):
+    test_proportional_1()
+    test_pid_1()
+    test_pid_2()
+    test_telemetry_1()
+    test_feed_forward_1()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Tests of the focus lock engine thread.
+"""
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.focusLock.lockControl as lockControl
+import storm_control.hal4000.focusLock.lockEngine as lockEngine
+import storm_control.hal4000.focusLock.lockModes as lockModes
+
+app = QtCore.QCoreApplication.instance()
+if app is None:
+    app = QtWidgets.QApplication([])
+
+
+class QPDFunctionality(QtCore.QObject):
+    """
+    A QPD whose offset is the z stage position minus z_zero.
+    """
+    qpdUpdate = QtCore.pyqtSignal(dict)
+
+    def __init__(self, z_stage = None, z_zero = None, **kwds):
+        super().__init__(**kwds)
+        self.z_stage = z_stage
+        self.z_zero = z_zero
+
+    def getOffset(self):
+        pass
+
+    def haveSynchronousRead(self):
+        return True
+
+    def readOffset(self):
+        return {"is_good" : True,
+                "offset" : self.z_stage.getCurrentPosition() - self.z_zero,
+                "sum" : 100.0}
+
+
+class ZStageFunctionality(object):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.z_position = 0.0
+
+    def getCurrentPosition(self):
+        return self.z_position
+
+    def goAbsolute(self, z_pos):
+        self.z_position = z_pos
+
+    def goRelative(self, z_delta):
+        self.z_position += z_delta
+
+    def isThreadSafe(self):
+        return False
+
+    def recenter(self):
+        self.z_position = 0.0
+
+
+class ThreadSafeZStageFunctionality(ZStageFunctionality):
+
+    def isThreadSafe(self):
+        return True
+
+
+def alwaysOnLockMode():
+    parameters = params.StormXMLObject()
+    lockModes.FindSumMixin.addParameters(parameters)
+    lockModes.LockedMixin.addParameters(parameters)
+    lockModes.ScanMixin.addParameters(parameters)
+    lock_mode = lockModes.AlwaysOnLockMode(parameters = parameters)
+    lock_mode.newParameters(parameters)
+    return lock_mode
+
+
+def test_loop_statistics_1():
+    stats = lockEngine.LoopStatistics()
+    stats.addLoop(None, 0.001)
+    stats.addLoop(0.010, 0.003)
+    stats.addLoop(0.020, 0.002)
+    stats.addOverrun()
+
+    d = stats.getStatistics()
+    assert (d["loops"] == 3)
+    assert (d["overruns"] == 1)
+    assert (abs(d["latency_mean"] - 2.0) < 1.0e-6)
+    assert (abs(d["latency_max"] - 3.0) < 1.0e-6)
+    assert (abs(d["period_mean"] - 15.0) < 1.0e-6)
+    assert (abs(d["period_jitter"] - 5.0) < 1.0e-6)
+    assert (abs(d["period_max"] - 20.0) < 1.0e-6)
+
+    stats.reset()
+    assert (stats.getStatistics()["loops"] == 0)
+
+
+def test_lock_engine_1():
+
+    # The engine holds the lock target without the Qt event loop.
+    lock_mode = alwaysOnLockMode()
+
+    z_stage = ZStageFunctionality()
+    lock_mode.setZStageFunctionality(z_stage)
+    lock_mode.startLock(target = 0.0)
+
+    qpd = QPDFunctionality(z_stage = z_stage, z_zero = 1.0)
+    readings = []
+    qpd.qpdUpdate.connect(lambda x : readings.append(x))
+
+    engine = lockEngine.LockEngine(display_decimation = 2,
+                                   loop_rate = 200.0,
+                                   qpd_functionality = qpd)
+    engine.setLockMode(lock_mode)
+    engine.startEngine()
+    time.sleep(0.2)
+    engine.stopEngine()
+    app.processEvents()
+
+    assert (abs(z_stage.getCurrentPosition() - 1.0) < 1.0e-3)
+    assert lock_mode.isGoodLock()
+
+    # Only every other reading is sent to the GUI.
+    stats = engine.getStatistics()
+    assert (stats["loops"] > 10)
+    assert (len(readings) == stats["loops"]//2)
+    assert (stats["period_mean"] > 1.0)
+
+
+def test_lock_engine_2():
+
+    # The engine is only used if the z stage is thread safe.
+    configuration = params.StormXMLObject()
+    configuration.add(params.ParameterSetBoolean(name = "lock_engine", value = True))
+
+    for [z_stage, uses_engine] in [[ZStageFunctionality(), False],
+                                   [ThreadSafeZStageFunctionality(), True]]:
+        lock_control = lockControl.LockControl(configuration = configuration)
+        lock_control.setFunctionality("qpd", QPDFunctionality(z_stage = z_stage, z_zero = 1.0))
+        lock_control.setFunctionality("z_stage", z_stage)
+        lock_control.handleModeChanged(alwaysOnLockMode())
+        lock_control.start()
+        assert ((lock_control.getEngineStatistics() is not None) == uses_engine)
+        lock_control.cleanUp()
+
+
+def test_lock_engine_3():
+
+    # The mode's mutex is released even if the mode raises an exception.
+    lock_mode = alwaysOnLockMode()
+    z_stage = ZStageFunctionality()
+    lock_mode.setZStageFunctionality(z_stage)
+
+    def handleQPDUpdate(qpd_state):
+        raise Exception("lock mode failed")
+    lock_mode.handleQPDUpdate = handleQPDUpdate
+
+    engine = lockEngine.LockEngine(qpd_functionality = QPDFunctionality(z_stage = z_stage, z_zero = 1.0))
+    engine.setLockMode(lock_mode)
+    try:
+        engine.loop()
+    except Exception:
+        pass
+    else:
+        assert False
+    assert lock_mode.mutex.tryLock()
+    lock_mode.mutex.unlock()
+
+
+def test_lock_engine_4():
+
+    # If the engine fails LockControl goes back to the qpdUpdate signal.
+    class FailingQPDFunctionality(QPDFunctionality):
+
+        def __init__(self, **kwds):
+            super().__init__(**kwds)
+            self.n_get_offset = 0
+            
+        def getOffset(self):
+            self.n_get_offset += 1
+            
+        def readOffset(self):
+            raise Exception("QPD read failed")
+
+    configuration = params.StormXMLObject()
+    configuration.add(params.ParameterSetBoolean(name = "lock_engine", value = True))
+    
+    z_stage = ThreadSafeZStageFunctionality()
+    qpd = FailingQPDFunctionality(z_stage = z_stage, z_zero = 1.0)
+    lock_control = lockControl.LockControl(configuration = configuration)
+    lock_control.setFunctionality("qpd", qpd)
+    lock_control.setFunctionality("z_stage", z_stage)
+    lock_control.handleModeChanged(alwaysOnLockMode())
+    lock_control.start()
+    engine = lock_control.engine
+    assert (engine is not None)
+
+    engine.wait(1000)
+    assert not engine.isLoopRunning()
+    app.processEvents()
+    assert (lock_control.getEngineStatistics() is None)
+    assert (qpd.n_get_offset == 1)
+
+    qpd.qpdUpdate.emit({"is_good" : False})
+    assert (qpd.n_get_offset == 2)
+    lock_control.cleanUp()
+
+
+if (__name__ == "__main__"):
+    test_loop_statistics_1()
+    test_lock_engine_1()
+    test_lock_engine_2()
+    test_lock_engine_3()
+    test_lock_engine_4()
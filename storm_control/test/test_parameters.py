@@ -2,6 +2,9 @@
 """
 Tests of the parameters object functionality.
 """
+import random
+import sys
+import threading
 
 import storm_control.test as test
 
@@ -155,6 +158,133 @@ def test_parameters_8():
 
     assert(s1.getSortedAttrs() == ['dd', 'bb', 'aa', 'cc'])
 
+
+def test_parameters_9():
+
+    # Load parameters.
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+
+    # Keep references to a section, a parameter and a list.
+    s1 = p1.get("display00.camera1")
+    v1 = p1.getp("camera1.exposure_time")
+    p1.add(params.ParameterCustom(name = "powers", value = [1.0, 2.0]))
+
+    # Copies share the parameters until something changes.
+    p2 = p1.copy()
+    p3 = p2.copy()
+    assert (p2.parameters is None) and (p3.parameters is None)
+    assert (p2.get("display00.camera1.display_max") == 300)
+    assert (p2.parameters is None)
+    xml = p1.toString()
+    assert (p2.toString() == xml) and (p3.toString() == xml)
+
+    # Changes to the original using the references don't change the copies.
+    p1.get("powers")[0] = 3.0
+    s1.set("display_max", 500)
+    v1.setv(0.1)
+    assert (p1.get("display00.camera1.display_max") == 500)
+    assert (p1.get("camera1.exposure_time") == 0.1)
+    assert (p1.get("powers") == [3.0, 2.0])
+    assert (p2.toString() == xml) and (p3.toString() == xml)
+
+    # And changes to the copies don't change the original or each other.
+    xml = p1.toString()
+    p2.delete("camera1")
+    p3.get("display00").add("new_param", 1)
+    assert (p1.toString() == xml)
+    assert not p2.has("camera1") and p3.has("camera1")
+    assert p3.has("display00.new_param") and not p2.has("display00.new_param")
+
+
+def test_parameters_10():
+
+    # Random changes to parameters and their copies using references that
+    # were obtained at different times. A change should only change the
+    # copy that it was made to (and the sections obtained from it).
+    rand = random.Random(1)
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+    p1.add("camera1.powers", params.ParameterCustom(name = "powers", value = [1.0, 2.0]))
+
+    objs = [p1]
+    copy_ids = [0]
+    xmls = [p1.toString()]
+    for i in range(200):
+        k = rand.randint(0, len(objs) - 1)
+        obj = objs[k]
+        section = obj
+        sname = rand.choice(["camera1", "display00", "display00.camera1"])
+        if obj.has(sname):
+            section = obj.get(sname)
+        choice = rand.randint(0, 5)
+        if (choice == 0):
+            objs.append(obj.copy())
+            copy_ids.append(i + 1)
+            xmls.append(xmls[k])
+        elif (choice == 1):
+            objs.append(section)
+            copy_ids.append(copy_ids[k])
+            xmls.append(section.toString())
+        elif (choice == 2):
+            pname = rand.choice(["camera1.default_max", "display00.camera1.display_max"])
+            if obj.has(pname):
+                obj.getp(pname).setv(rand.randint(0, 100))
+        elif (choice == 3):
+            if section.has("powers"):
+                section.get("powers")[0] = rand.random()
+        elif (choice == 4):
+            section.add("p" + str(i), i)
+        elif (len(section.getAttrs()) > 0):
+            section.delete(rand.choice(sorted(section.getAttrs())))
+
+        for j in range(len(objs)):
+            if (copy_ids[j] == copy_ids[k]):
+                xmls[j] = objs[j].toString()
+            else:
+                assert (objs[j].toString() == xmls[j])
+
+
+
+def test_parameters_11():
+
+    # Copy in one thread while mutating in another. A copy should
+    # not change once it has been made.
+    p1 = params.StormXMLObject()
+    p1.addSubSection("a")
+    p1.get("a").add("x", params.ParameterInt(name = "x", value = 0))
+
+    errors = []
+    done = threading.Event()
+
+    def mutate():
+        try:
+            for i in range(1, 5000):
+                p1.set("a.x", i)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1.0e-6)
+    try:
+        thread = threading.Thread(target = mutate)
+        thread.start()
+        copies = []
+        while not done.is_set():
+            p2 = p1.copy()
+            copies.append([p2, p2.get("a.x")])
+            for [p2, x] in copies[-10:]:
+                assert (p2.get("a.x") == x)
+                assert (p2.get("a").get("x") == x)
+        thread.join()
+    finally:
+        sys.setswitchinterval(old_interval)
+
+    assert (len(errors) == 0)
+    assert (p1.get("a.x") == 4999)
+    for [p2, x] in copies:
+        assert (p2.get("a.x") == x)
+
         
 if (__name__ == "__main__"):
     test_parameters_1()
@@ -165,3 +295,6 @@ if (__name__ == "__main__"):
     test_parameters_6()
     test_parameters_7()
     test_parameters_8()
+    test_parameters_9()
+    test_parameters_10()
+    test_parameters_11()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Tests of converting camera frames to 8 bit images for display.
+"""
+import numpy
+
+import storm_control.hal4000.benchmarks.rescaleBenchmark as rescaleBenchmark
+import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
+
+
+def test_rescale_image_1():
+
+    # The look up table version agrees with the numpy version for all orientations.
+    rng = numpy.random.default_rng(0)
+    image = rng.integers(0, 400, size = (301, 517)).astype(numpy.uint16)
+
+    default_threads = c_image.n_threads
+    c_image.n_threads = 3
+    try:
+        for flip_h in [False, True]:
+            for flip_v in [False, True]:
+                for transpose in [False, True]:
+                    for saturated_value in [None, 300]:
+                        args = [image, flip_h, flip_v, transpose, [10, 250], saturated_value]
+                        [np_im, np_min, np_max] = c_image.rescaleImage(*args, use_numpy = True)
+                        [lut_im, lut_min, lut_max, hist] = c_image.rescaleImageLUT(*args, histogram_bins = 512)
+                        assert (lut_im.shape == np_im.shape)
+                        assert (numpy.max(numpy.abs(lut_im.astype(numpy.int32) - np_im)) <= 1)
+                        assert (lut_min == np_min)
+                        assert (lut_max == np_max)
+                        assert (numpy.sum(hist) == image.size)
+                        assert (hist[1] == numpy.count_nonzero((image >= 128) & (image < 256)))
+    finally:
+        c_image.n_threads = default_threads
+
+
+def test_rescale_image_2():
+
+    # The color table is applied and the look up tables are cached.
+    image = numpy.arange(256, dtype = numpy.uint16).reshape(16, 16) * 2
+    colors = numpy.arange(256, dtype = numpy.uint32) + 0xff000000
+
+    [rescaled, image_min, image_max, hist] = c_image.rescaleImageLUT(image, False, False, False, [0, 510], None, colors = colors)
+    assert (rescaled.dtype == numpy.uint32)
+    assert (rescaled[0,0] == 0xff000000)
+    assert (rescaled[15,15] == 0xff000000 + 255)
+    assert (hist is None)
+
+    c_image.getLUT.cache_clear()
+    c_image.rescaleImageLUT(image, False, False, False, [0, 100], None)
+    c_image.rescaleImageLUT(image, True, False, False, [0, 100], None)
+    c_image.rescaleImageLUT(image, True, False, False, [0, 100], 200)
+    assert (c_image.getLUT.cache_info().misses == 2)
+
+
+def test_rescale_benchmark():
+    results = rescaleBenchmark.runBenchmark(size = 128, repeats = 2, threads = [1, 2])
+    for [name, ms] in results:
+        assert (ms > 0.0)
+
+
+if (__name__ == "__main__"):
+    test_rescale_image_1()
+    test_rescale_image_2()
+    test_rescale_benchmark()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+"""
+Tests of the spot counter analysis scheduling.
+"""
+import numpy
+import os
+import tifffile
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import storm_control.test as test
+import storm_control.hal4000.camera.framePool as framePool
+import storm_control.hal4000.illumination.xmlParser as xmlParser
+import storm_control.hal4000.spotCounter.displaySpots as displaySpots
+import storm_control.hal4000.spotCounter.findSpots as findSpots
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
+
+# The thread pool is deleted with the application, so keep one around.
+app = QtCore.QCoreApplication.instance()
+if app is None:
+    app = QtWidgets.QApplication([])
+
+
+def analyzeFrames(spot_counter, frames, thresholds = None):
+    """
+    Analyze a list of [camera name, frame] and return the analysis results.
+    """
+    if thresholds is None:
+        thresholds = [100] * len(frames)
+    results = []
+    spot_counter.imageProcessed.connect(lambda x : results.append(x))
+    for [camera_name, frame], threshold in zip(frames, thresholds):
+        spot_counter.newFrameToAnalyze(camera_name, frame, threshold)
+        frame.release()
+
+    start_time = time.time()
+    n_queued = 1
+    while ((n_queued > 0) or (len(spot_counter.idle_workers) < len(spot_counter.workers))) and ((time.time() - start_time) < 5.0):
+        app.processEvents()
+        time.sleep(0.001)
+        n_queued = sum(map(len, spot_counter.queues.values()))
+    app.processEvents()
+
+    spot_counter.cleanUp()
+    return results
+
+
+def test_spot_counter_1():
+
+    # With one thread and a queue of 2, most of the frames are
+    # dropped but the most recent frames are analyzed.
+    pool = framePool.FramePool(max_frames = 10)
+    frames = [["camera1", pool.getFrame(i, 64, 64, "camera1")] for i in range(10)]
+
+    spot_counter = findSpots.SpotCounter(max_queue = 2, max_threads = 1, max_size = 64*64)
+    results = analyzeFrames(spot_counter, frames)
+
+    stats = spot_counter.getStatistics("camera1")
+    assert (stats["total"] == 10)
+    assert (stats["analyzed"] + stats["dropped"] == 10)
+    assert (stats["analyzed"] == len(results))
+    assert (results[-1].getFrameNumber() == 9)
+    assert (pool.getNumberFree() == 10)
+
+
+def test_spot_counter_2():
+
+    # Every 3rd frame, nothing is dropped if the queue is not bounded.
+    pool = framePool.FramePool(max_frames = 10)
+    frames = [["camera1", pool.getFrame(i, 64, 64, "camera1")] for i in range(10)]
+
+    spot_counter = findSpots.SpotCounter(decimation = 3, max_threads = 1, max_size = 64*64, policy = "nth")
+    results = analyzeFrames(spot_counter, frames)
+    stats = spot_counter.getStatistics("camera1")
+    assert (stats["decimated"] == 6)
+    assert (stats["analyzed"] + stats["dropped"] == 4)
+
+    frames = [["camera1", pool.getFrame(i, 64, 64, "camera1")] for i in range(10)]
+    spot_counter = findSpots.SpotCounter(max_threads = 1, max_size = 64*64, policy = "all")
+    results = analyzeFrames(spot_counter, frames)
+    assert ([x.getFrameNumber() for x in results] == list(range(10)))
+    assert (spot_counter.getStatistics("camera1")["dropped"] == 0)
+
+
+def test_spot_counter_3():
+
+    # The cameras take turns.
+    pool = framePool.FramePool(max_frames = 20)
+    frames = []
+    for i in range(10):
+        frames.append(["camera1", pool.getFrame(i, 64, 64, "camera1")])
+    for i in range(3):
+        frames.append(["camera2", pool.getFrame(i, 64, 64, "camera2")])
+
+    spot_counter = findSpots.SpotCounter(max_threads = 1, max_size = 64*64, policy = "all")
+    results = analyzeFrames(spot_counter, frames)
+    assert (len(results) == 13)
+
+    # Once camera2 has frames they alternate with camera1.
+    names = [x.getCameraName() for x in results]
+    i = names.index("camera2")
+    assert (names[i:i+6] == ["camera2", "camera1"] * 3)
+
+
+def spotsFrame(pool, frame_number, spacing, offset):
+    """
+    Return a 512 x 512 frame with a grid of spots.
+    """
+    frame = pool.getFrame(frame_number, 512, 512, "camera1")
+    image = numpy.zeros((512, 512)) + 100
+    for i in range(3):
+        for j in range(3):
+            image[offset+i-1::spacing, offset+j-1::spacing] += 500 if ((i == 1) and (j == 1)) else 200
+    frame.np_data[:] = image.astype(numpy.uint16).ravel()
+    return frame
+
+
+def test_lmm_object_finder_1():
+
+    # Batches give the same results as single frames, and the buffer grows
+    # when a frame has more than max_locs objects.
+    lmmObjectFinder.initialize()
+    pool = framePool.FramePool(max_frames = 3)
+    frames = [spotsFrame(pool, 0, 32, 16),
+              spotsFrame(pool, 1, 12, 8),
+              spotsFrame(pool, 2, 64, 20)]
+
+    buffer = lmmObjectFinder.LocsBuffer(max_locs = 100)
+    counts = lmmObjectFinder.findObjectsBatch(frames, 100, buffer)
+    assert (counts[0] == 16*16)
+    assert (counts[1] > 1000)
+    assert (counts[2] == 8*8)
+    assert (buffer.max_locs > counts[1])
+
+    for i, frame in enumerate(frames):
+        [x, y, n] = lmmObjectFinder.findObjects(frame, 100)
+        assert (n == counts[i])
+        [bx, by] = buffer.getLocalizations(i)
+        assert numpy.allclose(x[:n], bx)
+        assert numpy.allclose(y[:n], by)
+
+    # The buffer is re-used.
+    old_x = buffer.x
+    lmmObjectFinder.findObjectsBatch(frames[:1], 100, buffer)
+    assert (buffer.x is old_x)
+    
+    for frame in frames:
+        frame.release()
+    lmmObjectFinder.cleanUp()
+
+
+def test_lmm_object_finder_2():
+
+    # Tiles find the same objects as the whole frame.
+    lmmObjectFinder.initialize()
+    pool = framePool.FramePool(max_frames = 1)
+    frame = spotsFrame(pool, 0, 12, 8)
+
+    [x, y, n] = lmmObjectFinder.findObjects(frame, 100)
+    buffer = lmmObjectFinder.LocsBuffer(max_locs = 50)
+    for n_tiles in [1, 3, 7, 64]:
+        [tx, ty, tn] = lmmObjectFinder.findObjectsTiled(frame, 100, buffer, n_tiles)
+        assert (tn == n)
+        assert numpy.allclose(x[:n], tx)
+        assert numpy.allclose(y[:n], ty)
+
+    frame.release()
+    lmmObjectFinder.cleanUp()
+
+
+def test_spot_counter_4():
+
+    # Frames are analyzed in batches.
+    pool = framePool.FramePool(max_frames = 10)
+    frames = [["camera1", spotsFrame(pool, i, 32, 16)] for i in range(10)]
+
+    spot_counter = findSpots.SpotCounter(batch_size = 4, max_threads = 1, max_size = 512*512, policy = "all")
+    results = analyzeFrames(spot_counter, frames)
+    assert ([x.getFrameNumber() for x in results] == list(range(10)))
+    assert all([(x.getCounts() == 16*16) for x in results])
+    assert (results[0].getLocalizations()[0].size == 16*16)
+    assert (pool.getNumberFree() == 10)
+
+    # Frames larger than max_size are analyzed in tiles.
+    frames = [["camera1", spotsFrame(pool, i, 32, 16)] for i in range(3)]
+    spot_counter = findSpots.SpotCounter(batch_size = 4, max_threads = 1, max_size = 100*512, policy = "all")
+    results = analyzeFrames(spot_counter, frames)
+    assert all([(x.getCounts() == 16*16) for x in results])
+
+
+def test_spot_counter_5():
+
+    # The frames are released and cleanUp() does not hang if the analysis fails.
+    def findObjectsBatch(frames, threshold, locs_buffer):
+        raise Exception("analysis failed")
+
+    find_objects_batch = lmmObjectFinder.findObjectsBatch
+    lmmObjectFinder.findObjectsBatch = findObjectsBatch
+    try:
+        pool = framePool.FramePool(max_frames = 10)
+        frames = [["camera1", pool.getFrame(i, 64, 64, "camera1")] for i in range(5)]
+
+        spot_counter = findSpots.SpotCounter(max_threads = 1, max_size = 64*64, policy = "all")
+        results = analyzeFrames(spot_counter, frames)
+        assert (len(results) == 5)
+        assert all([(x.getCounts() == 0) for x in results])
+        assert (pool.getNumberFree() == 10)
+    finally:
+        lmmObjectFinder.findObjectsBatch = find_objects_batch
+
+
+def test_spot_counter_6():
+
+    # A batch only has frames with the same threshold.
+    batches = []
+    def findObjectsBatch(frames, threshold, locs_buffer):
+        batches.append([len(frames), threshold])
+        return find_objects_batch(frames, threshold, locs_buffer)
+
+    find_objects_batch = lmmObjectFinder.findObjectsBatch
+    lmmObjectFinder.findObjectsBatch = findObjectsBatch
+    try:
+        pool = framePool.FramePool(max_frames = 10)
+        frames = [["camera1", pool.getFrame(i, 64, 64, "camera1")] for i in range(6)]
+
+        spot_counter = findSpots.SpotCounter(batch_size = 4, max_threads = 1, max_size = 64*64, policy = "all")
+        results = analyzeFrames(spot_counter, frames, [100, 100, 100, 200, 200, 100])
+        assert ([x.getFrameNumber() for x in results] == list(range(6)))
+        assert (batches == [[1, 100], [2, 100], [2, 200], [1, 100]])
+        assert (pool.getNumberFree() == 10)
+    finally:
+        lmmObjectFinder.findObjectsBatch = find_objects_batch
+
+
+class CameraFunctionality(object):
+    """
+    Just the camera parameters that SpotPicture uses.
+    """
+    def __init__(self, **kwds):
+        self.parameters = {"flip_horizontal" : False,
+                           "flip_vertical" : False,
+                           "transpose" : False,
+                           "x_pixels" : 64,
+                           "y_pixels" : 32}
+        self.parameters.update(kwds)
+
+    def getParameter(self, name):
+        return self.parameters[name]
+
+
+def test_spot_picture_1():
+
+    # Localizations are accumulated per color.
+    shutters_info = xmlParser.ShuttersInfo(color_data = [[255, 0, 0], None, [0, 255, 0]],
+                                           frames = 3)
+    picture = displaySpots.SpotPicture(camera_fn = CameraFunctionality(),
+                                       pixel_size = 0.1,
+                                       scale_bar_len = 1000,
+                                       shutters_info = shutters_info,
+                                       zoom = 2.0)
+    assert (picture.width() == 128)
+    assert (picture.height() == 64)
+
+    locs = [numpy.array([1.0, 1.0, 10.0, -5.0, 100.0]), numpy.array([2.0, 2.0, 3.0, 1.0, 1.0])]
+    for i in range(6):
+        picture.updateImage(i, locs)
+
+    [colors, counts] = picture.getCounts()
+    assert (colors == [(255, 0, 0), (0, 255, 0)])
+    assert (counts.shape == (2, 64, 128))
+    assert (numpy.sum(counts) == 12)
+    assert (counts[0, 4, 2] == 4)
+    assert (counts[1, 6, 20] == 2)
+
+    # The pixmap is only updated by the timer (or when saving).
+    assert picture.changed
+    picture.handleUpdateTimer()
+    assert not picture.changed
+    # Pixels with more than the average number of localizations saturate.
+    assert (picture.q_image.pixelColor(2, 4).red() == 255)
+    assert (picture.q_image.pixelColor(2, 4).green() == 255)
+    assert (picture.q_image.pixelColor(20, 6).green() == 170)
+    assert (picture.q_image.pixelColor(20, 6).blue() == 0)
+
+    picture.clearPicture()
+    assert (numpy.sum(picture.getCounts()[1]) == 0)
+
+
+def test_spot_picture_2():
+
+    # The picture is oriented like the camera display, and the counts
+    # are saved as 16 bit images.
+    shutters_info = xmlParser.ShuttersInfo(color_data = [[255, 255, 255]], frames = 1)
+    picture = displaySpots.SpotPicture(camera_fn = CameraFunctionality(flip_horizontal = True,
+                                                                       transpose = True),
+                                       pixel_size = 0.1,
+                                       scale_bar_len = 1000,
+                                       shutters_info = shutters_info,
+                                       zoom = 1.0)
+    picture.updateImage(0, [numpy.array([1.0]), numpy.array([2.0])])
+    [colors, counts] = picture.getCounts()
+    assert (counts.shape == (1, 64, 32))
+    assert (counts[0, 62, 2] == 1)
+
+    filename = os.path.join(test.dataDirectory(), "test_spot_picture")
+    picture.savePicture(filename)
+    with tifffile.TiffFile(filename + ".tif") as tf:
+        image = tf.asarray()
+    assert (image.dtype == numpy.uint16)
+    assert (image.shape == (64, 32))
+    assert (image[62, 2] == 1)
+    os.remove(filename + ".png")
+    os.remove(filename + ".tif")
+
+
+def test_spot_picture_3():
+
+    # Updating just the pixels with new localizations gives the same
+    # picture as re-coloring all of them.
+    shutters_info = xmlParser.ShuttersInfo(color_data = [[255, 0, 0], [0, 0, 255]], frames = 2)
+    picture = displaySpots.SpotPicture(camera_fn = CameraFunctionality(flip_vertical = True,
+                                                                       transpose = True),
+                                       pixel_size = 0.1,
+                                       scale_bar_len = 1000,
+                                       shutters_info = shutters_info,
+                                       zoom = 1.0)
+
+    # Each pixel has at most one localization of each color, so the color
+    # scale does not change.
+    pixels = numpy.random.permutation(64 * 32)
+    for i in range(10):
+        index = pixels[i*20:(i+1)*20]
+        picture.updateImage(i, [(index % 64).astype(numpy.float64), (index // 64).astype(numpy.float64)])
+        picture.handleUpdateTimer()
+    rgb = picture.rgb.copy()
+    assert (numpy.count_nonzero(rgb) > 0)
+
+    picture.saturations = {}
+    picture.updatePixmap()
+    assert numpy.array_equal(rgb, picture.rgb)
+
+    # The picture is oriented like the counts.
+    [colors, counts] = picture.getCounts()
+    assert numpy.array_equal(rgb[:,:,0] > 0, counts[colors.index((255, 0, 0))] > 0)
+    assert numpy.array_equal(rgb[:,:,2] > 0, counts[colors.index((0, 0, 255))] > 0)
+
+
+if (__name__ == "__main__"):
+    test_spot_counter_1()
+    test_spot_counter_2()
+    test_spot_counter_3()
+    test_lmm_object_finder_1()
+    test_lmm_object_finder_2()
+    test_spot_counter_4()
+    test_spot_counter_5()
+    test_spot_picture_1()
+    test_spot_picture_2()
+    test_spot_picture_3()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Tests of the emulated cameras.
+"""
+import numpy
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+import storm_control.hal4000.camera.syntheticCameraControl as syntheticCameraControl
+
+
+def test_none_camera_1():
+
+    # Check the test pattern.
+    config = params.StormXMLObject()
+    camera = noneCameraControl.NoneCameraControl(camera_name = "camera1", config = config)
+
+    p = camera.getParameters().copy()
+    p.setv("x_end", 200)
+    p.setv("y_end", 150)
+    camera.newParameters(p)
+
+    fake_frame = camera.fake_frame.reshape(150, 200)
+    for [i, j] in [[0, 0], [5, 7], [130, 20], [199, 149]]:
+        assert (fake_frame[j, i] == (i % 128 + j % 128))
+
+
+def test_synthetic_camera_1():
+
+    # All of the fluorophores are on and there is no noise.
+    config = params.StormXMLObject()
+    config.add(params.ParameterInt(name = "seed", value = 1))
+    config.add(params.ParameterFloat(name = "blink_on", value = 1.0))
+    config.add(params.ParameterFloat(name = "blink_off", value = 0.0))
+    config.add(params.ParameterSetBoolean(name = "noise", value = False))
+    camera = syntheticCameraControl.SyntheticCameraControl(camera_name = "camera1", config = config)
+
+    p = camera.getParameters().copy()
+    p.setv("x_end", 128)
+    p.setv("y_end", 64)
+    p.setv("spot_density", 100.0)
+    p.setv("spot_sigma", 1.0)
+    camera.newParameters(p)
+
+    n_emitters = camera.emitters["x"].size
+    assert (n_emitters == 82)
+
+    image = camera.renderFrame().reshape(64, 128).astype(numpy.float64)
+    assert numpy.all(camera.emitters["on"])
+    assert (numpy.min(image) == 20)
+
+    # Some of the light from fluorophores near the edges is lost.
+    photons = numpy.sum(image - 20.0)
+    assert (photons > 0.8 * n_emitters * 2000.0)
+    assert (photons < 1.01 * n_emitters * 2000.0)
+
+
+def test_synthetic_camera_2():
+
+    # Cached frames.
+    config = params.StormXMLObject()
+    config.add(params.ParameterInt(name = "frame_cache", value = 5))
+    camera = syntheticCameraControl.SyntheticCameraControl(camera_name = "camera1", config = config)
+
+    p = camera.getParameters().copy()
+    p.setv("x_end", 64)
+    p.setv("y_end", 32)
+    camera.newParameters(p)
+
+    assert (len(camera.frame_cache) == 5)
+    assert (camera.frame_cache[0].size == 64 * 32)
+    assert (camera.getParameters().get("exposure_time") >= 0.0001)
+
+
+if (__name__ == "__main__"):
+    test_none_camera_1()
+    test_synthetic_camera_1()
+    test_synthetic_camera_2()